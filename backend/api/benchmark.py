@@ -0,0 +1,480 @@
+import base64
+import io
+import math
+import os
+import random
+import threading
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs, urlsplit
+
+import requests
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.utils.functional import cached_property
+from PIL import Image
+
+from api.exports import EXPORTERS, get_shopping_list
+from recipes.importers import RecipeImporter
+from recipes.models import Ingredient, ShoppingListItem, Tag
+from users.models import User
+
+# Ожидаемые коды ответа сценария; остальные считаются ошибками.
+OK = (200, 201, 204)
+TOGGLE = (201, 204, 400, 404)
+
+PAGE_SIZE = 6
+# Глубокая страница для сравнения постраничного и курсорного режимов.
+DEEP_PAGE = 1000
+# Размер фото в сценарии recipe_create_large, байт.
+LARGE_IMAGE_SIZE = 8 * 1024 * 1024
+
+
+def percentile(values, percent):
+    """Процентиль по ближайшему рангу."""
+    if not values:
+        return 0
+    values = sorted(values)
+    rank = max(int(round(percent / 100 * len(values) + 0.5)) - 1, 0)
+    return values[min(rank, len(values) - 1)]
+
+
+def small_image():
+    buffer = io.BytesIO()
+    Image.new('RGB', (64, 48), '#E26C2D').save(buffer, 'PNG')
+    return (
+        'data:image/png;base64,'
+        + base64.b64encode(buffer.getvalue()).decode()
+    )
+
+
+def large_image(size):
+    """PNG из шума размером около size байт: шум почти не сжимается."""
+    side = int(math.sqrt(size / 3))
+    buffer = io.BytesIO()
+    Image.frombytes('RGB', (side, side), os.urandom(side * side * 3)).save(
+        buffer, 'PNG', compress_level=1
+    )
+    return buffer.getvalue()
+
+
+class Context:
+    """Данные стенда, которые сценарии берут из API перед запуском."""
+
+    def __init__(self, base_url, email, password, seed):
+        self.base_url = base_url.rstrip('/')
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.token = requests.post(
+            f'{self.base_url}/api/auth/token/login/',
+            json={'email': email, 'password': password},
+        ).json().get('auth_token')
+        if not self.token:
+            raise ValueError(f'Не удалось войти как {email}')
+        self.auth = {'Authorization': f'Token {self.token}'}
+        session = requests.Session()
+        tags = session.get(f'{self.base_url}/api/tags/').json()
+        self.tags = [tag['slug'] for tag in tags]
+        self.tag_ids = [tag['id'] for tag in tags]
+        ingredients = session.get(
+            f'{self.base_url}/api/ingredients/'
+        ).json()[:100]
+        self.ingredients = [ingredient['id'] for ingredient in ingredients]
+        self.prefixes = sorted({
+            ingredient['name'][:length].lower()
+            for ingredient in ingredients for length in (1, 3)
+        })
+        page = session.get(
+            f'{self.base_url}/api/recipes/', params={'limit': 100}
+        ).json()
+        recipes = page['results']
+        self.recipes = [recipe['id'] for recipe in recipes]
+        self.authors = sorted({recipe['author']['id'] for recipe in recipes})
+        self.image = small_image()
+        self.deep_page = max(
+            min(DEEP_PAGE, math.ceil(page['count'] / PAGE_SIZE)), 1
+        )
+        self.deep_cursor = self.find_cursor(
+            session, (self.deep_page - 1) * PAGE_SIZE
+        )
+
+    @cached_property
+    def large_image(self):
+        return (
+            'data:image/png;base64,'
+            + base64.b64encode(large_image(LARGE_IMAGE_SIZE)).decode()
+        )
+
+    def find_cursor(self, session, offset):
+        """Курсор страницы, которой предшествует offset рецептов.
+
+        Курсор можно получить только из ссылки next, поэтому рецепты до
+        него пролистываются страницами по 1000.
+        """
+        cursor = None
+        while offset > 0:
+            limit = min(offset, 1000)
+            page = session.get(
+                f'{self.base_url}/api/recipes/',
+                params={
+                    'pagination': 'cursor', 'limit': limit, 'cursor': cursor,
+                },
+            ).json()
+            if not page['next']:
+                break
+            cursor = parse_qs(urlsplit(page['next']).query)['cursor'][0]
+            offset -= limit
+        return cursor
+
+    def choice(self, items):
+        with self.lock:
+            return self.rng.choice(items)
+
+    def sample(self, items, count):
+        with self.lock:
+            return self.rng.sample(items, min(count, len(items)))
+
+
+def tag_list(session, context):
+    return session.get(f'{context.base_url}/api/tags/'), OK
+
+
+def ingredient_list(session, context):
+    return session.get(f'{context.base_url}/api/ingredients/'), OK
+
+
+def ingredient_search(session, context):
+    """Поиск по началу названия из 1 и 3 букв."""
+    return session.get(
+        f'{context.base_url}/api/ingredients/',
+        params={'name': context.choice(context.prefixes)},
+    ), OK
+
+
+def recipe_list(session, context):
+    return session.get(
+        f'{context.base_url}/api/recipes/',
+        params={'page': context.choice(range(1, 11)), 'limit': 6},
+    ), OK
+
+
+def recipe_list_first_page(session, context):
+    return session.get(
+        f'{context.base_url}/api/recipes/',
+        params={'page': 1, 'limit': PAGE_SIZE},
+    ), OK
+
+
+def recipe_list_deep_page(session, context):
+    """Страница DEEP_PAGE или последняя: COUNT(*) и OFFSET."""
+    return session.get(
+        f'{context.base_url}/api/recipes/',
+        params={'page': context.deep_page, 'limit': PAGE_SIZE},
+    ), OK
+
+
+def recipe_list_cursor(session, context):
+    return session.get(
+        f'{context.base_url}/api/recipes/',
+        params={'pagination': 'cursor', 'limit': PAGE_SIZE},
+    ), OK
+
+
+def recipe_list_deep_cursor(session, context):
+    """Та же глубина, что у recipe_list_deep_page, в курсорном режиме."""
+    return session.get(
+        f'{context.base_url}/api/recipes/',
+        params={
+            'pagination': 'cursor',
+            'cursor': context.deep_cursor,
+            'limit': PAGE_SIZE,
+        },
+    ), OK
+
+
+def recipe_list_filtered(session, context):
+    return session.get(
+        f'{context.base_url}/api/recipes/',
+        params={
+            'tags': context.choice(context.tags),
+            'author': context.choice(context.authors),
+            'limit': 6,
+        },
+    ), OK
+
+
+def recipe_list_authenticated(session, context):
+    return session.get(
+        f'{context.base_url}/api/recipes/',
+        params={'page': context.choice(range(1, 11)), 'limit': 6},
+        headers=context.auth,
+    ), OK
+
+
+def recipe_search(session, context):
+    return session.get(
+        f'{context.base_url}/api/recipes/',
+        params={'search': context.choice(('борщ', 'пирог', 'салат'))},
+    ), OK
+
+
+def recipe_detail(session, context):
+    return session.get(
+        f'{context.base_url}/api/recipes/{context.choice(context.recipes)}/'
+    ), OK
+
+
+def subscriptions(session, context):
+    return session.get(
+        f'{context.base_url}/api/users/subscriptions/',
+        params={'recipes_limit': 3},
+        headers=context.auth,
+    ), OK
+
+
+def feed(session, context):
+    return session.get(
+        f'{context.base_url}/api/users/feed/', headers=context.auth
+    ), OK
+
+
+def download_shopping_cart(session, context):
+    return session.get(
+        f'{context.base_url}/api/recipes/download_shopping_cart/',
+        headers=context.auth,
+    ), OK
+
+
+def recipe_create(session, context, image=None):
+    return session.post(
+        f'{context.base_url}/api/recipes/',
+        json={
+            'name': 'Нагрузочный рецепт',
+            'text': 'Создан сценарием recipe_create',
+            'cooking_time': 10,
+            'image': image or context.image,
+            'tags': context.sample(context.tag_ids, 1),
+            'ingredients': [
+                {'id': ingredient_id, 'amount': 10}
+                for ingredient_id in context.sample(context.ingredients, 5)
+            ],
+        },
+        headers=context.auth,
+    ), (201,)
+
+
+def recipe_create_large(session, context):
+    """Создание рецепта с фото около 8 МБ: сравнить с recipe_create."""
+    return recipe_create(session, context, context.large_image)
+
+
+def favorite_toggle(session, context):
+    """Одиночное добавление и удаление из избранного."""
+    url = (
+        f'{context.base_url}/api/recipes/'
+        f'{context.choice(context.recipes)}/favorite/'
+    )
+    session.post(url, headers=context.auth)
+    return session.delete(url, headers=context.auth), TOGGLE
+
+
+def favorite_bulk_toggle(session, context):
+    """Пакетное добавление и удаление 20 рецептов."""
+    url = f'{context.base_url}/api/recipes/bulk_favorite/'
+    body = {'recipes': context.sample(context.recipes, 20)}
+    session.post(url, json=body, headers=context.auth)
+    return session.delete(url, json=body, headers=context.auth), OK
+
+
+def favorite_race(session, context):
+    """Одновременные добавления одного рецепта: ответ 500 - ошибка."""
+    return session.post(
+        f'{context.base_url}/api/recipes/{context.recipes[0]}/favorite/',
+        headers=context.auth,
+    ), TOGGLE
+
+
+SCENARIOS = {
+    scenario.__name__: scenario for scenario in (
+        tag_list, ingredient_list, ingredient_search, recipe_list,
+        recipe_list_first_page, recipe_list_deep_page, recipe_list_cursor,
+        recipe_list_deep_cursor, recipe_list_filtered,
+        recipe_list_authenticated, recipe_search, recipe_detail,
+        subscriptions, feed, download_shopping_cart, recipe_create,
+        recipe_create_large, favorite_toggle, favorite_bulk_toggle,
+        favorite_race,
+    )
+}
+
+
+def run_scenario(scenario, context, requests_count, concurrency):
+    """Запускает сценарий и возвращает сводку по времени и SQL."""
+    local = threading.local()
+    latencies, queries, errors = [], [], []
+
+    def call(_):
+        if not hasattr(local, 'session'):
+            local.session = requests.Session()
+        start = time.perf_counter()
+        try:
+            response, expected = scenario(local.session, context)
+            response.content
+        except requests.RequestException as error:
+            errors.append(str(error))
+            return
+        latencies.append(time.perf_counter() - start)
+        if 'X-DB-Query-Count' in response.headers:
+            queries.append(int(response.headers['X-DB-Query-Count']))
+        if response.status_code not in expected:
+            errors.append(response.status_code)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(call, range(requests_count)))
+    elapsed = time.perf_counter() - start
+    return {
+        'requests': requests_count,
+        'errors': len(errors),
+        'error_samples': [str(error) for error in errors[:5]],
+        'rps': requests_count / elapsed if elapsed else 0,
+        'p50': percentile(latencies, 50),
+        'p95': percentile(latencies, 95),
+        'p99': percentile(latencies, 99),
+        'queries': sum(queries) / len(queries) if queries else None,
+    }
+
+
+class LocalContext:
+    """Данные сценариев, которые выполняются в процессе команды.
+
+    Сценарии обращаются к базе напрямую, без сервера. run_benchmark
+    выполняет их в транзакции и откатывает её.
+    """
+
+    def __init__(self, email, seed, size):
+        self.rng = random.Random(seed)
+        self.size = size
+        self.user = User.objects.filter(email=email).first()
+        if self.user is None:
+            raise ValueError(f'Нет пользователя {email}')
+
+    @cached_property
+    def import_rows(self):
+        """size рецептов, ингредиенты заданы названием и единицей."""
+        emails = list(User.objects.order_by('id').values_list(
+            'email', flat=True
+        )[:100])
+        tags = list(Tag.objects.values_list('slug', flat=True))
+        ingredients = list(Ingredient.objects.order_by('id').values_list(
+            'name', 'measurement_unit'
+        )[:500])
+        return [
+            {
+                'author': self.rng.choice(emails),
+                'name': f'Импорт {number}',
+                'text': 'Создан сценарием recipe_import',
+                'cooking_time': 10,
+                'tags': self.rng.sample(tags, min(2, len(tags))),
+                'ingredients': [
+                    {'name': name, 'measurement_unit': unit, 'amount': 10}
+                    for name, unit in self.rng.sample(
+                        ingredients, min(6, len(ingredients))
+                    )
+                ],
+            }
+            for number in range(self.size)
+        ]
+
+    @cached_property
+    def cart_user(self):
+        """Пользователь со списком покупок из size ингредиентов."""
+        ingredients = Ingredient.objects.bulk_create(
+            Ingredient(name=f'Бенчмарк {number}', measurement_unit='г')
+            for number in range(self.size)
+        )
+        if not all(ingredient.pk for ingredient in ingredients):
+            ingredients = Ingredient.objects.filter(
+                name__startswith='Бенчмарк '
+            )
+        ShoppingListItem.objects.filter(user=self.user).delete()
+        ShoppingListItem.objects.bulk_create(
+            ShoppingListItem(
+                user=self.user, ingredient=ingredient,
+                amount=self.rng.randint(1, 5000),
+            )
+            for ingredient in ingredients
+        )
+        return self.user
+
+
+def recipe_import(context):
+    """Загрузка size рецептов через RecipeImporter с откатом."""
+    RecipeImporter().run(context.import_rows, dry_run=True)
+    return len(context.import_rows)
+
+
+def export_shopping_cart(context, file_format):
+    """Выгрузка списка покупок из size строк, как её отдаёт ответ."""
+    exporter = EXPORTERS[file_format]
+    if not exporter.is_available():
+        raise ValueError(f'Выгрузка {file_format} недоступна')
+    response = exporter().response(get_shopping_list(context.cart_user))
+    for _ in response.streaming_content:
+        pass
+    return context.size
+
+
+def shopping_cart_txt(context):
+    return export_shopping_cart(context, 'txt')
+
+
+def shopping_cart_csv(context):
+    return export_shopping_cart(context, 'csv')
+
+
+def shopping_cart_pdf(context):
+    return export_shopping_cart(context, 'pdf')
+
+
+LOCAL_SCENARIOS = {
+    scenario.__name__: scenario for scenario in (
+        recipe_import, shopping_cart_txt, shopping_cart_csv,
+        shopping_cart_pdf,
+    )
+}
+
+
+def run_local_scenario(scenario, context, requests_count):
+    """Запускает сценарий в процессе: время, SQL и пик памяти Python.
+
+    Первый вызов прогревает кэши, второй выполняется под tracemalloc,
+    время меряется на остальных без него.
+    """
+    scenario(context)
+    tracemalloc.start()
+    try:
+        scenario(context)
+        memory = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    latencies, queries, rows = [], [], 0
+    for _ in range(requests_count):
+        with CaptureQueriesContext(connection) as captured:
+            start = time.perf_counter()
+            rows += scenario(context)
+            latencies.append(time.perf_counter() - start)
+        queries.append(len(captured))
+    elapsed = sum(latencies)
+    return {
+        'requests': requests_count,
+        'errors': 0,
+        'error_samples': [],
+        'rps': requests_count / elapsed if elapsed else 0,
+        'rows_per_second': rows / elapsed if elapsed else 0,
+        'p50': percentile(latencies, 50),
+        'p95': percentile(latencies, 95),
+        'p99': percentile(latencies, 99),
+        'queries': sum(queries) / len(queries) if queries else None,
+        'memory': memory,
+    }
@@ -0,0 +1,201 @@
+import hashlib
+import json
+import uuid
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.http import parse_etags
+from rest_framework import status
+from rest_framework.response import Response
+
+from recipes.user_state import get_user_state
+
+
+class DjangoCacheBackend:
+    """Кэш через фреймворк кэширования Django.
+
+    LocMemCache у каждого процесса свой, такой кэш общим не считается:
+    версия, сменённая в одном воркере, не дойдёт до остальных.
+    """
+
+    def __init__(self, timeout, alias='default'):
+        self.timeout = timeout
+        self.cache = caches[alias]
+        self.shared = not isinstance(self.cache, (LocMemCache, DummyCache))
+
+    def get(self, key):
+        return self.cache.get(key)
+
+    def set(self, key, value, timeout=-1):
+        if timeout == -1:
+            timeout = self.timeout
+        self.cache.set(key, value, timeout)
+
+    def clear(self):
+        self.cache.clear()
+
+
+class ApiCache:
+    """Версионированный кэш ответов API.
+
+    Ключи каждого пространства имён содержат его текущую версию,
+    поэтому для инвалидации достаточно сменить версию.
+    """
+
+    def __init__(self):
+        self._backend = None
+
+    @property
+    def backend(self):
+        if self._backend is None:
+            config = settings.API_CACHE
+            self._backend = DjangoCacheBackend(
+                config['TIMEOUT'], config['ALIAS']
+            )
+        return self._backend
+
+    def get_version(self, namespace):
+        key = f'api:{namespace}:version'
+        version = self.backend.get(key)
+        if version is None:
+            version = uuid.uuid4().hex
+            self.backend.set(key, version, timeout=None)
+        return version
+
+    def bump_version(self, namespace):
+        self.backend.set(
+            f'api:{namespace}:version', uuid.uuid4().hex, timeout=None
+        )
+
+    def make_key(self, namespace, key=''):
+        return f'api:{namespace}:{self.get_version(namespace)}:{key}'
+
+    def get(self, namespace, key=''):
+        return self.backend.get(self.make_key(namespace, key))
+
+    def set(self, namespace, value, key=''):
+        self.backend.set(self.make_key(namespace, key), value)
+
+
+api_cache = ApiCache()
+
+
+def make_etag(content):
+    return f'"{hashlib.md5(content).hexdigest()}"'
+
+
+def render_entry(request, response, view):
+    """Готовый JSON ответа и его ETag для сохранения в кэше."""
+    content = request.accepted_renderer.render(
+        response.data,
+        request.accepted_media_type,
+        view.get_renderer_context(),
+    )
+    return make_etag(content), content
+
+
+def entry_response(request, entry):
+    etag, content = entry
+    if etag in parse_etags(request.META.get('HTTP_IF_NONE_MATCH', '')):
+        response = HttpResponseNotModified()
+    else:
+        response = HttpResponse(
+            content, content_type=request.accepted_renderer.media_type
+        )
+    response['ETag'] = etag
+    return response
+
+
+class CachedListMixin:
+    """Отдаёт готовый JSON списка из кэша и поддерживает If-None-Match.
+
+    Кэшируется только список без параметров запроса и только в общем для
+    воркеров кэше.
+    """
+
+    cache_namespace = None
+
+    def list(self, request, *args, **kwargs):
+        if (not settings.API_CACHE['ENABLED']
+                or not api_cache.backend.shared
+                or request.query_params
+                or request.accepted_renderer.format != 'json'):
+            return super().list(request, *args, **kwargs)
+        key = api_cache.make_key(self.cache_namespace)
+        entry = api_cache.backend.get(key)
+        if entry is None:
+            response = super().list(request, *args, **kwargs)
+            entry = render_entry(request, response, self)
+            api_cache.backend.set(key, entry)
+        return entry_response(request, entry)
+
+
+class CachedRecipesMixin:
+    """Кэш списка и страниц рецептов, общий для всех пользователей.
+
+    В кэш попадает ответ для анонимного пользователя, ключ строится по
+    параметрам из cached_query_params. Авторизованному пользователю
+    отдаётся тот же ответ с его флагами избранного, корзины и подписки.
+    """
+
+    cache_namespace = 'recipes'
+    cached_query_params = ('author', 'limit', 'page', 'search', 'tags')
+
+    def get_cache_key(self, request, name):
+        if (not settings.API_CACHE['ENABLED']
+                or not api_cache.backend.shared
+                or request.accepted_renderer.format != 'json'
+                or not set(request.query_params)
+                <= set(self.cached_query_params)):
+            return None
+        params = sorted(
+            (key, sorted(request.query_params.getlist(key)))
+            for key in request.query_params
+        )
+        key = json.dumps([request.build_absolute_uri('/'), name, params])
+        return api_cache.make_key(
+            self.cache_namespace, hashlib.md5(key.encode()).hexdigest()
+        )
+
+    def cached_response(self, request, name, method, *args, **kwargs):
+        key = self.get_cache_key(request, name)
+        if key is None:
+            return method(request, *args, **kwargs)
+        entry = api_cache.backend.get(key)
+        if entry is None:
+            response = method(request, *args, **kwargs)
+            if (request.user.is_authenticated
+                    or response.status_code != status.HTTP_200_OK):
+                return response
+            entry = render_entry(request, response, self)
+            api_cache.backend.set(key, entry)
+        if request.user.is_authenticated:
+            return Response(
+                self.set_user_flags(json.loads(entry[1]), request)
+            )
+        return entry_response(request, entry)
+
+    def set_user_flags(self, data, request):
+        state = get_user_state(request)
+        recipes = data['results'] if 'results' in data else [data]
+        for recipe in recipes:
+            recipe['is_favorited'] = recipe['id'] in state.favorites
+            recipe['is_in_shopping_cart'] = recipe['id'] in state.cart
+            recipe['author']['is_subscribed'] = (
+                recipe['author']['id'] in state.followed
+            )
+        return data
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(
+            request, 'list', super().list, *args, **kwargs
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(
+            request, f'detail:{kwargs.get(self.lookup_field)}',
+            super().retrieve, *args, **kwargs
+        )
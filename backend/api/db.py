@@ -0,0 +1,66 @@
+import random
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import connections
+
+current_replica = ContextVar('current_replica', default=None)
+
+
+def close_unusable_connections():
+    """Закрывает нерабочие постоянные соединения перед запросом.
+
+    Проверяются только базы с CONN_HEALTH_CHECKS; Django откроет
+    соединение заново при первом обращении.
+    """
+    for connection in connections.all():
+        if (connection.settings_dict.get('CONN_HEALTH_CHECKS')
+                and connection.connection is not None
+                and not connection.is_usable()):
+            connection.close()
+
+
+class ReplicaRouter:
+    """Чтение внутри ReplicaReadMixin идёт в реплику из DATABASE_REPLICAS.
+
+    Запись и чтение вне таких представлений остаются в default. Кэш в
+    базе читается из default: версия, сменённая после записи, должна
+    быть видна сразу.
+    """
+
+    def db_for_read(self, model, **hints):
+        if model._meta.app_label == 'django_cache':
+            return None
+        return current_replica.get()
+
+    def db_for_write(self, model, **hints):
+        return None
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db not in settings.DATABASE_REPLICAS
+
+
+class ReplicaReadMixin:
+    """GET-запросы вьюсета читают из реплики.
+
+    Реплика выбирается одна на запрос после аутентификации и проверки
+    прав, поэтому токен только что вошедшего пользователя ищется в
+    основной базе.
+    """
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        if request.method == 'GET' and settings.DATABASE_REPLICAS:
+            self.replica_token = current_replica.set(
+                random.choice(settings.DATABASE_REPLICAS)
+            )
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        token = getattr(self, 'replica_token', None)
+        if token is not None:
+            current_replica.reset(token)
+            self.replica_token = None
+        return super().finalize_response(request, response, *args, **kwargs)
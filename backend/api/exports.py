@@ -0,0 +1,151 @@
+import csv
+import io
+import os
+
+from django.conf import settings
+from django.http import StreamingHttpResponse
+
+from recipes.models import ShoppingListItem
+
+try:
+    from reportlab.lib.pagesizes import A4
+    from reportlab.pdfbase import pdfmetrics
+    from reportlab.pdfbase.ttfonts import TTFont
+    from reportlab.pdfgen import canvas
+except ImportError:
+    canvas = None
+
+CHUNK_SIZE = 2000
+PDF_FONT_NAME = 'ShoppingListFont'
+
+
+def get_shopping_list(user):
+    """Сохранённый список покупок пользователя."""
+    return ShoppingListItem.objects.filter(user=user).values(
+        'ingredient__name',
+        'ingredient__measurement_unit',
+        'amount',
+    ).order_by('ingredient__name')
+
+
+class BaseExporter:
+    """Базовый класс выгрузки списка покупок."""
+
+    content_type = None
+    extension = None
+
+    @classmethod
+    def is_available(cls):
+        return True
+
+    def render(self, ingredients):
+        raise NotImplementedError
+
+    def response(self, ingredients):
+        response = StreamingHttpResponse(
+            self.render(ingredients.iterator(chunk_size=CHUNK_SIZE)),
+            content_type=self.content_type,
+        )
+        filename = f'shopping_cart.{self.extension}'
+        response['Content-Disposition'] = f'attachment; filename={filename}'
+        return response
+
+
+class TextExporter(BaseExporter):
+    """Выгрузка в текстовом формате."""
+
+    content_type = 'text/plain; charset=utf-8'
+    extension = 'txt'
+
+    def render(self, ingredients):
+        yield 'Список покупок:\n\n'
+        separator = ''
+        for ingredient in ingredients:
+            yield (
+                f'{separator}{ingredient["ingredient__name"]} - '
+                f'{ingredient["amount"]} '
+                f'{ingredient["ingredient__measurement_unit"]}'
+            )
+            separator = '\n'
+
+
+class CsvExporter(BaseExporter):
+    """Выгрузка в формате CSV."""
+
+    content_type = 'text/csv; charset=utf-8'
+    extension = 'csv'
+
+    def render(self, ingredients):
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+
+        def flush():
+            value = buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate(0)
+            return value
+
+        writer.writerow(('Ингредиент', 'Количество', 'Единица измерения'))
+        yield flush()
+        for ingredient in ingredients:
+            writer.writerow((
+                ingredient['ingredient__name'],
+                ingredient['amount'],
+                ingredient['ingredient__measurement_unit'],
+            ))
+            yield flush()
+
+
+class PdfExporter(BaseExporter):
+    """Выгрузка в формате PDF, требует reportlab и шрифт с кириллицей."""
+
+    content_type = 'application/pdf'
+    extension = 'pdf'
+    font_size = 12
+    margin = 50
+
+    @classmethod
+    def is_available(cls):
+        return (
+            canvas is not None
+            and os.path.exists(settings.SHOPPING_LIST_PDF_FONT)
+        )
+
+    def register_font(self):
+        if PDF_FONT_NAME not in pdfmetrics.getRegisteredFontNames():
+            pdfmetrics.registerFont(
+                TTFont(PDF_FONT_NAME, settings.SHOPPING_LIST_PDF_FONT)
+            )
+
+    def render(self, ingredients):
+        self.register_font()
+        buffer = io.BytesIO()
+        document = canvas.Canvas(buffer, pagesize=A4)
+        width, height = A4
+        y = height - self.margin
+        document.setFont(PDF_FONT_NAME, self.font_size + 4)
+        document.drawString(self.margin, y, 'Список покупок:')
+        y -= self.font_size * 3
+        document.setFont(PDF_FONT_NAME, self.font_size)
+        for ingredient in ingredients:
+            if y < self.margin:
+                document.showPage()
+                document.setFont(PDF_FONT_NAME, self.font_size)
+                y = height - self.margin
+            document.drawString(
+                self.margin, y,
+                f'{ingredient["ingredient__name"]} - '
+                f'{ingredient["amount"]} '
+                f'{ingredient["ingredient__measurement_unit"]}'
+            )
+            y -= self.font_size * 1.5
+        document.save()
+        buffer.seek(0)
+        yield from iter(lambda: buffer.read(64 * 1024), b'')
+
+
+EXPORTERS = {
+    'txt': TextExporter,
+    'csv': CsvExporter,
+    'pdf': PdfExporter,
+}
@@ -0,0 +1,173 @@
+from collections import defaultdict
+
+from django.conf import settings
+from django.db.models import Exists, OuterRef, Value
+from rest_framework.generics import get_object_or_404
+from rest_framework.response import Response
+
+from api.fields import file_url, thumbnail_urls
+from recipes.models import Follow, IngredientAmount, Recipe
+
+RECIPE_FIELDS = (
+    'id', 'pub_date', 'name', 'image', 'thumbnails', 'text', 'cooking_time',
+    'author_id', 'author__email', 'author__username', 'author__first_name',
+    'author__last_name', 'is_favorited', 'is_in_shopping_cart',
+    'author_is_subscribed',
+)
+RECIPE_INFO_FIELDS = ('id', 'name', 'image', 'thumbnails', 'cooking_time')
+FOLLOW_FIELDS = (
+    'id', 'email', 'username', 'first_name', 'last_name', 'recipes_count',
+)
+
+
+def recipe_values(queryset, user=None):
+    """Строки рецептов с автором и флагами пользователя.
+
+    queryset должен содержать аннотации with_user_flags.
+    """
+    if user is not None and user.is_authenticated:
+        is_subscribed = Exists(Follow.objects.filter(
+            user=user, author=OuterRef('author')
+        ))
+    else:
+        is_subscribed = Value(False)
+    return queryset.prefetch_related(None).annotate(
+        author_is_subscribed=is_subscribed
+    ).values(*RECIPE_FIELDS)
+
+
+def recipe_tags(recipe_ids):
+    tags = defaultdict(list)
+    for recipe_id, *tag in Recipe.tags.through.objects.filter(
+        recipe_id__in=recipe_ids
+    ).order_by('tag__name').values_list(
+        'recipe_id', 'tag_id', 'tag__name', 'tag__color', 'tag__slug'
+    ):
+        tags[recipe_id].append(
+            dict(zip(('id', 'name', 'color', 'slug'), tag))
+        )
+    return tags
+
+
+def recipe_ingredients(recipe_ids):
+    ingredients = defaultdict(list)
+    for recipe_id, *ingredient in IngredientAmount.objects.filter(
+        recipe_id__in=recipe_ids
+    ).order_by('pk').values_list(
+        'recipe_id', 'ingredient_id', 'ingredient__name',
+        'ingredient__measurement_unit', 'amount',
+    ):
+        ingredients[recipe_id].append(dict(zip(
+            ('id', 'name', 'measurement_unit', 'amount'), ingredient
+        )))
+    return ingredients
+
+
+def serialize_recipes(rows, request=None):
+    """Рецепты в формате RecipeSerializer без его полей и сериализаторов.
+
+    JSON совпадает с RecipeSerializer до байта, проверка - тесты api и
+    команда check_fast_serializers. Теги и ингредиенты загружаются двумя
+    запросами на все строки.
+    """
+    rows = list(rows)
+    recipe_ids = [row['id'] for row in rows]
+    tags = recipe_tags(recipe_ids) if rows else {}
+    ingredients = recipe_ingredients(recipe_ids) if rows else {}
+    return [
+        {
+            'id': row['id'],
+            'tags': tags.get(row['id'], []),
+            'author': {
+                'email': row['author__email'],
+                'id': row['author_id'],
+                'username': row['author__username'],
+                'first_name': row['author__first_name'],
+                'last_name': row['author__last_name'],
+                'is_subscribed': row['author_is_subscribed'],
+            },
+            'ingredients': ingredients.get(row['id'], []),
+            'is_favorited': row['is_favorited'],
+            'is_in_shopping_cart': row['is_in_shopping_cart'],
+            'name': row['name'],
+            'image': file_url(row['image'], request),
+            'thumbnails': thumbnail_urls(row['thumbnails'], request),
+            'text': row['text'],
+            'cooking_time': row['cooking_time'],
+        }
+        for row in rows
+    ]
+
+
+def serialize_recipe_info(row, request=None):
+    """Рецепт в формате RecipeInfoSerializer."""
+    return {
+        'id': row['id'],
+        'name': row['name'],
+        'image': file_url(row['image'], request),
+        'thumbnails': thumbnail_urls(row['thumbnails'], request),
+        'cooking_time': row['cooking_time'],
+    }
+
+
+def serialize_follows(rows, recipes):
+    """Авторы из подписок в формате FollowSerializer.
+
+    recipes - queryset рецептов для превью, как в Prefetch подписок.
+    Ссылки на файлы в превью относительные, как у FollowSerializer.
+    """
+    rows = list(rows)
+    previews = defaultdict(list)
+    if rows:
+        for recipe in recipes.filter(
+            author_id__in=[row['id'] for row in rows]
+        ).values('author_id', *RECIPE_INFO_FIELDS):
+            previews[recipe['author_id']].append(
+                serialize_recipe_info(recipe)
+            )
+    return [
+        {
+            'email': row['email'],
+            'id': row['id'],
+            'username': row['username'],
+            'first_name': row['first_name'],
+            'last_name': row['last_name'],
+            'is_subscribed': True,
+            'recipes': previews[row['id']],
+            'recipes_count': row['recipes_count'],
+        }
+        for row in rows
+    ]
+
+
+class FastRecipesMixin:
+    """Список и страница рецепта через serialize_recipes.
+
+    Включается настройкой FAST_SERIALIZERS. Вьюсет должен отдавать в
+    get_queryset рецепты с аннотациями with_user_flags.
+    """
+
+    def list(self, request, *args, **kwargs):
+        if not settings.FAST_SERIALIZERS:
+            return super().list(request, *args, **kwargs)
+        queryset = recipe_values(
+            self.filter_queryset(self.get_queryset()), request.user
+        )
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(
+                serialize_recipes(page, request)
+            )
+        return Response(serialize_recipes(queryset, request))
+
+    def retrieve(self, request, *args, **kwargs):
+        if not settings.FAST_SERIALIZERS:
+            return super().retrieve(request, *args, **kwargs)
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        row = get_object_or_404(
+            recipe_values(
+                self.filter_queryset(self.get_queryset()), request.user
+            ),
+            **{self.lookup_field: self.kwargs[lookup_url_kwarg]},
+        )
+        return Response(serialize_recipes([row], request)[0])
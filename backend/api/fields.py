@@ -0,0 +1,138 @@
+import binascii
+import io
+import uuid
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import TemporaryUploadedFile, UploadedFile
+from PIL import Image
+from rest_framework import serializers
+
+from recipes.images import EXTENSIONS
+
+
+def file_url(name, request=None):
+    """Ссылка на файл, как её отдаёт ImageField, None - если файла нет."""
+    if not name:
+        return None
+    url = default_storage.url(name)
+    if request is not None:
+        url = request.build_absolute_uri(url)
+    return url
+
+
+def thumbnail_urls(thumbnails, request=None):
+    return {
+        width: {
+            image_format: file_url(name, request)
+            for image_format, name in files.items()
+        }
+        for width, files in thumbnails.items()
+    }
+
+
+class ThumbnailsField(serializers.ReadOnlyField):
+    """Ссылки на уменьшенные копии фото: {ширина: {формат: url}}."""
+
+    def to_representation(self, thumbnails):
+        return thumbnail_urls(thumbnails, self.context.get('request'))
+
+
+class StreamingImageField(serializers.ImageField):
+    """Изображение в base64 или файлом из multipart-запроса.
+
+    Строка base64 декодируется частями во временный файл на диске.
+    Размер проверяется по ходу декодирования, а размеры в пикселях - по
+    заголовку изображения, до того как декодирован весь файл.
+    """
+
+    default_error_messages = {
+        'invalid_base64': 'Некорректная строка base64.',
+        'too_large': 'Файл больше {max_size} байт.',
+        'too_many_pixels': 'Изображение больше {max_pixels} пикселей.',
+    }
+    chunk_size = 4 * 64 * 1024
+    header_size = 256 * 1024
+
+    def to_internal_value(self, data):
+        if isinstance(data, str):
+            data = self.decode(data)
+        elif isinstance(data, UploadedFile):
+            self.check_size(data.size)
+            self.check_pixels(data)
+        return super().to_internal_value(data)
+
+    def check_size(self, size):
+        max_size = settings.RECIPE_IMAGES['MAX_UPLOAD_SIZE']
+        if size > max_size:
+            self.fail('too_large', max_size=max_size)
+
+    def check_pixels(self, file):
+        max_pixels = settings.RECIPE_IMAGES['MAX_PIXELS']
+        try:
+            width, height = Image.open(file).size
+        except (OSError, SyntaxError):
+            return False
+        finally:
+            file.seek(0)
+        if width * height > max_pixels:
+            self.fail('too_many_pixels', max_pixels=max_pixels)
+        return True
+
+    def decode(self, data):
+        content_type = None
+        start = data.find(';base64,', 0, 100)
+        if start == -1:
+            start = 0
+        else:
+            content_type = data[:start].replace('data:', '')
+            start += len(';base64,')
+        file = TemporaryUploadedFile(
+            f'{uuid.uuid4()}', content_type, 0, None
+        )
+        try:
+            pixels_checked = self.write_base64(file, data, start)
+            file.size = file.tell()
+            file.seek(0)
+            if not pixels_checked:
+                self.check_pixels(file)
+            try:
+                image_format = Image.open(file).format or ''
+            except (OSError, SyntaxError):
+                image_format = ''
+        except BaseException:
+            file.close()
+            raise
+        file.seek(0)
+        extension = EXTENSIONS.get(image_format.lower(), 'jpg')
+        file.name = f'{file.name}.{extension}'
+        return file
+
+    def write_base64(self, file, data, start):
+        """Декодирует data с позиции start в file.
+
+        Строка не копируется целиком: срезы по chunk_size очищаются от
+        пробелов и декодируются по отдельности. True - если размеры в
+        пикселях уже проверены по началу файла.
+        """
+        header = b''
+        pixels_checked = False
+        rest = ''
+        for position in range(start, len(data), self.chunk_size):
+            text = rest + ''.join(
+                data[position:position + self.chunk_size].split()
+            )
+            end = len(text) - len(text) % 4
+            text, rest = text[:end], text[end:]
+            try:
+                chunk = binascii.a2b_base64(text)
+            except binascii.Error:
+                self.fail('invalid_base64')
+            file.write(chunk)
+            self.check_size(file.tell())
+            if not pixels_checked and len(header) < self.header_size:
+                header += chunk
+                pixels_checked = self.check_pixels(io.BytesIO(header))
+        if rest:
+            self.fail('invalid_base64')
+        return pixels_checked
@@ -1,6 +1,11 @@
+from django.db.models import Case, IntegerField, When
 from django_filters.rest_framework import FilterSet, filters
+from rest_framework.filters import BaseFilterBackend
 
+from api.cache import api_cache
+from api.ingredient_index import ingredient_index
 from recipes.models import Ingredient, Recipe, Tag
+from recipes.search import search_recipes
 from users.models import User
 
 
@@ -13,6 +18,43 @@ class IngredientFilter(FilterSet):
         fields = ('name',)
 
 
+class IngredientSearchFilter(BaseFilterBackend):
+    """Поиск ингредиентов по индексу в памяти.
+
+    Совпадения по началу названия идут раньше совпадений по вхождению.
+    Для автодополнения отдаются первые max_results ингредиентов, иначе
+    на одну букву пришлось бы сортировать тысячи id через CASE.
+    """
+
+    max_results = 50
+
+    def filter_queryset(self, request, queryset, view):
+        name = request.query_params.get('name')
+        if not name:
+            return queryset
+        if not api_cache.backend.shared:
+            # Индекс не узнает об изменениях каталога в других воркерах.
+            return queryset.filter(name__istartswith=name)
+        ids = ingredient_index.search(name, self.max_results)
+        if not ids:
+            return queryset.none()
+        return queryset.filter(pk__in=ids).order_by(Case(
+            *[When(pk=pk, then=position) for position, pk in enumerate(ids)],
+            output_field=IntegerField(),
+        ))
+
+
+class StableOrderingFilter(filters.OrderingFilter):
+    """Сортировка с id в конце, чтобы порядок страниц был устойчивым."""
+
+    def filter(self, qs, value):
+        if not value:
+            return qs
+        return qs.order_by(
+            *[self.get_ordering_value(param) for param in value], '-id'
+        )
+
+
 class RecipeFilter(FilterSet):
     """Фильтр по рецептам."""
     author = filters.ModelChoiceFilter(queryset=User.objects.all())
@@ -25,10 +67,20 @@ class RecipeFilter(FilterSet):
     is_in_shopping_cart = filters.BooleanFilter(
         method='get_is_in_shopping_cart'
     )
+    search = filters.CharFilter(method='get_search')
+    ordering = StableOrderingFilter(
+        fields=(
+            ('favorites_count', 'favorites_count'),
+            ('pub_date', 'pub_date'),
+        ),
+    )
 
     class Meta:
         model = Recipe
-        fields = ('tags', 'author', 'is_favorited', 'is_in_shopping_cart')
+        fields = (
+            'tags', 'author', 'is_favorited', 'is_in_shopping_cart', 'search',
+            'ordering',
+        )
 
     def get_is_favorited(self, queryset, name, value):
         if value:
@@ -39,3 +91,8 @@ class RecipeFilter(FilterSet):
         if value:
             return queryset.filter(shopping_cart__user=self.request.user)
         return queryset
+
+    def get_search(self, queryset, name, value):
+        if value.strip():
+            return search_recipes(queryset, value)
+        return queryset
@@ -0,0 +1,76 @@
+import threading
+import time
+from bisect import bisect_left
+
+from django.conf import settings
+
+from api.cache import api_cache
+from recipes.models import Ingredient
+
+
+def fold(text):
+    """Приводит название к виду для сравнения без учёта регистра и ё."""
+    return text.strip().casefold().replace('ё', 'е')
+
+
+class IngredientIndex:
+    """Отсортированный в памяти каталог ингредиентов для автодополнения.
+
+    Индекс пересобирается, когда меняется версия каталога в кэше API
+    или истекает API_CACHE['TIMEOUT'].
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.version = None
+        self.built_at = 0
+        self.keys = []
+        self.ids = []
+
+    def is_fresh(self, version):
+        return (
+            version == self.version
+            and time.monotonic() - self.built_at
+            < settings.API_CACHE['TIMEOUT']
+        )
+
+    def ensure_fresh(self):
+        version = api_cache.get_version('ingredients')
+        if self.is_fresh(version):
+            return
+        with self.lock:
+            if not self.is_fresh(version):
+                self.build(version)
+
+    def build(self, version):
+        entries = sorted(
+            (fold(name), pk)
+            for pk, name in Ingredient.objects.values_list('id', 'name')
+        )
+        self.keys = [key for key, _ in entries]
+        self.ids = [pk for _, pk in entries]
+        self.version = version
+        self.built_at = time.monotonic()
+
+    def search(self, query, limit=None):
+        """Id ингредиентов: сначала по началу названия, затем по вхождению.
+
+        Поиск останавливается, как только найдено limit ингредиентов.
+        """
+        self.ensure_fresh()
+        keys, ids = self.keys, self.ids
+        query = fold(query)
+        start = bisect_left(keys, query)
+        end = bisect_left(keys, query + '\U0010ffff', start)
+        if limit is not None and end - start >= limit:
+            return ids[start:start + limit]
+        found = ids[start:end]
+        for position, (key, pk) in enumerate(zip(keys, ids)):
+            if query in key and not start <= position < end:
+                found.append(pk)
+                if len(found) == limit:
+                    break
+        return found
+
+
+ingredient_index = IngredientIndex()
@@ -0,0 +1,273 @@
+import logging
+import random
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter, defaultdict
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.http import Http404, HttpResponse, HttpResponseForbidden
+from django.utils.crypto import constant_time_compare
+
+logger = logging.getLogger(__name__)
+
+SECONDS_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10,
+)
+QUERIES_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+# Имя метрики: (тип, описание, границы корзин гистограммы).
+METRICS = {
+    'foodgram_requests_total': (
+        'counter', 'Число запросов.', None,
+    ),
+    'foodgram_request_duration_seconds': (
+        'histogram', 'Время обработки запроса.', SECONDS_BUCKETS,
+    ),
+    'foodgram_request_db_seconds': (
+        'histogram', 'Время SQL-запросов за запрос.', SECONDS_BUCKETS,
+    ),
+    'foodgram_request_non_db_seconds': (
+        'histogram',
+        'Время обработки запроса без SQL: код представления, '
+        'сериализация и middleware.',
+        SECONDS_BUCKETS,
+    ),
+    'foodgram_request_queries': (
+        'histogram', 'Число SQL-запросов за запрос.', QUERIES_BUCKETS,
+    ),
+    'foodgram_duplicate_queries_total': (
+        'counter', 'Повторы одного и того же SQL в пределах запроса.', None,
+    ),
+    'foodgram_n_plus_one_total': (
+        'counter', 'Запросы с признаками N+1.', None,
+    ),
+}
+
+
+class Histogram:
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+
+class Registry:
+    """Метрики процесса в текстовом формате Prometheus."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.histograms = {}
+        self.counters = defaultdict(int)
+
+    def observe(self, name, labels, value):
+        key = (name, labels)
+        with self.lock:
+            if key not in self.histograms:
+                self.histograms[key] = Histogram(METRICS[name][2])
+            self.histograms[key].observe(value)
+
+    def inc(self, name, labels, value=1):
+        with self.lock:
+            self.counters[(name, labels)] += value
+
+    def render(self):
+        with self.lock:
+            histograms = {
+                key: (list(histogram.counts), histogram.sum)
+                for key, histogram in self.histograms.items()
+            }
+            counters = dict(self.counters)
+        lines = []
+        for name, (kind, description, buckets) in METRICS.items():
+            lines.append(f'# HELP {name} {description}')
+            lines.append(f'# TYPE {name} {kind}')
+            if kind == 'counter':
+                for (metric, labels), value in sorted(counters.items()):
+                    if metric == name:
+                        lines.append(f'{name}{format_labels(labels)} {value}')
+                continue
+            for (metric, labels), (counts, total) in sorted(
+                histograms.items()
+            ):
+                if metric != name:
+                    continue
+                cumulative = 0
+                for bound, count in zip((*buckets, '+Inf'), counts):
+                    cumulative += count
+                    bucket_labels = format_labels(labels + (('le', bound),))
+                    lines.append(f'{name}_bucket{bucket_labels} {cumulative}')
+                lines.append(f'{name}_sum{format_labels(labels)} {total}')
+                lines.append(
+                    f'{name}_count{format_labels(labels)} {cumulative}'
+                )
+        return '\n'.join(lines) + '\n'
+
+
+def format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(
+        f'{name}="{escape_label(value)}"' for name, value in labels
+    ) + '}'
+
+
+def escape_label(value):
+    return str(value).replace('\\', '\\\\').replace(
+        '"', '\\"'
+    ).replace('\n', '\\n')
+
+
+registry = Registry()
+
+
+class QueryRecorder:
+    """Обёртка execute_wrapper: считает запросы и их время."""
+
+    def __init__(self, keep_sql=False):
+        self.started = time.perf_counter()
+        self.keep_sql = keep_sql
+        self.count = 0
+        self.duration = 0
+        self.statements = Counter()
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = time.perf_counter() - start
+            self.count += 1
+            self.duration += duration
+            self.statements[sql] += 1
+            if self.keep_sql:
+                self.queries.append((duration, sql))
+
+    @property
+    def duplicates(self):
+        return self.count - len(self.statements)
+
+    def repeated(self, threshold):
+        return [
+            (sql, count) for sql, count in self.statements.most_common()
+            if count >= threshold
+        ]
+
+
+current_recorder = ContextVar('current_recorder', default=None)
+
+
+def record_query(execute, sql, params, many, context):
+    """Обёртка execute_wrapper всех соединений.
+
+    Передаёт запрос в QueryRecorder текущего HTTP-запроса. Рекордер
+    хранится в контекстной переменной, поэтому потоки воркера с
+    GUNICORN_THREADS не смешивают запросы друг друга.
+    """
+    recorder = current_recorder.get()
+    if recorder is None:
+        return execute(sql, params, many, context)
+    return recorder(execute, sql, params, many, context)
+
+
+class MetricsMiddleware:
+    """Время, число SQL-запросов и повторы запросов по представлениям.
+
+    Медленные запросы с долей SLOW_LOG_SAMPLE_RATE пишутся в лог вместе
+    с самыми долгими и повторяющимися SQL. Число SQL-запросов
+    добавляется в заголовок X-DB-Query-Count только при
+    QUERY_COUNT_HEADER или DEBUG.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not settings.METRICS['ENABLED']:
+            return self.get_response(request)
+        recorder = self.new_recorder()
+        token = current_recorder.set(recorder)
+        try:
+            response = self.get_response(request)
+        finally:
+            current_recorder.reset(token)
+        return self.record(request, response, recorder)
+
+    def new_recorder(self):
+        return QueryRecorder(keep_sql=(
+            random.random() < settings.METRICS['SLOW_LOG_SAMPLE_RATE']
+        ))
+
+    def record(self, request, response, recorder):
+        config = settings.METRICS
+        duration = time.perf_counter() - recorder.started
+        match = request.resolver_match
+        labels = (
+            ('view', match.view_name if match else 'unmatched'),
+            ('method', request.method),
+        )
+        registry.inc(
+            'foodgram_requests_total',
+            labels + (('status', response.status_code),),
+        )
+        registry.observe('foodgram_request_duration_seconds', labels, duration)
+        registry.observe(
+            'foodgram_request_db_seconds', labels, recorder.duration
+        )
+        registry.observe(
+            'foodgram_request_non_db_seconds', labels,
+            max(duration - recorder.duration, 0),
+        )
+        registry.observe('foodgram_request_queries', labels, recorder.count)
+        if recorder.duplicates:
+            registry.inc(
+                'foodgram_duplicate_queries_total', labels,
+                recorder.duplicates,
+            )
+        repeated = recorder.repeated(config['N_PLUS_ONE_THRESHOLD'])
+        if repeated:
+            registry.inc('foodgram_n_plus_one_total', labels)
+        if (recorder.keep_sql
+                and duration >= config['SLOW_REQUEST_SECONDS']):
+            self.log_slow_request(request, duration, recorder, repeated)
+        if settings.DEBUG or config['QUERY_COUNT_HEADER']:
+            response['X-DB-Query-Count'] = recorder.count
+        return response
+
+    def log_slow_request(self, request, duration, recorder, repeated):
+        slowest = sorted(recorder.queries, reverse=True)[:5]
+        logger.warning(
+            'Медленный запрос %s %s: %.3f с, SQL: %d запросов, %.3f с\n'
+            'Самые долгие:\n%s\nПовторяющиеся:\n%s',
+            request.method, request.get_full_path(), duration,
+            recorder.count, recorder.duration,
+            '\n'.join(
+                f'{seconds:.4f} с: {sql}' for seconds, sql in slowest
+            ),
+            '\n'.join(f'{count} раз: {sql}' for sql, count in repeated),
+        )
+
+
+def metrics_view(request):
+    """Метрики в формате Prometheus по токену из METRICS['TOKEN'].
+
+    Без токена в настройках эндпоинт отключён и отвечает 404.
+    """
+    token = settings.METRICS['TOKEN']
+    if not token:
+        raise Http404
+    if not constant_time_compare(
+        request.META.get('HTTP_AUTHORIZATION', ''), f'Bearer {token}'
+    ):
+        return HttpResponseForbidden()
+    return HttpResponse(
+        registry.render(),
+        content_type='text/plain; version=0.0.4; charset=utf-8',
+    )
@@ -1,5 +1,74 @@
-from rest_framework.pagination import PageNumberPagination
+from django.conf import settings
+from django.core.paginator import Paginator
+from django.db import connections
+from django.utils.functional import cached_property
+from rest_framework.pagination import CursorPagination, PageNumberPagination
+
+
+class EstimatedCountPaginator(Paginator):
+    """Пагинатор с оценкой числа строк из статистики PostgreSQL.
+
+    Оценка используется только для запросов без фильтров, в остальных
+    случаях выполняется обычный COUNT(*).
+    """
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        query = getattr(queryset, 'query', None)
+        if (query is None or query.where
+                or connections[queryset.db].vendor != 'postgresql'):
+            return super().count
+        with connections[queryset.db].cursor() as cursor:
+            cursor.execute(
+                'SELECT reltuples::bigint FROM pg_class WHERE relname = %s',
+                [queryset.model._meta.db_table],
+            )
+            row = cursor.fetchone()
+        if row is None or row[0] < 0:
+            return super().count
+        return row[0]
+
+
+class LimitCursorPagination(CursorPagination):
+    page_size_query_param = 'limit'
 
 
 class LimitFieldPagination(PageNumberPagination):
+    """Постраничная пагинация с курсорным режимом по запросу.
+
+    Курсорный режим включается параметром ?pagination=cursor (или
+    наличием ?cursor) для вьюсетов с атрибутом cursor_ordering. Он не
+    считает общее число объектов и не использует OFFSET.
+    """
+
     page_size_query_param = 'limit'
+    mode_query_param = 'pagination'
+
+    def __init__(self):
+        self.cursor_paginator = None
+        if settings.PAGINATION_ESTIMATE_COUNT:
+            self.django_paginator_class = EstimatedCountPaginator
+
+    def use_cursor(self, request, view):
+        return getattr(view, 'cursor_ordering', None) and (
+            request.query_params.get(self.mode_query_param) == 'cursor'
+            or LimitCursorPagination.cursor_query_param
+            in request.query_params
+        )
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if self.use_cursor(request, view):
+            self.cursor_paginator = LimitCursorPagination()
+            self.cursor_paginator.ordering = view.cursor_ordering
+            self.cursor_paginator.page_size = self.page_size
+            return self.cursor_paginator.paginate_queryset(
+                queryset, request, view
+            )
+        self.cursor_paginator = None
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.cursor_paginator is not None:
+            return self.cursor_paginator.get_paginated_response(data)
+        return super().get_paginated_response(data)
@@ -0,0 +1,112 @@
+import re
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from recipes.models import Recipe, Tag
+from users.models import User
+
+SEQUENTIAL_SCAN = {
+    'postgresql': re.compile(r'Seq Scan on (\w+)'),
+    'sqlite': re.compile(r'\bSCAN (?:TABLE )?(\w+)(?!.*\bUSING\b)'),
+}
+# Подзапросы в плане SQLite: их сканирование - не чтение таблицы.
+SUBQUERY = re.compile(r'\b(?:CO-ROUTINE|MATERIALIZE) (\w+)')
+
+# Название, адрес и нужен ли вход. В адрес подставляются id рецепта,
+# автора и slug тега; общий список берётся курсором, без COUNT(*) по
+# всей таблице.
+ENDPOINTS = (
+    ('Лента рецептов', '/api/recipes/?pagination=cursor', False),
+    ('Рецепты автора', '/api/recipes/?author={author}', False),
+    ('Рецепты по тегу', '/api/recipes/?tags={tag}', False),
+    ('Избранное', '/api/recipes/?is_favorited=1', True),
+    ('Корзина', '/api/recipes/?is_in_shopping_cart=1', True),
+    ('Рецепт', '/api/recipes/{recipe}/', True),
+    ('Подписки', '/api/users/subscriptions/?recipes_limit=3', True),
+    ('Лента подписок', '/api/users/feed/', True),
+    ('Список покупок', '/api/recipes/download_shopping_cart/', True),
+)
+
+
+class QueryPlanError(Exception):
+    pass
+
+
+def endpoint_queries():
+    """SELECT-запросы, которые выполняют представления: [(название, sql)].
+
+    Эндпоинты вызываются тестовым клиентом с выключенным кэшем API, от
+    имени пользователя, у которого есть избранное и подписки.
+    """
+    user = User.objects.filter(
+        favoriting__isnull=False, follower__isnull=False
+    ).first()
+    recipe = Recipe.objects.first()
+    tag = Tag.objects.first()
+    if user is None or recipe is None or tag is None:
+        raise QueryPlanError(
+            'Для проверки нужны рецепты, теги, избранное и подписки'
+        )
+    values = {
+        'author': recipe.author_id, 'recipe': recipe.id, 'tag': tag.slug,
+    }
+    anonymous, client = APIClient(), APIClient()
+    client.force_authenticate(user)
+    queries = []
+    with override_settings(
+        API_CACHE=dict(settings.API_CACHE, ENABLED=False),
+        ALLOWED_HOSTS=settings.ALLOWED_HOSTS + ['testserver'],
+    ):
+        for name, url, authenticated in ENDPOINTS:
+            with CaptureQueriesContext(connection) as context:
+                response = (client if authenticated else anonymous).get(
+                    url.format(**values)
+                )
+                if response.streaming:
+                    b''.join(response.streaming_content)
+            if response.status_code != 200:
+                raise QueryPlanError(f'{name}: ответ {response.status_code}')
+            queries.extend(
+                (name, query['sql']) for query in context.captured_queries
+                if query['sql'].lstrip().upper().startswith('SELECT')
+            )
+    return queries
+
+
+def explain(sql):
+    with connection.cursor() as cursor:
+        cursor.execute(f'{connection.ops.explain_query_prefix()} {sql}')
+        return '\n'.join(str(row[-1]) for row in cursor.fetchall())
+
+
+def query_plans(force_index=False):
+    """Планы запросов представлений: [(название, sql, план)].
+
+    С force_index на PostgreSQL планировщику запрещено полное
+    сканирование, если есть подходящий индекс: так проверку можно
+    запускать и на маленькой базе. Всё выполняется в транзакции,
+    которая откатывается.
+    """
+    if connection.vendor not in SEQUENTIAL_SCAN:
+        raise QueryPlanError(f'База {connection.vendor} не поддерживается')
+    with transaction.atomic():
+        if force_index and connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute('SET LOCAL enable_seqscan = off')
+        plans = [
+            (name, sql, explain(sql)) for name, sql in endpoint_queries()
+        ]
+        transaction.set_rollback(True)
+    return plans
+
+
+def scanned_tables(plan, allow=('recipes_tag',)):
+    """Таблицы, которые план сканирует полностью, кроме allow."""
+    return sorted(
+        set(SEQUENTIAL_SCAN[connection.vendor].findall(plan))
+        - set(SUBQUERY.findall(plan)) - set(allow)
+    )
@@ -1,11 +1,22 @@
+import json
+
+from django.conf import settings
+from django.core.files.uploadedfile import TemporaryUploadedFile
+from django.db import transaction
+from django.db.models import Prefetch, prefetch_related_objects
+from django.http import QueryDict
 from djoser.serializers import UserSerializer
 from drf_extra_fields.fields import Base64ImageField
 from rest_framework import serializers
 from rest_framework.relations import PrimaryKeyRelatedField
 from rest_framework.validators import UniqueTogetherValidator
 
-from recipes.models import (Favorite, Follow, Ingredient, IngredientAmount,
-                            Recipe, ShoppingCart, Tag)
+from api.fields import StreamingImageField, ThumbnailsField
+from recipes.images import schedule_image_deletion, schedule_image_processing
+from recipes.models import (Favorite, Ingredient, IngredientAmount, Recipe,
+                            ShoppingCart, Tag)
+from recipes.services import bulk_relations, recipe_ingredients_changed
+from recipes.user_state import get_user_state
 from users.models import User
 
 
@@ -22,10 +33,11 @@ class UsersSerializer(UserSerializer):
         )
 
     def get_is_subscribed(self, obj):
-        if (self.context.get('request')
-           and not self.context['request'].user.is_anonymous):
-            return Follow.objects.filter(user=self.context['request'].user,
-                                         author=obj).exists()
+        if hasattr(obj, 'is_subscribed'):
+            return obj.is_subscribed
+        if self.context.get('request'):
+            state = get_user_state(self.context['request'])
+            return obj.id in state.followed
         return False
 
 
@@ -33,26 +45,26 @@ class FollowSerializer(UsersSerializer):
     """Сериализатор для работы с подписками."""
 
     recipes = serializers.SerializerMethodField()
-    recipes_count = serializers.SerializerMethodField()
+    recipes_count = serializers.ReadOnlyField()
 
     class Meta(UsersSerializer.Meta):
         fields = UsersSerializer.Meta.fields + ('recipes', 'recipes_count',)
         read_only_fields = ('email', 'username', 'last_name', 'first_name',)
 
     def get_recipes(self, obj):
-        request = self.context.get('request')
-        limit = request.GET.get('recipes_limit')
-        recipes = Recipe.objects.filter(author=obj)
-        if limit:
-            recipes = recipes[:int(limit)]
+        if hasattr(obj, 'recipes_preview'):
+            recipes = obj.recipes_preview
+        else:
+            request = self.context.get('request')
+            limit = request.GET.get('recipes_limit')
+            recipes = Recipe.objects.filter(author=obj)
+            if limit:
+                recipes = recipes[:int(limit)]
         serializer = RecipeInfoSerializer(recipes,
                                           many=True,
                                           read_only=True)
         return serializer.data
 
-    def get_recipes_count(self, obj):
-        return Recipe.objects.filter(author=obj).count()
-
 
 class TagSerializer(serializers.ModelSerializer):
     """Сериализатор для отображения тегов."""
@@ -73,9 +85,11 @@ class IngredientSerializer(serializers.ModelSerializer):
 class RecipeInfoSerializer(serializers.ModelSerializer):
     """Сериализатор для отображения краткой информации о рецепте."""
 
+    thumbnails = ThumbnailsField()
+
     class Meta:
         model = Recipe
-        fields = ('id', 'name', 'image', 'cooking_time')
+        fields = ('id', 'name', 'image', 'thumbnails', 'cooking_time')
 
 
 class RecipeIngredientSerializer(serializers.ModelSerializer):
@@ -111,6 +125,7 @@ class RecipeSerializer(serializers.ModelSerializer):
         required=True,
         source='recipe')
     image = Base64ImageField()
+    thumbnails = ThumbnailsField()
     is_favorited = serializers.SerializerMethodField(read_only=True)
     is_in_shopping_cart = serializers.SerializerMethodField(read_only=True)
 
@@ -119,26 +134,23 @@ class RecipeSerializer(serializers.ModelSerializer):
         fields = (
             'id', 'tags', 'author', 'ingredients',
             'is_favorited', 'is_in_shopping_cart',
-            'name', 'image', 'text', 'cooking_time',
+            'name', 'image', 'thumbnails', 'text', 'cooking_time',
         )
 
-    def get_ingredients(self, obj):
-        queryset = IngredientAmount.objects.filter(recipe=obj)
-        return RecipeIngredientSerializer(queryset, many=True).data
-
     def get_is_favorited(self, obj):
-        if (self.context.get('request')
-           and self.context['request'].user.is_authenticated):
-            return Favorite.objects.filter(user=self.context['request'].user,
-                                           recipe=obj).exists()
+        if hasattr(obj, 'is_favorited'):
+            return obj.is_favorited
+        if self.context.get('request'):
+            state = get_user_state(self.context['request'])
+            return obj.id in state.favorites
         return False
 
     def get_is_in_shopping_cart(self, obj):
-        if (self.context.get('request')
-           and self.context['request'].user.is_authenticated):
-            return ShoppingCart.objects.filter(
-                user=self.context['request'].user,
-                recipe=obj).exists()
+        if hasattr(obj, 'is_in_shopping_cart'):
+            return obj.is_in_shopping_cart
+        if self.context.get('request'):
+            state = get_user_state(self.context['request'])
+            return obj.id in state.cart
         return False
 
 
@@ -146,14 +158,16 @@ class CreateRecipeSerializer(serializers.ModelSerializer):
     """ Сериализатор для создания рецепта """
     ingredients = IngredientsEditSerializer(
         many=True,
-        required=True
+        required=True,
+        allow_empty=False,
     )
     tags = PrimaryKeyRelatedField(
         many=True,
         queryset=Tag.objects.all(),
-        required=True
+        required=True,
+        allow_empty=False,
     )
-    image = Base64ImageField(max_length=None)
+    image = StreamingImageField(max_length=None)
     author = UsersSerializer(read_only=True)
 
     class Meta:
@@ -162,19 +176,60 @@ class CreateRecipeSerializer(serializers.ModelSerializer):
             'id', 'tags', 'author', 'ingredients',
             'name', 'image', 'text', 'cooking_time',)
 
+    def to_internal_value(self, data):
+        if isinstance(data, QueryDict):
+            data = self.parse_multipart(data)
+        return super().to_internal_value(data)
+
+    def save(self, **kwargs):
+        image = self.validated_data.get('image')
+        try:
+            return super().save(**kwargs)
+        finally:
+            if isinstance(image, TemporaryUploadedFile):
+                image.close()
+
+    def parse_multipart(self, data):
+        """Теги передаются списком полей, ингредиенты - строкой JSON."""
+        parsed = {key: data.get(key) for key in data}
+        if 'tags' in data:
+            parsed['tags'] = data.getlist('tags')
+        if 'ingredients' in data:
+            try:
+                parsed['ingredients'] = json.loads(data['ingredients'])
+            except ValueError:
+                raise serializers.ValidationError({
+                    'ingredients': 'Ожидается список ингредиентов в JSON'
+                })
+        return parsed
+
     def validate_ingredients(self, ingredients):
-        ingredients_data = [
-            ingredient.get('id') for ingredient in ingredients
-        ]
-        if len(ingredients_data) != len(set(ingredients_data)):
-            raise serializers.ValidationError(
-                'Ингредиенты рецепта должны быть уникальными'
-            )
+        """Проверяет все ингредиенты одним запросом, ошибки - по позициям.
+
+        Найденные ингредиенты остаются в self.ingredient_objects: из них
+        собираются строки рецепта для ответа.
+        """
+        self.ingredient_objects = Ingredient.objects.in_bulk(
+            {ingredient['id'] for ingredient in ingredients}
+        )
+        seen = set()
+        errors = []
         for ingredient in ingredients:
-            if int(ingredient.get('amount')) < 1:
-                raise serializers.ValidationError(
+            error = {}
+            if ingredient['id'] not in self.ingredient_objects:
+                error['id'] = [
+                    f'Ингредиент с id {ingredient["id"]} не существует'
+                ]
+            elif ingredient['id'] in seen:
+                error['id'] = ['Ингредиенты рецепта должны быть уникальными']
+            if ingredient['amount'] < 1:
+                error['amount'] = [
                     'Количество ингредиента не может быть меньше 1'
-                )
+                ]
+            seen.add(ingredient['id'])
+            errors.append(error)
+        if any(errors):
+            raise serializers.ValidationError(errors)
         return ingredients
 
     def validate_tags(self, tags):
@@ -191,40 +246,127 @@ class CreateRecipeSerializer(serializers.ModelSerializer):
         return cooking_time
 
     def create_ingredient_amount(self, ingredients, recipe):
-        IngredientAmount.objects.bulk_create([
+        return IngredientAmount.objects.bulk_create([
             IngredientAmount(
                 recipe=recipe,
-                ingredient_id=ingredient.get('id'),
-                amount=ingredient.get('amount'),
+                ingredient=self.ingredient_objects[ingredient['id']],
+                amount=ingredient['amount'],
             )
             for ingredient in ingredients
         ])
 
-    def create_tags(self, tags, recipe):
-        for tag in tags:
-            recipe.tags.add(tag)
-
+    def update_ingredient_amount(self, ingredients, recipe):
+        """Меняет только изменившиеся количества ингредиентов рецепта.
+
+        Возвращает строки рецепта после изменения: оставшиеся по
+        порядку pk, затем новые.
+        """
+        current = {
+            ingredient_amount.ingredient_id: ingredient_amount
+            for ingredient_amount in IngredientAmount.objects.filter(
+                recipe=recipe
+            ).select_related('ingredient').order_by('pk')
+        }
+        old_amounts = {
+            ingredient_id: ingredient_amount.amount
+            for ingredient_id, ingredient_amount in current.items()
+        }
+        new_amounts = {
+            ingredient['id']: ingredient['amount']
+            for ingredient in ingredients
+        }
+        changed = []
+        for ingredient_id, ingredient_amount in current.items():
+            amount = new_amounts.get(ingredient_id)
+            if amount is not None and amount != ingredient_amount.amount:
+                ingredient_amount.amount = amount
+                changed.append(ingredient_amount)
+        with bulk_relations():
+            IngredientAmount.objects.bulk_update(changed, ['amount'])
+            removed = set(current) - set(new_amounts)
+            if removed:
+                IngredientAmount.objects.filter(
+                    recipe=recipe, ingredient_id__in=removed
+                ).delete()
+            created = self.create_ingredient_amount(
+                [
+                    ingredient for ingredient in ingredients
+                    if ingredient['id'] not in current
+                ],
+                recipe,
+            )
+        recipe_ingredients_changed(recipe, old_amounts, new_amounts)
+        return [
+            ingredient_amount
+            for ingredient_id, ingredient_amount in current.items()
+            if ingredient_id in new_amounts
+        ] + created
+
+    def set_prefetched(self, recipe, name, objects):
+        """Кладёт связанные объекты в кэш prefetch_related рецепта."""
+        queryset = getattr(recipe, name).all()
+        queryset._result_cache = list(objects)
+        queryset._prefetch_done = True
+        if not hasattr(recipe, '_prefetched_objects_cache'):
+            recipe._prefetched_objects_cache = {}
+        recipe._prefetched_objects_cache[name] = queryset
+
+    def set_tags(self, recipe, tags):
+        recipe.tags.set(tags)
+        # В порядке Tag.Meta.ordering, как при чтении из базы.
+        self.saved_relations['tags'] = sorted(tags, key=lambda tag: tag.name)
+
+    @transaction.atomic
     def create(self, validated_data):
         author = self.context.get('request').user
         tags = validated_data.pop('tags')
         ingredients = validated_data.pop('ingredients')
         recipe = Recipe.objects.create(author=author, **validated_data)
-        self.create_tags(tags, recipe)
-        self.create_ingredient_amount(ingredients, recipe)
+        self.saved_relations = {}
+        self.set_tags(recipe, tags)
+        self.saved_relations['recipe'] = self.create_ingredient_amount(
+            ingredients, recipe
+        )
+        schedule_image_processing(recipe)
         return recipe
 
+    @transaction.atomic
     def update(self, recipe, validated_data):
+        self.saved_relations = {}
         if 'ingredients' in validated_data:
-            ingredients = validated_data.pop('ingredients')
-            recipe.ingredients.clear()
-            print(ingredients)
-            self.create_ingredient_amount(ingredients, recipe)
+            self.saved_relations['recipe'] = self.update_ingredient_amount(
+                validated_data.pop('ingredients'), recipe
+            )
         if 'tags' in validated_data:
-            tags_data = validated_data.pop('tags')
-            recipe.tags.set(tags_data)
-        return super().update(recipe, validated_data)
+            self.set_tags(recipe, validated_data.pop('tags'))
+        if 'image' in validated_data:
+            validated_data['thumbnails'] = {}
+            schedule_image_deletion(recipe.image.name, recipe.thumbnails)
+        recipe = super().update(recipe, validated_data)
+        if 'image' in validated_data:
+            schedule_image_processing(recipe)
+        return recipe
 
     def to_representation(self, instance):
+        """Ответ собирается из сохранённого рецепта без повторной выборки.
+
+        Теги и ингредиенты, записанные в create или update, берутся из
+        saved_relations: UpdateModelMixin очищает кэш prefetch_related
+        рецепта после сохранения. Запрашиваются только связи, которые не
+        менялись в запросе.
+        """
+        for name, objects in getattr(self, 'saved_relations', {}).items():
+            self.set_prefetched(instance, name, objects)
+        prefetch_related_objects(
+            [instance],
+            'tags',
+            Prefetch(
+                'recipe',
+                queryset=IngredientAmount.objects.select_related(
+                    'ingredient'
+                ).order_by('pk'),
+            ),
+        )
         return RecipeSerializer(
             instance,
             context={
@@ -278,3 +420,23 @@ class ShoppingCartSerializer(serializers.ModelSerializer):
                 message='Рецепт уже добавлен в список покупок'
             )
         ]
+
+
+class BulkRecipesSerializer(serializers.Serializer):
+    """Список id рецептов для пакетных операций."""
+
+    recipes = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=settings.BULK_MAX_ITEMS,
+    )
+
+
+class BulkAuthorsSerializer(serializers.Serializer):
+    """Список id авторов для пакетной подписки."""
+
+    authors = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=settings.BULK_MAX_ITEMS,
+    )
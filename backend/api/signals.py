@@ -0,0 +1,63 @@
+from django.core.signals import request_started
+from django.db import transaction
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from api.cache import api_cache
+from api.db import close_unusable_connections
+from api.metrics import record_query
+from recipes.images import image_processed
+from recipes.models import Ingredient, Recipe, Tag
+from users.models import User
+
+
+def bump_versions(*namespaces):
+    def bump():
+        for namespace in namespaces:
+            api_cache.bump_version(namespace)
+
+    transaction.on_commit(bump)
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+def tags_changed(sender, **kwargs):
+    bump_versions('tags', 'recipes')
+
+
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+def ingredients_changed(sender, **kwargs):
+    bump_versions('ingredients', 'recipes')
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_delete, sender=Recipe)
+@receiver(image_processed, sender=Recipe)
+def recipes_changed(sender, **kwargs):
+    bump_versions('recipes')
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def users_changed(sender, update_fields=None, **kwargs):
+    if update_fields and set(update_fields) == {'last_login'}:
+        return
+    bump_versions('recipes')
+
+
+@receiver(connection_created)
+def connection_opened(sender, connection, **kwargs):
+    """Запросы каждого нового соединения попадают в метрики.
+
+    Обёртка ставится первой, чтобы не мешать execute_wrapper(), который
+    снимает свою обёртку с конца списка.
+    """
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, record_query)
+
+
+@receiver(request_started)
+def check_connections(sender, **kwargs):
+    close_unusable_connections()
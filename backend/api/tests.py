@@ -0,0 +1,966 @@
+import base64
+import csv
+import io
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.files.uploadedfile import TemporaryUploadedFile
+from django.db import connection
+from django.db.models import Sum
+from django.test import (SimpleTestCase, TestCase, TransactionTestCase,
+                         override_settings)
+from django.test.utils import CaptureQueriesContext
+from PIL import Image
+from rest_framework.exceptions import ValidationError
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+
+from api.cache import ApiCache, DjangoCacheBackend
+from api.exports import EXPORTERS
+from api.fields import StreamingImageField
+from api.filters import IngredientSearchFilter
+from api.ingredient_index import ingredient_index
+from api.query_plans import ENDPOINTS, query_plans, scanned_tables
+
+from recipes.models import (Favorite, Follow, Ingredient, IngredientAmount,
+                            Recipe, ShoppingCart, ShoppingListItem, Tag)
+from recipes.services import (counter_mismatches, live_shopping_list_totals,
+                              stored_shopping_list_totals)
+from users.models import User
+
+
+@override_settings(API_CACHE=dict(settings.API_CACHE, ENABLED=False))
+class RecipesDataTestCase(TestCase):
+    """Авторы, подписки, теги, ингредиенты и 12 рецептов."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = [
+            User.objects.create_user(
+                email=f'user{number}@example.com',
+                username=f'user{number}',
+                first_name='Имя',
+                last_name='Фамилия',
+                password='password',
+            )
+            for number in range(4)
+        ]
+        cls.user = cls.users[0]
+        cls.tags = [
+            Tag.objects.create(
+                name=f'Тег {number}', color=f'#00000{number}',
+                slug=f'tag{number}',
+            )
+            for number in range(3)
+        ]
+        cls.ingredients = [
+            Ingredient.objects.create(name=name, measurement_unit='г')
+            for name in ('Абрикос', 'Мука', 'Соль', 'Сахар')
+        ]
+        for number in range(12):
+            recipe = Recipe.objects.create(
+                author=cls.users[1 + number % 3],
+                name=f'Пирог {number}',
+                image=f'recipes/pie{number}.png',
+                thumbnails={'320': {
+                    'webp': f'recipes/thumbnails/pie{number}-320.webp',
+                }},
+                text='Текст рецепта',
+                cooking_time=10 + number,
+            )
+            recipe.tags.set(cls.tags[:1 + number % 3])
+            IngredientAmount.objects.bulk_create(
+                IngredientAmount(
+                    recipe=recipe, ingredient=ingredient, amount=number + 1
+                )
+                for ingredient in cls.ingredients[:1 + number % 4]
+            )
+            if number % 2:
+                Favorite.objects.create(user=cls.user, recipe=recipe)
+            if number % 3 == 0:
+                ShoppingCart.objects.create(user=cls.user, recipe=recipe)
+        for author in cls.users[1:3]:
+            Follow.objects.create(user=cls.user, author=author)
+
+    def get(self, url, user=None, fast=True):
+        client = APIClient()
+        if user is not None:
+            client.force_authenticate(user)
+        with override_settings(FAST_SERIALIZERS=fast):
+            return client.get(url)
+
+
+class FastSerializersContractTest(RecipesDataTestCase):
+    """Ответы с FAST_SERIALIZERS совпадают с ответами сериализаторов DRF."""
+
+    anonymous_urls = (
+        '/api/recipes/',
+        '/api/recipes/?page=2&limit=3',
+        '/api/recipes/?tags=tag1',
+        '/api/recipes/?search=Пирог',
+        '/api/recipes/?pagination=cursor&limit=3',
+        '/api/recipes/?ordering=-favorites_count',
+        '/api/recipes/0/',
+    )
+    authenticated_urls = (
+        '/api/recipes/?is_favorited=1',
+        '/api/recipes/?is_in_shopping_cart=1',
+        '/api/users/subscriptions/',
+        '/api/users/subscriptions/?recipes_limit=2',
+        '/api/users/feed/',
+    )
+
+    def assertSameResponse(self, url, user=None):
+        slow = self.get(url, user, fast=False)
+        fast = self.get(url, user, fast=True)
+        self.assertEqual(slow.status_code, fast.status_code)
+        self.assertEqual(slow.content, fast.content)
+        if slow.status_code == 200:
+            self.assertEqual(JSONRenderer().render(slow.data), slow.content)
+
+    def test_recipes_anonymous(self):
+        recipe = Recipe.objects.first()
+        for url in self.anonymous_urls + (f'/api/recipes/{recipe.id}/',):
+            with self.subTest(url=url):
+                self.assertSameResponse(url)
+
+    def test_recipes_authenticated(self):
+        recipe = Recipe.objects.filter(author=self.users[1]).first()
+        urls = self.anonymous_urls + self.authenticated_urls + (
+            f'/api/recipes/{recipe.id}/',
+            f'/api/recipes/?author={recipe.author_id}',
+        )
+        for url in urls:
+            with self.subTest(url=url):
+                self.assertSameResponse(url, self.user)
+
+    def test_flags(self):
+        response = self.get('/api/recipes/?limit=12', self.user)
+        recipes = response.json()['results']
+        self.assertEqual(
+            sum(recipe['is_favorited'] for recipe in recipes), 6
+        )
+        self.assertEqual(
+            sum(recipe['is_in_shopping_cart'] for recipe in recipes), 4
+        )
+        self.assertEqual(
+            sum(recipe['author']['is_subscribed'] for recipe in recipes), 8
+        )
+
+
+class RecipeQueriesTest(RecipesDataTestCase):
+    """Число запросов списка рецептов не зависит от размера страницы.
+
+    Сериализаторам нужен лишний запрос: авторы загружаются отдельно.
+    """
+
+    def assertQueriesPerPage(self, user=None):
+        for fast, queries in ((False, 5), (True, 4)):
+            for limit in (1, 6, 12):
+                with self.subTest(fast=fast, limit=limit):
+                    with self.assertNumQueries(queries):
+                        response = self.get(
+                            f'/api/recipes/?limit={limit}', user, fast
+                        )
+                    self.assertEqual(len(response.json()['results']), limit)
+
+    def test_anonymous(self):
+        self.assertQueriesPerPage()
+
+    def test_authenticated(self):
+        self.assertQueriesPerPage(self.user)
+
+    def test_detail(self):
+        recipe = Recipe.objects.first()
+        for fast, queries in ((False, 4), (True, 3)):
+            with self.subTest(fast=fast):
+                with self.assertNumQueries(queries):
+                    self.get(f'/api/recipes/{recipe.id}/', self.user, fast)
+
+
+class SubscriptionQueriesTest(RecipesDataTestCase):
+    """Число запросов подписок не зависит от числа авторов и рецептов."""
+
+    def assertQueries(self, queries, fast):
+        for limit in ('', '1', '2', '10'):
+            with self.subTest(fast=fast, recipes_limit=limit):
+                with self.assertNumQueries(queries):
+                    response = self.get(
+                        f'/api/users/subscriptions/?recipes_limit={limit}',
+                        self.user, fast,
+                    )
+                authors = response.json()['results']
+                self.assertTrue(authors)
+                for author in authors:
+                    self.assertEqual(author['recipes_count'], 4)
+                    self.assertEqual(
+                        len(author['recipes']), min(int(limit or 4), 4)
+                    )
+
+    def test_subscriptions(self):
+        for fast in (False, True):
+            self.assertQueries(3, fast)
+            Follow.objects.create(user=self.user, author=self.users[3])
+            self.assertQueries(3, fast)
+            Follow.objects.filter(author=self.users[3]).delete()
+
+
+class QueryPlansTest(RecipesDataTestCase):
+    """Запросы представлений не сканируют таблицы целиком."""
+
+    def test_all_endpoints_checked(self):
+        names = {name for name, sql, plan in query_plans()}
+        self.assertEqual(names, {name for name, url, auth in ENDPOINTS})
+
+    def test_no_sequential_scans(self):
+        if connection.vendor != 'postgresql':
+            self.skipTest('Планы проверяются на PostgreSQL')
+        failures = [
+            (name, sql, plan) for name, sql, plan
+            in query_plans(force_index=True) if scanned_tables(plan)
+        ]
+        self.assertEqual(failures, [])
+
+
+class RecipeUpdateTest(RecipesDataTestCase):
+    """PATCH меняет только изменившиеся строки и не перечитывает рецепт."""
+
+    def setUp(self):
+        self.recipe = Recipe.objects.get(name='Пирог 3')
+        self.client = APIClient()
+        self.client.force_authenticate(self.recipe.author)
+        self.rows = dict(
+            self.recipe.recipe.values_list('ingredient_id', 'pk')
+        )
+
+    def patch(self, amounts, queries):
+        url = f'/api/recipes/{self.recipe.id}/'
+        with self.assertNumQueries(queries):
+            response = self.client.patch(url, {'ingredients': [
+                {'id': ingredient.id, 'amount': amount}
+                for ingredient, amount in amounts
+            ]}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            response.json(), self.get(url, self.recipe.author).json()
+        )
+        return {
+            ingredient['id']: ingredient['amount']
+            for ingredient in response.json()['ingredients']
+        }
+
+    def assertRowsKept(self, ingredients):
+        self.assertEqual(
+            dict(self.recipe.recipe.values_list('ingredient_id', 'pk')),
+            {ingredient.id: self.rows[ingredient.id]
+             for ingredient in ingredients},
+        )
+
+    def test_unchanged_changed_removed(self):
+        first, *rest = self.ingredients
+        amounts = [(ingredient, 4) for ingredient in self.ingredients]
+        self.assertEqual(self.patch(amounts, 11), {
+            ingredient.id: 4 for ingredient in self.ingredients
+        })
+        self.assertRowsKept(self.ingredients)
+        amounts[0] = (first, 10)
+        self.assertEqual(self.patch(amounts, 18)[first.id], 10)
+        self.assertRowsKept(self.ingredients)
+        self.assertEqual(self.patch(amounts[1:], 18), {
+            ingredient.id: 4 for ingredient in rest
+        })
+        self.assertRowsKept(rest)
+
+
+class RecipeValidationTest(RecipesDataTestCase):
+    """Ошибки ингредиентов и тегов рецепта - по позициям, без записи."""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        buffer = io.BytesIO()
+        Image.new('RGB', (4, 4), 'red').save(buffer, 'PNG')
+        self.image = (
+            'data:image/png;base64,'
+            + base64.b64encode(buffer.getvalue()).decode()
+        )
+
+    def data(self, **fields):
+        return dict({
+            'name': 'Новый пирог',
+            'text': 'Текст',
+            'cooking_time': 10,
+            'image': self.image,
+            'tags': [self.tags[0].id],
+            'ingredients': [{'id': self.ingredients[0].id, 'amount': 1}],
+        }, **fields)
+
+    def post(self, **fields):
+        count = Recipe.objects.count()
+        response = self.client.post(
+            '/api/recipes/', self.data(**fields), format='json'
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(Recipe.objects.count(), count)
+        return response.json()
+
+    def test_ingredients(self):
+        first, second = self.ingredients[:2]
+        for ingredients, errors in (
+            ([{'id': 10 ** 6, 'amount': 1}], [['id']]),
+            (
+                [{'id': first.id, 'amount': 1},
+                 {'id': first.id, 'amount': 2}],
+                [[], ['id']],
+            ),
+            (
+                [{'id': first.id, 'amount': 0},
+                 {'id': second.id, 'amount': -1}],
+                [['amount'], ['amount']],
+            ),
+            (
+                [{'id': 10 ** 6, 'amount': 0},
+                 {'id': second.id, 'amount': 1}],
+                [['amount', 'id'], []],
+            ),
+        ):
+            with self.subTest(ingredients=ingredients):
+                response = self.post(ingredients=ingredients)
+                self.assertEqual(list(response), ['ingredients'])
+                self.assertEqual(
+                    [sorted(error) for error in response['ingredients']],
+                    errors,
+                )
+
+    def test_tags(self):
+        for tags in ([10 ** 6], [self.tags[0].id, self.tags[0].id]):
+            with self.subTest(tags=tags):
+                self.assertEqual(list(self.post(tags=tags)), ['tags'])
+
+    def test_empty_lists(self):
+        for field in ('ingredients', 'tags'):
+            with self.subTest(field=field):
+                self.assertEqual(list(self.post(**{field: []})), [field])
+
+    def test_valid(self):
+        response = self.client.post(
+            '/api/recipes/', self.data(), format='json'
+        )
+        self.assertEqual(response.status_code, 201)
+
+
+class RelationsTest(RecipesDataTestCase):
+    """Подписки и пакетные операции с частичным успехом."""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def bulk(self, method, url, key, ids):
+        response = getattr(self.client, method)(
+            url, {key: ids}, format='json'
+        )
+        self.assertEqual(response.status_code, 200)
+        return [
+            (result['id'], result['status'])
+            for result in response.json()['results']
+        ]
+
+    def test_subscribe_to_self(self):
+        response = self.client.post(f'/api/users/{self.user.id}/subscribe/')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('errors', response.json())
+        self.assertFalse(Follow.objects.filter(author=self.user).exists())
+
+    def test_bulk_favorite(self):
+        favorite = Recipe.objects.get(name='Пирог 1').id
+        new = Recipe.objects.get(name='Пирог 0').id
+        ids = [favorite, new, new, 10 ** 6]
+        url = '/api/recipes/bulk_favorite/'
+        self.assertEqual(
+            self.bulk('post', url, 'recipes', ids),
+            [
+                (favorite, 'exists'), (new, 'created'), (new, 'exists'),
+                (10 ** 6, 'not_found'),
+            ],
+        )
+        self.assertEqual(
+            Favorite.objects.filter(user=self.user, recipe_id=new).count(), 1
+        )
+        self.assertEqual(Recipe.objects.get(pk=new).favorites_count, 1)
+        self.assertEqual(
+            self.bulk('delete', url, 'recipes', ids),
+            [
+                (favorite, 'deleted'), (new, 'deleted'), (new, 'missing'),
+                (10 ** 6, 'not_found'),
+            ],
+        )
+        self.assertFalse(Favorite.objects.filter(
+            user=self.user, recipe_id__in=ids
+        ).exists())
+        self.assertEqual(Recipe.objects.get(pk=new).favorites_count, 0)
+
+    def test_bulk_subscribe(self):
+        followed, new = self.users[1], self.users[3]
+        ids = [self.user.id, followed.id, new.id, new.id, 10 ** 6]
+        self.assertEqual(
+            self.bulk('post', '/api/users/bulk_subscribe/', 'authors', ids),
+            [
+                (self.user.id, 'forbidden'), (followed.id, 'exists'),
+                (new.id, 'created'), (new.id, 'exists'),
+                (10 ** 6, 'not_found'),
+            ],
+        )
+        self.assertEqual(
+            Follow.objects.filter(user=self.user, author=new).count(), 1
+        )
+        new.refresh_from_db()
+        self.assertEqual(new.followers_count, 1)
+        self.assertFalse(Follow.objects.filter(author=self.user).exists())
+
+
+class CountersTest(RecipesDataTestCase):
+    """Счётчики избранного, рецептов и подписчиков совпадают с count()."""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def assertCounters(self):
+        for recipe in Recipe.objects.all():
+            self.assertEqual(
+                recipe.favorites_count,
+                Favorite.objects.filter(recipe=recipe).count(),
+            )
+        for user in User.objects.all():
+            self.assertEqual(
+                user.recipes_count, Recipe.objects.filter(author=user).count()
+            )
+            self.assertEqual(
+                user.followers_count,
+                Follow.objects.filter(author=user).count(),
+            )
+        self.assertEqual(list(counter_mismatches()), [])
+
+    def toggle(self, url, statuses):
+        for method, expected in zip(
+            ('post', 'post', 'delete', 'delete'), statuses
+        ):
+            with self.subTest(url=url, method=method):
+                response = getattr(self.client, method)(url)
+                self.assertEqual(response.status_code, expected)
+                self.assertCounters()
+
+    def test_favorite(self):
+        recipe = Recipe.objects.get(name='Пирог 0')
+        self.toggle(
+            f'/api/recipes/{recipe.id}/favorite/', (201, 400, 204, 404)
+        )
+
+    def test_subscribe(self):
+        self.toggle(
+            f'/api/users/{self.users[3].id}/subscribe/', (201, 400, 204, 404)
+        )
+
+    def test_recipes(self):
+        recipe = Recipe.objects.create(
+            author=self.user, name='Новый пирог', text='Текст',
+            cooking_time=10,
+        )
+        self.assertCounters()
+        response = self.client.delete(f'/api/recipes/{recipe.id}/')
+        self.assertEqual(response.status_code, 204)
+        self.assertCounters()
+
+    def test_cascade_deletes(self):
+        Favorite.objects.create(
+            user=self.users[2], recipe=Recipe.objects.get(name='Пирог 1')
+        )
+        Follow.objects.create(user=self.users[2], author=self.users[1])
+        self.assertCounters()
+        Recipe.objects.get(name='Пирог 1').delete()
+        self.assertCounters()
+        self.users[1].delete()
+        self.assertCounters()
+        self.user.delete()
+        self.assertCounters()
+
+
+class ShoppingListTest(RecipesDataTestCase):
+    """Выгрузка совпадает с суммой по рецептам корзины после правок состава.
+
+    Состав меняется в обход API, как в админке или в shell.
+    """
+
+    def download(self):
+        response = self.get(
+            '/api/recipes/download_shopping_cart/?file_format=csv', self.user
+        )
+        rows = csv.reader(io.StringIO(
+            b''.join(response.streaming_content).decode()
+        ))
+        next(rows)
+        return {(name, unit): int(amount) for name, amount, unit in rows}
+
+    def expected(self):
+        return {
+            (row['ingredient__name'], row['ingredient__measurement_unit']):
+                row['total']
+            for row in IngredientAmount.objects.filter(
+                recipe__shopping_cart__user=self.user
+            ).values(
+                'ingredient__name', 'ingredient__measurement_unit'
+            ).annotate(total=Sum('amount'))
+        }
+
+    def assertTotals(self):
+        self.assertEqual(self.download(), self.expected())
+        self.assertEqual(
+            stored_shopping_list_totals(), live_shopping_list_totals()
+        )
+
+    def test_ingredient_amount_changes(self):
+        recipes = {
+            number: Recipe.objects.get(name=f'Пирог {number}')
+            for number in (0, 1, 3, 6, 9)
+        }
+        self.assertTotals()
+        amount = IngredientAmount.objects.get(recipe=recipes[0])
+        amount.amount += 100
+        amount.save()
+        self.assertTotals()
+        amount = IngredientAmount.objects.filter(recipe=recipes[9]).last()
+        amount.ingredient = self.ingredients[3]
+        amount.save()
+        self.assertTotals()
+        amount.recipe = recipes[1]
+        amount.save()
+        self.assertTotals()
+        IngredientAmount.objects.create(
+            recipe=recipes[6], ingredient=self.ingredients[3], amount=7
+        )
+        self.assertTotals()
+        IngredientAmount.objects.filter(recipe=recipes[6]).first().delete()
+        self.assertTotals()
+        IngredientAmount.objects.filter(recipe=recipes[3]).delete()
+        self.assertTotals()
+
+    def test_cascade_deletes(self):
+        Recipe.objects.filter(shopping_cart__user=self.user).first().delete()
+        self.assertTotals()
+        self.ingredients[1].delete()
+        self.assertTotals()
+
+
+class ShoppingListExportTest(RecipesDataTestCase):
+    """Выгрузка списка покупок в каждом формате."""
+
+    url = '/api/recipes/download_shopping_cart/'
+    lines = ['Абрикос - 22 г', 'Мука - 21 г', 'Сахар - 4 г', 'Соль - 11 г']
+
+    def download(self, file_format):
+        response = self.get(f'{self.url}?file_format={file_format}', self.user)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            response['Content-Disposition'],
+            f'attachment; filename=shopping_cart.{file_format}',
+        )
+        return b''.join(response.streaming_content)
+
+    def test_txt(self):
+        self.assertEqual(
+            self.download('txt').decode(),
+            'Список покупок:\n\n' + '\n'.join(self.lines),
+        )
+
+    def test_csv(self):
+        rows = list(csv.reader(io.StringIO(self.download('csv').decode())))
+        self.assertEqual(rows, [
+            ['Ингредиент', 'Количество', 'Единица измерения'],
+            *[
+                [name, amount, unit] for name, _, amount, unit
+                in (line.split() for line in self.lines)
+            ],
+        ])
+
+    def test_pdf(self):
+        if not EXPORTERS['pdf'].is_available():
+            self.skipTest('Нет reportlab или шрифта с кириллицей')
+        content = self.download('pdf')
+        self.assertTrue(content.startswith(b'%PDF'))
+        self.assertIn(b'%%EOF', content[-32:])
+
+    def test_unknown_format(self):
+        response = self.get(f'{self.url}?file_format=xlsx', self.user)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(
+            response.json(), {'errors': 'Формат xlsx не поддерживается.'}
+        )
+
+    def test_anonymous(self):
+        self.assertEqual(self.get(self.url).status_code, 401)
+
+
+@override_settings(
+    API_CACHE=dict(settings.API_CACHE, ENABLED=False),
+    FEED=dict(settings.FEED, EXECUTOR='sync'),
+)
+class ConcurrentTogglesTest(TransactionTestCase):
+    """Одновременные одинаковые запросы: без 500 и без дубликатов.
+
+    Каждый поток работает со своим соединением с базой, запросы
+    отправляются одновременно через Barrier.
+    """
+
+    workers = 8
+
+    def setUp(self):
+        if connection.is_in_memory_db():
+            self.skipTest('Нужна база, общая для нескольких соединений')
+        self.user, self.author = (
+            User.objects.create_user(
+                email=f'{name}@example.com', username=name,
+                first_name='Имя', last_name='Фамилия', password='password',
+            )
+            for name in ('user', 'author')
+        )
+        self.recipe = Recipe.objects.create(
+            author=self.author, name='Пирог', text='Текст', cooking_time=10,
+        )
+        self.ingredient = Ingredient.objects.create(
+            name='Мука', measurement_unit='г'
+        )
+        IngredientAmount.objects.create(
+            recipe=self.recipe, ingredient=self.ingredient, amount=200
+        )
+
+    def concurrently(self, method, url):
+        barrier = threading.Barrier(self.workers)
+
+        def call(_):
+            client = APIClient()
+            client.force_authenticate(self.user)
+            try:
+                barrier.wait()
+                return getattr(client, method)(url).status_code
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            return sorted(executor.map(call, range(self.workers)))
+
+    def assertToggles(self, url, created, deleted):
+        self.assertEqual(
+            self.concurrently('post', url),
+            [201] + [400] * (self.workers - 1),
+        )
+        created()
+        self.assertEqual(
+            self.concurrently('delete', url),
+            [204] + [404] * (self.workers - 1),
+        )
+        deleted()
+
+    def test_favorite(self):
+        def check(count):
+            self.assertEqual(
+                Favorite.objects.filter(user=self.user).count(), count
+            )
+            self.recipe.refresh_from_db()
+            self.assertEqual(self.recipe.favorites_count, count)
+
+        self.assertToggles(
+            f'/api/recipes/{self.recipe.id}/favorite/',
+            lambda: check(1), lambda: check(0),
+        )
+
+    def test_shopping_cart(self):
+        def check(count):
+            self.assertEqual(
+                ShoppingCart.objects.filter(user=self.user).count(), count
+            )
+            self.assertEqual(
+                list(ShoppingListItem.objects.filter(
+                    user=self.user
+                ).values_list('ingredient_id', 'amount')),
+                [(self.ingredient.id, 200)] if count else [],
+            )
+
+        self.assertToggles(
+            f'/api/recipes/{self.recipe.id}/shopping_cart/',
+            lambda: check(1), lambda: check(0),
+        )
+
+    def test_subscribe(self):
+        def check(count):
+            self.assertEqual(
+                Follow.objects.filter(user=self.user).count(), count
+            )
+            self.author.refresh_from_db()
+            self.assertEqual(self.author.followers_count, count)
+
+        self.assertToggles(
+            f'/api/users/{self.author.id}/subscribe/',
+            lambda: check(1), lambda: check(0),
+        )
+
+
+@override_settings(API_CACHE=dict(settings.API_CACHE, ENABLED=False))
+class IngredientSearchTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        Ingredient.objects.bulk_create(
+            Ingredient(name=name, measurement_unit='г')
+            for name in (
+                'Абрикос', 'абрикосовый джем', 'Ёжевика', 'Соль', 'Сахар',
+                'Сало', 'Лук', 'Сок абрикоса',
+            )
+        )
+
+    def setUp(self):
+        ingredient_index.version = None
+
+    def search(self, name):
+        response = APIClient().get('/api/ingredients/', {'name': name})
+        return [ingredient['name'] for ingredient in response.json()]
+
+    def test_prefix_first(self):
+        self.assertEqual(
+            self.search('абрикос'),
+            ['Абрикос', 'абрикосовый джем', 'Сок абрикоса'],
+        )
+        self.assertEqual(self.search('еж'), ['Ёжевика'])
+
+    def test_max_results(self):
+        with mock.patch.object(IngredientSearchFilter, 'max_results', 2):
+            self.assertEqual(self.search('с'), ['Сало', 'Сахар'])
+            self.assertEqual(
+                self.search('абрикос'), ['Абрикос', 'абрикосовый джем']
+            )
+            self.assertEqual(self.search('ук'), ['Лук'])
+        # Версия каталога из общего кэша и сами ингредиенты.
+        with self.assertNumQueries(2):
+            self.search('с')
+
+
+class MetricsViewTest(SimpleTestCase):
+
+    def test_disabled_without_token(self):
+        metrics = dict(settings.METRICS, TOKEN='')
+        with override_settings(METRICS=metrics):
+            self.assertEqual(self.client.get('/metrics').status_code, 404)
+
+    def test_token(self):
+        metrics = dict(settings.METRICS, TOKEN='secret')
+        with override_settings(METRICS=metrics):
+            self.assertEqual(self.client.get('/metrics').status_code, 403)
+            response = self.client.get(
+                '/metrics', HTTP_AUTHORIZATION='Bearer secret'
+            )
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'# TYPE', response.content)
+
+
+class QueryCountHeaderTest(RecipesDataTestCase):
+    """X-DB-Query-Count только с QUERY_COUNT_HEADER или DEBUG."""
+
+    def test_header(self):
+        for header, debug, expected in (
+            (False, False, False), (True, False, True), (False, True, True),
+        ):
+            metrics = dict(settings.METRICS, QUERY_COUNT_HEADER=header)
+            with self.subTest(header=header, debug=debug), override_settings(
+                METRICS=metrics, DEBUG=debug
+            ):
+                with CaptureQueriesContext(connection) as queries:
+                    response = self.get('/api/recipes/', self.user)
+                self.assertEqual('X-DB-Query-Count' in response, expected)
+                if expected:
+                    self.assertEqual(
+                        response['X-DB-Query-Count'], str(len(queries))
+                    )
+
+
+@override_settings(API_CACHE=dict(settings.API_CACHE, ENABLED=True))
+class ApiCacheTest(RecipesDataTestCase):
+    """Ответы кэшируются только в общем для воркеров кэше."""
+
+    def worker_cache(self, alias='default'):
+        """Кэш API отдельного воркера со своим объектом кэша Django."""
+        cache = ApiCache()
+        cache._backend = DjangoCacheBackend(300, alias)
+        cache._backend.cache = caches.create_connection(alias)
+        return cache
+
+    def test_versions_shared_between_workers(self):
+        reader, writer = self.worker_cache(), self.worker_cache()
+        self.assertTrue(reader.backend.shared)
+        with mock.patch('api.cache.api_cache', reader):
+            self.assertEqual(len(self.get('/api/tags/').json()), 3)
+            self.get('/api/recipes/')
+            with self.assertNumQueries(2):
+                self.assertEqual(len(self.get('/api/tags/').json()), 3)
+            with self.assertNumQueries(2):
+                self.get('/api/recipes/')
+        with mock.patch('api.signals.api_cache', writer):
+            with self.captureOnCommitCallbacks(execute=True):
+                Tag.objects.create(name='Новый', color='#111111', slug='new')
+        with mock.patch('api.cache.api_cache', reader):
+            self.assertEqual(len(self.get('/api/tags/').json()), 4)
+
+    @override_settings(CACHES={'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }})
+    def test_local_cache_not_used(self):
+        cache = self.worker_cache()
+        self.assertFalse(cache.backend.shared)
+        with mock.patch('api.cache.api_cache', cache):
+            self.get('/api/tags/')
+            self.get('/api/recipes/')
+            with self.assertNumQueries(1):
+                self.get('/api/tags/')
+            with self.assertNumQueries(4):
+                self.get('/api/recipes/')
+
+
+@override_settings(
+    API_CACHE=dict(settings.API_CACHE, ENABLED=True),
+    FEED=dict(settings.FEED, EXECUTOR='sync'),
+)
+class CachedUserFlagsTest(RecipesDataTestCase):
+    """Флаги пользователя поверх общего для всех кэша рецептов."""
+
+    urls = ('/api/recipes/', '/api/recipes/?tags=tag1')
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        # Не в избранном и не в корзине, на автора нет подписки.
+        self.detail = (
+            f'/api/recipes/{Recipe.objects.get(name="Пирог 2").id}/'
+        )
+
+    def uncached(self, url, user=None):
+        with override_settings(
+            API_CACHE=dict(settings.API_CACHE, ENABLED=False)
+        ):
+            return self.get(url, user).json()
+
+    def assertFlags(self, user=None, queries=2):
+        """Ответ из кэша совпадает с ответом без кэша."""
+        for url in self.urls + (self.detail,):
+            with self.subTest(url=url, user=user):
+                self.get(url)
+                with self.assertNumQueries(queries):
+                    response = self.get(url, user)
+                self.assertEqual(response.json(), self.uncached(url, user))
+
+    def test_anonymous(self):
+        self.assertFlags()
+        recipes = self.get('/api/recipes/').json()['results']
+        self.assertFalse(any(
+            recipe['is_favorited'] or recipe['is_in_shopping_cart']
+            or recipe['author']['is_subscribed']
+            for recipe in recipes
+        ))
+
+    def test_authenticated(self):
+        self.assertFlags(self.user, queries=3)
+        recipes = self.get('/api/recipes/', self.user).json()['results']
+        for flag in ('is_favorited', 'is_in_shopping_cart'):
+            self.assertTrue(any(recipe[flag] for recipe in recipes))
+            self.assertFalse(all(recipe[flag] for recipe in recipes))
+
+    def test_state_changed_after_caching(self):
+        recipe = self.get(self.detail).json()
+        author_id = recipe['author']['id']
+        for timeout in (0, 300):
+            user_state = dict(settings.USER_STATE, TIMEOUT=timeout)
+            with override_settings(USER_STATE=user_state):
+                self.get(self.detail, self.user)
+                for method, expected, code in (
+                    ('post', True, 201), ('delete', False, 204)
+                ):
+                    with self.captureOnCommitCallbacks(execute=True):
+                        for url in (
+                            f'{self.detail}favorite/',
+                            f'{self.detail}shopping_cart/',
+                            f'/api/users/{author_id}/subscribe/',
+                        ):
+                            response = getattr(self.client, method)(url)
+                            self.assertEqual(response.status_code, code)
+                    with self.subTest(timeout=timeout, method=method):
+                        recipe = self.get(self.detail, self.user).json()
+                        self.assertEqual(recipe['is_favorited'], expected)
+                        self.assertEqual(
+                            recipe['is_in_shopping_cart'], expected
+                        )
+                        self.assertEqual(
+                            recipe['author']['is_subscribed'], expected
+                        )
+                        self.assertEqual(
+                            recipe, self.uncached(self.detail, self.user)
+                        )
+
+
+class StreamingImageFieldTest(SimpleTestCase):
+
+    def setUp(self):
+        buffer = io.BytesIO()
+        Image.effect_noise((300, 200), 64).save(buffer, 'PNG')
+        self.content = buffer.getvalue()
+        self.data = base64.b64encode(self.content).decode()
+        self.field = StreamingImageField()
+        self.field.chunk_size = 1024
+
+    def decode(self, data):
+        files = []
+
+        def create(*args):
+            files.append(TemporaryUploadedFile(*args))
+            return files[-1]
+
+        with mock.patch('api.fields.TemporaryUploadedFile', create):
+            try:
+                return self.field.decode(data)
+            finally:
+                self.file = files[0]
+
+    def test_decode(self):
+        for data in (
+            self.data,
+            f'data:image/png;base64,{self.data}',
+            '\n'.join(
+                self.data[start:start + 76]
+                for start in range(0, len(self.data), 76)
+            ),
+        ):
+            with self.subTest(data=data[:30]):
+                file = self.decode(data)
+                self.assertEqual(file.read(), self.content)
+                self.assertEqual(file.size, len(self.content))
+                self.assertTrue(file.name.endswith('.png'))
+                file.close()
+
+    def test_invalid_base64(self):
+        with self.assertRaises(ValidationError):
+            self.decode(self.data[:-1])
+        self.assertTrue(self.file.closed)
+
+    def test_too_large(self):
+        config = dict(settings.RECIPE_IMAGES, MAX_UPLOAD_SIZE=4096)
+        with override_settings(RECIPE_IMAGES=config):
+            with self.assertRaises(ValidationError):
+                self.decode(self.data)
+        self.assertTrue(self.file.closed)
+
+    def test_too_many_pixels(self):
+        config = dict(settings.RECIPE_IMAGES, MAX_PIXELS=100)
+        with override_settings(RECIPE_IMAGES=config):
+            with self.assertRaises(ValidationError):
+                self.decode(self.data)
+        self.assertTrue(self.file.closed)
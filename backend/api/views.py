@@ -1,5 +1,6 @@
-from django.db.models import Sum
-from django.http.response import HttpResponse
+from django.conf import settings
+from django.db.models import OuterRef, Prefetch, Subquery, Value
+from django.http import Http404
 from django.shortcuts import get_object_or_404
 from django_filters.rest_framework import DjangoFilterBackend
 from djoser.views import UserViewSet
@@ -9,34 +10,89 @@ from rest_framework.permissions import (AllowAny,
                                         IsAuthenticated)
 from rest_framework.response import Response
 
-from api.filters import IngredientFilter, RecipeFilter
+from api.cache import CachedListMixin, CachedRecipesMixin
+from api.db import ReplicaReadMixin
+from api.exports import EXPORTERS, get_shopping_list
+from api.fast_serializers import (FOLLOW_FIELDS, FastRecipesMixin,
+                                  recipe_values, serialize_follows,
+                                  serialize_recipes)
+from api.filters import (IngredientFilter, IngredientSearchFilter,
+                         RecipeFilter)
+from api.pagination import LimitCursorPagination
 from api.permissions import IsAuthorOrReadOnly
-from api.serializers import (CreateRecipeSerializer,
+from api.serializers import (BulkAuthorsSerializer, BulkRecipesSerializer,
+                             CreateRecipeSerializer,
                              FollowSerializer, IngredientSerializer,
                              RecipeSerializer, TagSerializer, UsersSerializer)
-from recipes.models import (Favorite, Follow, Ingredient, IngredientAmount,
-                            Recipe, ShoppingCart, Tag)
+from recipes.feed import feed_recipes
+from recipes.models import (Favorite, Follow, Ingredient, Recipe,
+                            ShoppingCart, Tag)
+from recipes.services import (add_relation, bulk_add_relations,
+                              bulk_remove_relations, remove_relation)
 from users.models import User
 
 
-class TagViewSet(viewsets.ModelViewSet):
+def bulk_change(model, request, ids, targets, excluded=()):
+    """Пакетно добавляет или удаляет связи пользователя.
+
+    Возвращает статус для каждого элемента ids в том же порядке: created
+    или exists при добавлении, deleted или missing при удалении,
+    not_found - объекта нет, forbidden - id входит в excluded. Повторный
+    id получает exists или missing: связь уже изменена его первым
+    вхождением.
+    """
+    unique_ids = list(dict.fromkeys(ids))
+    found = set(
+        targets.filter(pk__in=unique_ids).values_list('pk', flat=True)
+    ) - set(excluded)
+    valid_ids = [pk for pk in unique_ids if pk in found]
+    if request.method == 'POST':
+        changed = set(bulk_add_relations(model, request.user.id, valid_ids))
+        statuses = ('created', 'exists')
+    else:
+        changed = set(
+            bulk_remove_relations(model, request.user.id, valid_ids)
+        )
+        statuses = ('deleted', 'missing')
+    results = []
+    seen = set()
+    for pk in ids:
+        if pk in excluded:
+            result = 'forbidden'
+        elif pk not in found:
+            result = 'not_found'
+        else:
+            result = statuses[pk not in changed or pk in seen]
+            seen.add(pk)
+        results.append({'id': pk, 'status': result})
+    return Response({'results': results})
+
+
+class TagViewSet(CachedListMixin, viewsets.ModelViewSet):
     """Вьюсет для работы с тегами."""
 
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
     permission_classes = [AllowAny]
     pagination_class = None
+    cache_namespace = 'tags'
 
 
-class IngredientViewSet(viewsets.ModelViewSet):
+class IngredientViewSet(ReplicaReadMixin, CachedListMixin,
+                        viewsets.ModelViewSet):
     """Вьюсет для работы с ингредиентами."""
 
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
     permission_classes = [AllowAny]
     pagination_class = None
-    filter_backends = [DjangoFilterBackend]
+    filter_backends = (
+        [IngredientSearchFilter]
+        if settings.INGREDIENT_SEARCH == 'index'
+        else [DjangoFilterBackend]
+    )
     filterset_class = IngredientFilter
+    cache_namespace = 'ingredients'
 
 
 class UsersViewSet(UserViewSet):
@@ -45,6 +101,7 @@ class UsersViewSet(UserViewSet):
     queryset = User.objects.all()
     serializer_class = UsersSerializer
     permission_classes = [AllowAny]
+    cursor_ordering = ('username',)
 
     @action(
             detail=True,
@@ -56,36 +113,99 @@ class UsersViewSet(UserViewSet):
         author_id = self.kwargs.get('id')
         author = get_object_or_404(User, id=author_id)
         if request.method == 'POST':
+            if author == user:
+                return Response(
+                    {'errors': 'Нельзя подписаться на самого себя.'},
+                    status=status.HTTP_400_BAD_REQUEST,
+                )
             serializer = FollowSerializer(author,
                                           data=request.data,
                                           context={'request': request})
             serializer.is_valid(raise_exception=True)
-            Follow.objects.create(user=user, author=author)
+            if not add_relation(Follow, user.id, author.id):
+                return Response({'errors': 'Вы уже подписаны.'},
+                                status=status.HTTP_400_BAD_REQUEST)
             return Response(
                 serializer.data,
                 status=status.HTTP_201_CREATED
             )
         if request.method == 'DELETE':
-            get_object_or_404(Follow, user=user, author=author).delete()
-            return Response({'detail': 'Вы успешно отписались'},
-                            status=status.HTTP_204_NO_CONTENT)
+            if not remove_relation(Follow, user.id, author.id):
+                raise Http404
+            return Response(status=status.HTTP_204_NO_CONTENT)
+
+    @action(
+            detail=False,
+            methods=['POST', 'DELETE'],
+            permission_classes=[IsAuthenticated]
+    )
+    def bulk_subscribe(self, request):
+        serializer = BulkAuthorsSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        return bulk_change(
+            Follow, request, serializer.validated_data['authors'],
+            User.objects.all(), excluded={request.user.id},
+        )
+
+    @action(
+            detail=False,
+            permission_classes=[IsAuthenticated]
+    )
+    def feed(self, request):
+        user = request.user
+        queryset = feed_recipes(user).with_related(user).with_user_flags(user)
+        paginator = LimitCursorPagination()
+        paginator.ordering = RecipeViewSet.cursor_ordering
+        if settings.FAST_SERIALIZERS:
+            return paginator.get_paginated_response(serialize_recipes(
+                paginator.paginate_queryset(
+                    recipe_values(queryset, user), request, self
+                ),
+                request,
+            ))
+        serializer = RecipeSerializer(
+            paginator.paginate_queryset(queryset, request, self),
+            many=True,
+            context={'request': request}
+        )
+        return paginator.get_paginated_response(serializer.data)
 
     @action(
             detail=False,
             permission_classes=[IsAuthenticated]
     )
     def subscriptions(self, request):
+        recipes = Recipe.objects.all()
+        limit = request.GET.get('recipes_limit')
+        if limit and limit.isdigit():
+            recipes = recipes.filter(pk__in=Subquery(
+                Recipe.objects.filter(
+                    author=OuterRef('author')
+                ).values('pk')[:int(limit)]
+            ))
+        queryset = User.objects.filter(
+            following__user=request.user
+        ).order_by('username')
+        if settings.FAST_SERIALIZERS:
+            return self.get_paginated_response(serialize_follows(
+                self.paginate_queryset(queryset.values(*FOLLOW_FIELDS)),
+                recipes,
+            ))
+        queryset = queryset.annotate(
+            is_subscribed=Value(True),
+        ).prefetch_related(
+            Prefetch('recipe', queryset=recipes, to_attr='recipes_preview')
+        )
         serializer = FollowSerializer(
-            self.paginate_queryset(
-                User.objects.filter(following__user=request.user)
-            ),
+            self.paginate_queryset(queryset),
             many=True,
             context={'request': request}
         )
         return self.get_paginated_response(serializer.data)
 
 
-class RecipeViewSet(viewsets.ModelViewSet):
+class RecipeViewSet(ReplicaReadMixin, CachedRecipesMixin, FastRecipesMixin,
+                    viewsets.ModelViewSet):
     """Вьюсет для работы с рецептами."""
 
     queryset = Recipe.objects.all()
@@ -93,10 +213,13 @@ class RecipeViewSet(viewsets.ModelViewSet):
     permission_classes = [IsAuthorOrReadOnly]
     filter_backends = [DjangoFilterBackend]
     filterset_class = RecipeFilter
+    cursor_ordering = ('-pub_date', '-id')
 
     def get_queryset(self):
-        queryset = Recipe.objects.all()
-        return queryset
+        if self.request.method != 'GET':
+            return Recipe.objects.all()
+        user = self.request.user
+        return Recipe.objects.with_related(user).with_user_flags(user)
 
     def get_serializer_class(self):
         if self.request.method == 'GET':
@@ -104,21 +227,18 @@ class RecipeViewSet(viewsets.ModelViewSet):
         return CreateRecipeSerializer
 
     def recipe_add(self, model, request, pk):
-        user = request.user
         recipe = get_object_or_404(Recipe, pk=pk)
-        serializer = RecipeSerializer(recipe)
-        if not model.objects.filter(recipe=recipe, user=user).exists():
-            model.objects.create(recipe=recipe, user=request.user)
+        if add_relation(model, request.user.id, recipe.id):
+            serializer = RecipeSerializer(recipe)
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         return Response({'errors': 'Рецепт уже добавлен.'},
                         status=status.HTTP_400_BAD_REQUEST)
 
     def recipe_delete(self, model, request, pk):
-        user = request.user
         recipe = get_object_or_404(Recipe, pk=pk)
-        get_object_or_404(model, user=user, recipe=recipe).delete()
-        return Response({'detail': 'Рецепт удален.'},
-                        status=status.HTTP_204_NO_CONTENT)
+        if not remove_relation(model, request.user.id, recipe.id):
+            raise Http404
+        return Response(status=status.HTTP_204_NO_CONTENT)
 
     @action(
             detail=True,
@@ -140,28 +260,41 @@ class RecipeViewSet(viewsets.ModelViewSet):
             return self.recipe_add(ShoppingCart, request, pk)
         return self.recipe_delete(ShoppingCart, request, pk)
 
+    def recipes_bulk_change(self, model, request):
+        serializer = BulkRecipesSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        return bulk_change(
+            model, request, serializer.validated_data['recipes'],
+            Recipe.objects.all(),
+        )
+
+    @action(
+            detail=False,
+            methods=['POST', 'DELETE'],
+            permission_classes=[IsAuthenticated]
+    )
+    def bulk_favorite(self, request):
+        return self.recipes_bulk_change(Favorite, request)
+
+    @action(
+            detail=False,
+            methods=['POST', 'DELETE'],
+            permission_classes=[IsAuthenticated]
+    )
+    def bulk_shopping_cart(self, request):
+        return self.recipes_bulk_change(ShoppingCart, request)
+
     @action(
         detail=False,
         methods=['GET'],
         permission_classes=[IsAuthenticated]
     )
     def download_shopping_cart(self, request):
-        user = request.user
-        ingredients = IngredientAmount.objects.filter(
-            recipe__shopping_cart__user=user).values(
-            'ingredient__name',
-            'ingredient__measurement_unit').annotate(
-            amount=Sum('amount')
-        )
-        data = []
-        for ingredient in ingredients:
-            data.append(
-                f'{ingredient["ingredient__name"]} - '
-                f'{ingredient["amount"]} '
-                f'{ingredient["ingredient__measurement_unit"]}'
+        file_format = request.query_params.get('file_format', 'txt')
+        exporter = EXPORTERS.get(file_format)
+        if exporter is None or not exporter.is_available():
+            return Response(
+                {'errors': f'Формат {file_format} не поддерживается.'},
+                status=status.HTTP_400_BAD_REQUEST
             )
-        content = 'Список покупок:\n\n' + '\n'.join(data)
-        filename = 'shopping_cart.txt'
-        request = HttpResponse(content, content_type='text/plain')
-        request['Content-Disposition'] = f'attachment; filename={filename}'
-        return request
+        return exporter().response(get_shopping_list(request.user))
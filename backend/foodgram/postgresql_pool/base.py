@@ -0,0 +1,113 @@
+import threading
+
+from django.db.backends.postgresql import base
+from psycopg2 import extensions
+
+Database = base.Database
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def is_alive(connection):
+    """Проверяет соединение из пула запросом SELECT 1."""
+    if connection.closed:
+        return False
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT 1')
+        if not connection.autocommit:
+            connection.rollback()
+    except Database.Error:
+        return False
+    return True
+
+
+class ConnectionPool:
+    """Соединения psycopg2 одной базы, общие для потоков процесса.
+
+    Одновременно выдаётся не больше size соединений, остальные потоки
+    ждут освобождения до timeout секунд.
+    """
+
+    def __init__(self, size, timeout):
+        self.timeout = timeout
+        self.idle = []
+        self.lock = threading.Lock()
+        self.slots = threading.BoundedSemaphore(size)
+
+    def acquire(self):
+        """Свободное соединение или None, если его нужно открыть."""
+        if not self.slots.acquire(timeout=self.timeout):
+            raise Database.OperationalError(
+                'Нет свободных соединений в пуле'
+            )
+        with self.lock:
+            return self.idle.pop() if self.idle else None
+
+    def release(self, connection=None):
+        """Возвращает соединение в пул, разорванное закрывает."""
+        try:
+            if connection is None or connection.closed:
+                return
+            status = connection.get_transaction_status()
+            if status == extensions.TRANSACTION_STATUS_UNKNOWN:
+                connection.close()
+                return
+            if status != extensions.TRANSACTION_STATUS_IDLE:
+                connection.rollback()
+            with self.lock:
+                self.idle.append(connection)
+        finally:
+            self.slots.release()
+
+
+def get_pool(alias, settings_dict):
+    with _pools_lock:
+        if alias not in _pools:
+            _pools[alias] = ConnectionPool(
+                settings_dict.get('POOL_SIZE', 10),
+                settings_dict.get('POOL_TIMEOUT', 30),
+            )
+        return _pools[alias]
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    """PostgreSQL с пулом соединений внутри процесса.
+
+    Закрытие соединения Django возвращает его в пул, поэтому с этим
+    движком CONN_MAX_AGE обычно оставляют равным 0. При
+    CONN_HEALTH_CHECKS соединение из пула проверяется перед выдачей.
+    """
+
+    def get_new_connection(self, conn_params):
+        pool = get_pool(self.alias, self.settings_dict)
+        connection = pool.acquire()
+        try:
+            if (connection is not None
+                    and self.settings_dict.get('CONN_HEALTH_CHECKS')
+                    and not is_alive(connection)):
+                connection.close()
+                connection = None
+            if connection is None:
+                return super().get_new_connection(conn_params)
+        except BaseException:
+            pool.release(connection)
+            raise
+        self.isolation_level = self.settings_dict['OPTIONS'].get(
+            'isolation_level', connection.isolation_level
+        )
+        return connection
+
+    def _close(self):
+        if self.connection is None:
+            return
+        pool = get_pool(self.alias, self.settings_dict)
+        with self.wrap_database_errors:
+            if self.in_atomic_block:
+                # Django продолжит ссылаться на соединение, отдавать его
+                # другим потокам нельзя.
+                self.connection.close()
+                pool.release()
+            else:
+                pool.release(self.connection)
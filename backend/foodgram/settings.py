@@ -28,6 +28,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'api.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -65,9 +66,57 @@ DATABASES = {
         'PASSWORD': os.getenv('POSTGRES_PASSWORD', default='test.sqlite3'),
         'HOST': os.getenv('DB_HOST', default='localhost'),
         'PORT': os.getenv('DB_PORT'),
+        # Сколько секунд держать соединение между запросами, 0 - закрывать
+        # после каждого запроса.
+        'CONN_MAX_AGE': int(os.getenv('DB_CONN_MAX_AGE', default=0)),
+        # Проверять открытое соединение перед запросом и переоткрывать,
+        # если оно разорвано.
+        'CONN_HEALTH_CHECKS': (
+            os.getenv('DB_CONN_HEALTH_CHECKS', default='False') == 'True'
+        ),
+        # Для DB_ENGINE=foodgram.postgresql_pool: соединений в пуле
+        # процесса и сколько секунд ждать свободного.
+        'POOL_SIZE': int(os.getenv('DB_POOL_SIZE', default=10)),
+        'POOL_TIMEOUT': float(os.getenv('DB_POOL_TIMEOUT', default=30)),
     }
 }
 
+# Тестовая база SQLite - файл, а не общая база в памяти: в ней
+# параллельные соединения сразу получают ошибку блокировки, а не ждут.
+if DATABASES['default']['ENGINE'] == 'django.db.backends.sqlite3':
+    DATABASES['default']['TEST'] = {
+        'NAME': os.getenv(
+            'DB_TEST_NAME', default=str(BASE_DIR / 'test_db.sqlite3')
+        ),
+    }
+
+# Реплики для чтения рецептов и ингредиентов: хосты через запятую.
+# Остальные параметры берутся из default, имя базы и порт можно задать
+# отдельно. В тестах реплики указывают на основную базу.
+DB_REPLICA_HOSTS = [
+    host.strip()
+    for host in os.getenv('DB_REPLICA_HOSTS', default='').split(',')
+    if host.strip()
+]
+DATABASE_REPLICAS = [
+    f'replica{number}' for number in range(len(DB_REPLICA_HOSTS))
+]
+DATABASES.update({
+    alias: dict(
+        DATABASES['default'],
+        HOST=host,
+        NAME=os.getenv(
+            'DB_REPLICA_NAME', default=DATABASES['default']['NAME']
+        ),
+        PORT=os.getenv(
+            'DB_REPLICA_PORT', default=DATABASES['default']['PORT']
+        ),
+        TEST={'MIRROR': 'default'},
+    )
+    for alias, host in zip(DATABASE_REPLICAS, DB_REPLICA_HOSTS)
+})
+DATABASE_ROUTERS = ['api.db.ReplicaRouter']
+
 
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -115,6 +164,10 @@ REST_FRAMEWORK = {
     ],
     'DEFAULT_PAGINATION_CLASS': 'api.pagination.LimitFieldPagination',
     'PAGE_SIZE': 6,
+    'DEFAULT_RENDERER_CLASSES': [
+        'api.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
 }
 
 DJOSER = {
@@ -126,3 +179,105 @@ DJOSER = {
 }
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+SHOPPING_LIST_PDF_FONT = os.getenv(
+    'SHOPPING_LIST_PDF_FONT',
+    default='/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf',
+)
+
+# Общий для всех воркеров и контейнеров кэш: по умолчанию таблица в базе,
+# её создаёт команда createcachetable. CACHE_BACKEND и CACHE_LOCATION
+# позволяют подключить, например, Memcached.
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv(
+            'CACHE_BACKEND',
+            default='django.core.cache.backends.db.DatabaseCache',
+        ),
+        'LOCATION': os.getenv('CACHE_LOCATION', default='cache'),
+    }
+}
+
+API_CACHE = {
+    'ENABLED': os.getenv('API_CACHE_ENABLED', default='True') == 'True',
+    # Кэш ALIAS из CACHES. Ответы кэшируются, только если он общий для
+    # воркеров: в LocMemCache версия, сменённая в одном воркере, не
+    # дошла бы до остальных.
+    'ALIAS': os.getenv('API_CACHE_ALIAS', default='default'),
+    'TIMEOUT': int(os.getenv('API_CACHE_TIMEOUT', default=300)),
+}
+
+# index - поиск ингредиентов по индексу в памяти, db - запросом к базе.
+INGREDIENT_SEARCH = os.getenv('INGREDIENT_SEARCH', default='index')
+
+# Наибольшее число id в одном запросе пакетных эндпоинтов.
+BULK_MAX_ITEMS = int(os.getenv('BULK_MAX_ITEMS', default=500))
+
+FEED = {
+    # Сколько последних рецептов хранится в ленте подписчика.
+    'MAX_LENGTH': int(os.getenv('FEED_MAX_LENGTH', default=500)),
+    # Рецепты авторов с таким числом подписчиков не рассылаются по лентам,
+    # а подмешиваются при чтении.
+    'FANOUT_LIMIT': int(os.getenv('FEED_FANOUT_LIMIT', default=10000)),
+    # thread - рассылка в пуле потоков после ответа, sync - в запросе.
+    'EXECUTOR': os.getenv('FEED_EXECUTOR', default='thread'),
+    'WORKERS': int(os.getenv('FEED_WORKERS', default=1)),
+}
+
+USER_STATE = {
+    # Сколько секунд хранить id избранного, корзины и подписок
+    # пользователя в кэше ALIAS; 0 - загружать заново в каждом запросе.
+    'TIMEOUT': int(os.getenv('USER_STATE_TIMEOUT', default=0)),
+    'ALIAS': os.getenv('USER_STATE_ALIAS', default='default'),
+}
+
+METRICS = {
+    'ENABLED': os.getenv('METRICS_ENABLED', default='True') == 'True',
+    # /metrics отдаётся только с заголовком Authorization: Bearer
+    # <токен>; без токена эндпоинт отключён.
+    'TOKEN': os.getenv('METRICS_TOKEN', default=''),
+    'SLOW_REQUEST_SECONDS': float(
+        os.getenv('METRICS_SLOW_REQUEST_SECONDS', default=1)
+    ),
+    # Доля запросов, для которых сохраняется SQL для лога медленных.
+    'SLOW_LOG_SAMPLE_RATE': float(
+        os.getenv('METRICS_SLOW_LOG_SAMPLE_RATE', default=0)
+    ),
+    # Столько повторов одного SQL за запрос считаются признаком N+1.
+    'N_PLUS_ONE_THRESHOLD': int(
+        os.getenv('METRICS_N_PLUS_ONE_THRESHOLD', default=5)
+    ),
+    # Заголовок X-DB-Query-Count в ответах: для нагрузочных тестов и
+    # отладки, при DEBUG добавляется всегда.
+    'QUERY_COUNT_HEADER': os.getenv(
+        'METRICS_QUERY_COUNT_HEADER', default='False'
+    ) == 'True',
+}
+
+# Рецепты и подписки на чтение собираются из .values() без
+# ModelSerializer; ответ совпадает с обычными сериализаторами.
+FAST_SERIALIZERS = (
+    os.getenv('FAST_SERIALIZERS', default='True') == 'True'
+)
+
+PAGINATION_ESTIMATE_COUNT = (
+    os.getenv('PAGINATION_ESTIMATE_COUNT', default='False') == 'True'
+)
+
+RECIPE_IMAGES = {
+    # thread - пул потоков, process - пул процессов, sync - в запросе.
+    'EXECUTOR': os.getenv('RECIPE_IMAGES_EXECUTOR', default='thread'),
+    'WORKERS': int(os.getenv('RECIPE_IMAGES_WORKERS', default=2)),
+    'WIDTHS': [320, 640, 1280],
+    'FORMATS': ['webp', 'jpeg'],
+    'QUALITY': 80,
+    'MAX_PIXELS': 40_000_000,
+    'MAX_UPLOAD_SIZE': int(
+        os.getenv('RECIPE_IMAGES_MAX_UPLOAD_SIZE', default=10 * 1024 * 1024)
+    ),
+}
+
+# Тело JSON-запроса с фото в base64 длиннее файла на треть.
+DATA_UPLOAD_MAX_MEMORY_SIZE = (
+    RECIPE_IMAGES['MAX_UPLOAD_SIZE'] * 4 // 3 + 1024 * 1024
+)
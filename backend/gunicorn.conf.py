@@ -0,0 +1,5 @@
+import os
+
+# Число воркеров задаётся переменной WEB_CONCURRENCY (по умолчанию 1),
+# потоков синхронного воркера - GUNICORN_THREADS.
+threads = int(os.getenv('GUNICORN_THREADS', default=1))
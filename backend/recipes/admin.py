@@ -1,7 +1,7 @@
 from django.contrib import admin
 
 from recipes.models import (Favorite, Follow, Ingredient, IngredientAmount,
-                            Recipe, ShoppingCart, Tag)
+                            Recipe, ShoppingCart, ShoppingListItem, Tag)
 
 
 @admin.register(Ingredient)
@@ -25,10 +25,13 @@ class RecipeAdmin(admin.ModelAdmin):
     search_fields = ('name', )
     empty_value_display = '-пусто-'
 
+    readonly_fields = ('favorites_count', )
+
     def in_favorites(self, obj):
-        return Favorite.objects.filter(recipe=obj).count()
+        return obj.favorites_count
 
     in_favorites.short_description = 'Добавлен в избранное'
+    in_favorites.admin_order_field = 'favorites_count'
 
 
 @admin.register(IngredientAmount)
@@ -51,6 +54,13 @@ class ShoppingCartAdmin(admin.ModelAdmin):
     empty_value_display = '-пусто-'
 
 
+@admin.register(ShoppingListItem)
+class ShoppingListItemAdmin(admin.ModelAdmin):
+    list_display = ('id', 'user', 'ingredient', 'amount', )
+    search_fields = ('user__username', 'ingredient__name', )
+    empty_value_display = '-пусто-'
+
+
 @admin.register(Follow)
 class FollowAdmin(admin.ModelAdmin):
     list_display = (
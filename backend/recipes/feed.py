@@ -0,0 +1,184 @@
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import OuterRef, Q, Subquery
+
+from recipes.models import FeedEntry, Follow, Recipe
+from users.models import User
+
+BATCH_SIZE = 1000
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def trim_feeds(user_ids):
+    """Удаляет из лент записи старше последних FEED['MAX_LENGTH']."""
+    length = settings.FEED['MAX_LENGTH']
+    oldest_kept = FeedEntry.objects.filter(
+        user=OuterRef('user')
+    ).order_by('-pub_date').values('pub_date')[length - 1:length]
+    FeedEntry.objects.filter(
+        user_id__in=user_ids, pub_date__lt=Subquery(oldest_kept)
+    ).delete()
+
+
+def add_to_feeds(user_ids, recipes):
+    """Добавляет рецепты [(id, pub_date)] в ленты пользователей."""
+    user_ids = list(user_ids)
+    for start in range(0, len(user_ids), BATCH_SIZE):
+        batch = user_ids[start:start + BATCH_SIZE]
+        with transaction.atomic():
+            FeedEntry.objects.bulk_create(
+                (
+                    FeedEntry(
+                        user_id=user_id, recipe_id=recipe_id,
+                        pub_date=pub_date,
+                    )
+                    for user_id in batch
+                    for recipe_id, pub_date in recipes
+                ),
+                batch_size=BATCH_SIZE,
+                ignore_conflicts=True,
+            )
+            trim_feeds(batch)
+
+
+def fanned_out_followers(author_id):
+    """Подписчики автора, если его рецепты рассылаются по лентам."""
+    return Follow.objects.filter(
+        author_id=author_id,
+        author__followers_count__lt=settings.FEED['FANOUT_LIMIT'],
+    ).values_list('user_id', flat=True)
+
+
+def fan_out(recipe_id):
+    """Добавляет новый рецепт в ленты подписчиков автора.
+
+    Рецепты авторов, у которых подписчиков не меньше FANOUT_LIMIT, не
+    рассылаются: feed_recipes читает их напрямую.
+    """
+    recipe = Recipe.objects.filter(pk=recipe_id).values_list(
+        'author_id', 'pub_date'
+    ).first()
+    if recipe is None:
+        return
+    author_id, pub_date = recipe
+    add_to_feeds(fanned_out_followers(author_id), [(recipe_id, pub_date)])
+
+
+def backfill_feeds(author_ids):
+    """Рассылает последние рецепты авторов, которых больше не читают.
+
+    Пока у автора было не меньше FANOUT_LIMIT подписчиков, его рецепты
+    подмешивались при чтении и в ленты не попадали. Когда подписчиков
+    становится меньше, ленты оставшихся заполняются заново.
+    """
+    length = settings.FEED['MAX_LENGTH']
+    for author_id in author_ids:
+        recipes = list(Recipe.objects.filter(
+            author_id=author_id
+        ).order_by('-pub_date').values_list('id', 'pub_date')[:length])
+        add_to_feeds(fanned_out_followers(author_id), recipes)
+
+
+def _in_background(function, *args):
+    try:
+        function(*args)
+    except Exception:
+        logger.exception(
+            'Ошибка обновления лент: %s%s', function.__name__, args
+        )
+    finally:
+        connection.close()
+
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.FEED['WORKERS'],
+                thread_name_prefix='feed',
+            )
+        return _executor
+
+
+def _submit(function, *args):
+    if settings.FEED['EXECUTOR'] == 'sync':
+        function(*args)
+    else:
+        get_executor().submit(_in_background, function, *args)
+
+
+def schedule_fan_out(recipe):
+    """Рассылает рецепт после коммита, вне потока запроса."""
+    recipe_id = recipe.id
+    transaction.on_commit(lambda: _submit(fan_out, recipe_id))
+
+
+def schedule_backfill(author_ids):
+    """Заполняет ленты, если у авторов стало меньше FANOUT_LIMIT подписчиков.
+
+    Вызывается после уменьшения счётчика, поэтому порог пересекает
+    ровно одна отписка.
+    """
+    author_ids = list(User.objects.filter(
+        pk__in=author_ids,
+        followers_count=settings.FEED['FANOUT_LIMIT'] - 1,
+    ).values_list('pk', flat=True))
+    if author_ids:
+        transaction.on_commit(lambda: _submit(backfill_feeds, author_ids))
+
+
+def authors_followed(user_id, author_ids):
+    """Заполняет ленту последними рецептами новых авторов."""
+    length = settings.FEED['MAX_LENGTH']
+    recipes = Recipe.objects.filter(
+        author_id__in=author_ids,
+        author__followers_count__lt=settings.FEED['FANOUT_LIMIT'],
+    ).order_by('-pub_date').values_list('id', 'pub_date')[:length]
+    FeedEntry.objects.bulk_create(
+        (
+            FeedEntry(user_id=user_id, recipe_id=recipe_id, pub_date=pub_date)
+            for recipe_id, pub_date in recipes
+        ),
+        batch_size=BATCH_SIZE,
+        ignore_conflicts=True,
+    )
+    trim_feeds([user_id])
+
+
+def authors_unfollowed(user_id, author_ids):
+    FeedEntry.objects.filter(
+        user_id=user_id, recipe__author_id__in=author_ids
+    ).delete()
+
+
+def feed_recipes(user):
+    """Рецепты ленты: из таблицы лент и от авторов без рассылки."""
+    return Recipe.objects.filter(
+        Q(pk__in=FeedEntry.objects.filter(user=user).values('recipe'))
+        | Q(author__in=Follow.objects.filter(
+            user=user,
+            author__followers_count__gte=settings.FEED['FANOUT_LIMIT'],
+        ).values('author'))
+    )
+
+
+@transaction.atomic
+def rebuild_feeds():
+    """Пересобирает ленты всех пользователей по подпискам."""
+    FeedEntry.objects.all().delete()
+    followed = {}
+    for user_id, author_id in Follow.objects.values_list(
+        'user_id', 'author_id'
+    ).iterator():
+        followed.setdefault(user_id, []).append(author_id)
+    for user_id, author_ids in followed.items():
+        authors_followed(user_id, author_ids)
@@ -0,0 +1,167 @@
+import io
+import logging
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connection, transaction
+from django.dispatch import Signal
+from PIL import Image, ImageOps
+
+from recipes.models import Recipe
+
+EXTENSIONS = {'jpeg': 'jpg', 'webp': 'webp', 'png': 'png'}
+
+logger = logging.getLogger(__name__)
+
+image_processed = Signal()
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _save(image, name, image_format):
+    buffer = io.BytesIO()
+    options = {'optimize': True}
+    if image_format in ('jpeg', 'webp'):
+        options['quality'] = settings.RECIPE_IMAGES['QUALITY']
+    image.save(buffer, format=image_format.upper(), **options)
+    return default_storage.save(name, ContentFile(buffer.getvalue()))
+
+
+def render_image(name, recipe_id):
+    """Очищает оригинал от метаданных и готовит уменьшенные копии.
+
+    Работает только с файлами, поэтому может выполняться в отдельном
+    процессе. Возвращает имя нового оригинала и словарь копий
+    {ширина: {формат: имя файла}}. Оригинал всегда сохраняется под
+    новым именем, прежний файл удаляет save_rendered_image.
+    """
+    config = settings.RECIPE_IMAGES
+    with default_storage.open(name) as file:
+        image = Image.open(file)
+        if image.width * image.height > config['MAX_PIXELS']:
+            raise ValueError(f'Изображение {name} слишком большое')
+        original_format = (image.format or 'jpeg').lower()
+        image = ImageOps.exif_transpose(image)
+        image.load()
+    if original_format not in EXTENSIONS:
+        original_format = 'jpeg'
+    if image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA' if 'A' in image.getbands() else 'RGB')
+    stem = os.path.splitext(os.path.basename(name))[0]
+    original = _save(
+        image if original_format != 'jpeg' else image.convert('RGB'),
+        f'recipes/{stem}.{EXTENSIONS[original_format]}',
+        original_format,
+    )
+    thumbnails = {}
+    for width in config['WIDTHS']:
+        if width >= image.width:
+            continue
+        resized = image.copy()
+        resized.thumbnail((width, image.height), Image.LANCZOS)
+        thumbnails[str(width)] = {
+            image_format: _save(
+                resized if image_format != 'jpeg' else resized.convert('RGB'),
+                f'recipes/thumbnails/{recipe_id}/{stem}-{width}.'
+                f'{EXTENSIONS[image_format]}',
+                image_format,
+            )
+            for image_format in config['FORMATS']
+        }
+    return original, thumbnails
+
+
+def delete_image_files(name, thumbnails):
+    """Удаляет оригинал и уменьшенные копии изображения."""
+    for file_name in [name] + [
+        file_name for files in thumbnails.values()
+        for file_name in files.values()
+    ]:
+        if file_name:
+            default_storage.delete(file_name)
+
+
+def save_rendered_image(recipe_id, name, original, thumbnails):
+    """Сохраняет результат, если изображение рецепта не сменилось.
+
+    Прежний оригинал удаляется после того, как рецепт ссылается на
+    новый. Если изображение успели заменить, удаляется результат.
+    """
+    updated = Recipe.objects.filter(pk=recipe_id, image=name).update(
+        image=original, thumbnails=thumbnails
+    )
+    if not updated:
+        delete_image_files(original, thumbnails)
+        return
+    image_processed.send(sender=Recipe, recipe_id=recipe_id)
+    if original != name:
+        default_storage.delete(name)
+
+
+def process_recipe_image(recipe_id, name):
+    save_rendered_image(recipe_id, name, *render_image(name, recipe_id))
+
+
+def _in_background(function, *args):
+    try:
+        function(*args)
+    except Exception:
+        logger.exception('Ошибка обработки изображения рецепта %s', args[0])
+    finally:
+        connection.close()
+
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            config = settings.RECIPE_IMAGES
+            executor_class = (
+                ProcessPoolExecutor if config['EXECUTOR'] == 'process'
+                else ThreadPoolExecutor
+            )
+            _executor = executor_class(max_workers=config['WORKERS'])
+        return _executor
+
+
+def _submit(recipe_id, name):
+    executor = settings.RECIPE_IMAGES['EXECUTOR']
+    if executor == 'sync':
+        process_recipe_image(recipe_id, name)
+    elif executor == 'process':
+        def done(future):
+            if future.exception() is not None:
+                logger.error(
+                    'Ошибка обработки изображения рецепта %s',
+                    recipe_id, exc_info=future.exception(),
+                )
+                return
+            _in_background(
+                save_rendered_image, recipe_id, name, *future.result()
+            )
+
+        get_executor().submit(
+            render_image, name, recipe_id
+        ).add_done_callback(done)
+    else:
+        get_executor().submit(
+            _in_background, process_recipe_image, recipe_id, name
+        )
+
+
+def schedule_image_deletion(name, thumbnails):
+    """Удаляет файлы заменённого изображения после коммита."""
+    transaction.on_commit(lambda: delete_image_files(name, thumbnails))
+
+
+def schedule_image_processing(recipe):
+    """Ставит обработку изображения рецепта в очередь после коммита."""
+    if not recipe.image:
+        return
+    recipe_id, name = recipe.id, recipe.image.name
+    transaction.on_commit(lambda: _submit(recipe_id, name))
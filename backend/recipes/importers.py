@@ -0,0 +1,339 @@
+import csv
+import json
+from collections import Counter
+from itertools import islice
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.db.models import Count, F, Max, Min
+
+from recipes.models import (Ingredient, IngredientAmount, Recipe,
+                            RecipeSearchTerm, Tag)
+from recipes.search import (build_search_terms, update_search_vectors,
+                            uses_postgres)
+from recipes.services import bulk_relations, change_counter
+from users.models import User
+
+BATCH_SIZE = 1000
+JSON_CHUNK_SIZE = 64 * 1024
+
+
+class ImportRowError(ValueError):
+    """Строка ссылается на то, чего нет в базе."""
+
+
+def read_csv(file, fieldnames):
+    """Строки CSV как словари; строка заголовка пропускается, если есть."""
+    reader = csv.reader(file)
+    for number, row in enumerate(reader):
+        if not row:
+            continue
+        if number == 0 and tuple(row) == tuple(fieldnames):
+            continue
+        yield dict(zip(fieldnames, row))
+
+
+def read_json(file):
+    """Объекты из JSON-массива или JSON Lines без чтения файла целиком."""
+    decoder = json.JSONDecoder()
+    buffer = ''
+    position = 0
+    eof = False
+    while True:
+        while position < len(buffer) and buffer[position] in ' \t\r\n,[':
+            position += 1
+        if position < len(buffer) and buffer[position] == ']':
+            return
+        try:
+            item, end = decoder.raw_decode(buffer, position)
+        except json.JSONDecodeError:
+            if eof:
+                if buffer[position:].strip():
+                    raise
+                return
+            chunk = file.read(JSON_CHUNK_SIZE)
+            eof = not chunk
+            buffer = buffer[position:] + chunk
+            position = 0
+            continue
+        yield item
+        position = end
+
+
+def batched(rows, size):
+    rows = iter(rows)
+    batch = list(islice(rows, size))
+    while batch:
+        yield batch
+        batch = list(islice(rows, size))
+
+
+class Importer:
+    """Пакетная загрузка объектов одной модели."""
+
+    model = None
+    csv_fields = None
+
+    def __init__(self, batch_size=BATCH_SIZE):
+        self.batch_size = batch_size
+
+    def build(self, row):
+        raise NotImplementedError
+
+    def save_batch(self, objects):
+        self.model.objects.bulk_create(
+            objects, batch_size=self.batch_size, ignore_conflicts=True
+        )
+
+    def run(self, rows, dry_run=False, progress=None):
+        """Загружает строки в одной транзакции, возвращает число новых."""
+        with transaction.atomic():
+            before = self.model.objects.count()
+            self.processed = 0
+            for batch in batched(rows, self.batch_size):
+                self.save_batch(
+                    [obj for obj in map(self.build, batch) if obj is not None]
+                )
+                self.processed += len(batch)
+                if progress:
+                    progress(self.processed)
+            created = self.model.objects.count() - before
+            if dry_run:
+                transaction.set_rollback(True)
+        return created
+
+
+class IngredientImporter(Importer):
+    model = Ingredient
+    csv_fields = ('name', 'measurement_unit')
+
+    def build(self, row):
+        return Ingredient(
+            name=row['name'].strip(),
+            measurement_unit=row['measurement_unit'].strip(),
+        )
+
+
+class TagImporter(Importer):
+    model = Tag
+    csv_fields = ('name', 'color', 'slug')
+
+    def build(self, row):
+        return Tag(name=row['name'], color=row['color'], slug=row['slug'])
+
+
+class UserImporter(Importer):
+    """Пользователи; одинаковые пароли хэшируются один раз."""
+
+    model = User
+    csv_fields = ('email', 'username', 'first_name', 'last_name', 'password')
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.hashes = {}
+
+    def make_password(self, password):
+        if password not in self.hashes:
+            self.hashes[password] = make_password(password)
+        return self.hashes[password]
+
+    def build(self, row):
+        return User(
+            email=row['email'],
+            username=row['username'],
+            first_name=row.get('first_name', ''),
+            last_name=row.get('last_name', ''),
+            password=self.make_password(row.get('password') or None),
+        )
+
+
+class RecipeImporter(Importer):
+    """Рецепты с тегами и ингредиентами.
+
+    Автор задаётся email, теги - списком слагов, ингредиенты - списком
+    объектов с name и measurement_unit (или id) и amount. Единицу можно
+    не указывать, если ингредиент с таким названием один. Рецепт,
+    который уже есть у автора с тем же названием, пропускается.
+    Неизвестный тег или ингредиент, как и название без единицы, под
+    которым несколько ингредиентов, останавливает загрузку с
+    ImportRowError. Id назначаются заранее,
+    чтобы связать теги и ингредиенты без повторного чтения рецептов.
+    """
+
+    model = Recipe
+
+    def run(self, rows, dry_run=False, progress=None):
+        self.tags = dict(Tag.objects.values_list('slug', 'id'))
+        self.ingredients, self.units = {}, {}
+        for ingredient_id, name, unit in Ingredient.objects.values_list(
+            'id', 'name', 'measurement_unit'
+        ):
+            self.ingredients[name, unit] = ingredient_id
+            self.units.setdefault(name, []).append(unit)
+        self.ingredient_ids = set(self.ingredients.values())
+        with transaction.atomic():
+            self.next_id = (
+                Recipe.objects.aggregate(last=Max('id'))['last'] or 0
+            ) + 1
+            created = super().run(rows, dry_run, progress)
+            if not dry_run:
+                with connection.cursor() as cursor:
+                    for sql in connection.ops.sequence_reset_sql(
+                        no_style(), [Recipe]
+                    ):
+                        cursor.execute(sql)
+            return created
+
+    def tag_id(self, number, slug):
+        if slug not in self.tags:
+            raise ImportRowError(f'Строка {number}: нет тега {slug}')
+        return self.tags[slug]
+
+    def ingredient_id(self, number, item):
+        if 'id' in item:
+            if item['id'] not in self.ingredient_ids:
+                raise ImportRowError(
+                    f'Строка {number}: нет ингредиента с id {item["id"]}'
+                )
+            return item['id']
+        name = item['name']
+        units = self.units.get(name, [])
+        unit = item.get('measurement_unit')
+        if unit is None:
+            if len(units) > 1:
+                raise ImportRowError(
+                    f'Строка {number}: ингредиент {name} неоднозначен, '
+                    f'укажите measurement_unit: {", ".join(sorted(units))}'
+                )
+            unit = units[0] if units else None
+        if (name, unit) not in self.ingredients:
+            raise ImportRowError(
+                f'Строка {number}: нет ингредиента {name}'
+                + (f' ({unit})' if unit is not None else '')
+            )
+        return self.ingredients[name, unit]
+
+    def build(self, row):
+        return row
+
+    def save_batch(self, rows):
+        authors = dict(User.objects.filter(
+            email__in={row['author'] for row in rows}
+        ).values_list('email', 'id'))
+        existing = set(Recipe.objects.filter(
+            author_id__in=authors.values(),
+            name__in={row['name'] for row in rows},
+        ).values_list('author_id', 'name'))
+        recipes, tags, amounts = [], [], []
+        for number, row in enumerate(rows, self.processed + 1):
+            author_id = authors.get(row['author'])
+            if author_id is None or (author_id, row['name']) in existing:
+                continue
+            existing.add((author_id, row['name']))
+            recipe = Recipe(
+                id=self.next_id,
+                author_id=author_id,
+                name=row['name'],
+                text=row['text'],
+                cooking_time=row['cooking_time'],
+                image=row.get('image', ''),
+            )
+            self.next_id += 1
+            recipes.append(recipe)
+            tags.extend(
+                Recipe.tags.through(
+                    recipe_id=recipe.id, tag_id=self.tag_id(number, slug)
+                )
+                for slug in row.get('tags', [])
+            )
+            amounts.extend(
+                IngredientAmount(
+                    recipe_id=recipe.id,
+                    ingredient_id=self.ingredient_id(number, item),
+                    amount=item['amount'],
+                )
+                for item in row.get('ingredients', [])
+            )
+        Recipe.objects.bulk_create(recipes, batch_size=self.batch_size)
+        change_counter(
+            User, 'recipes_count',
+            Counter(recipe.author_id for recipe in recipes),
+        )
+        Recipe.tags.through.objects.bulk_create(
+            tags, batch_size=self.batch_size, ignore_conflicts=True
+        )
+        IngredientAmount.objects.bulk_create(
+            amounts, batch_size=self.batch_size, ignore_conflicts=True
+        )
+        if uses_postgres():
+            update_search_vectors(Recipe.objects.filter(
+                pk__in=[recipe.id for recipe in recipes]
+            ))
+        else:
+            RecipeSearchTerm.objects.bulk_create(
+                (
+                    term for recipe in recipes
+                    for term in build_search_terms(recipe)
+                ),
+                batch_size=self.batch_size,
+            )
+
+
+def merge_duplicate_ingredients():
+    """Объединяет ингредиенты с одинаковыми названием и единицей.
+
+    Остаётся ингредиент с меньшим id, рецепты переводятся на него, а
+    количества одного ингредиента в рецепте складываются. Работает и
+    со схемой до миграции с ограничением unique_ingredient_unit, поэтому
+    списки покупок здесь не меняются: их пересобирает вызывающий код.
+    Возвращает число удалённых дубликатов.
+    """
+    removed = []
+    groups = Ingredient.objects.values(
+        'name', 'measurement_unit'
+    ).annotate(keep=Min('id'), count=Count('id')).filter(count__gt=1)
+    with bulk_relations():
+        for group in groups:
+            duplicates = list(Ingredient.objects.filter(
+                name=group['name'],
+                measurement_unit=group['measurement_unit'],
+            ).exclude(pk=group['keep']).values_list('id', flat=True))
+            kept = dict(IngredientAmount.objects.filter(
+                ingredient_id=group['keep']
+            ).values_list('recipe_id', 'id'))
+            for amount in IngredientAmount.objects.filter(
+                ingredient_id__in=duplicates
+            ).values('id', 'recipe_id', 'amount'):
+                if amount['recipe_id'] in kept:
+                    IngredientAmount.objects.filter(
+                        pk=kept[amount['recipe_id']]
+                    ).update(amount=F('amount') + amount['amount'])
+                    IngredientAmount.objects.filter(
+                        pk=amount['id']
+                    ).delete()
+                else:
+                    IngredientAmount.objects.filter(pk=amount['id']).update(
+                        ingredient_id=group['keep']
+                    )
+                    kept[amount['recipe_id']] = amount['id']
+            removed.extend(duplicates)
+    # Удаление через ORM обратилось бы к таблицам, которых до миграции
+    # ещё нет, поэтому ингредиенты удаляются запросом.
+    table = connection.ops.quote_name(Ingredient._meta.db_table)
+    with connection.cursor() as cursor:
+        for batch in batched(removed, BATCH_SIZE):
+            cursor.execute(
+                f'DELETE FROM {table} WHERE id IN '
+                f'({", ".join(["%s"] * len(batch))})',
+                batch,
+            )
+    return len(removed)
+
+
+IMPORTERS = {
+    'ingredients': IngredientImporter,
+    'tags': TagImporter,
+    'users': UserImporter,
+    'recipes': RecipeImporter,
+}
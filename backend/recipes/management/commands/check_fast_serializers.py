@@ -0,0 +1,143 @@
+import statistics
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test import override_settings
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import (APIClient, APIRequestFactory,
+                                 force_authenticate)
+
+from api.fast_serializers import recipe_values, serialize_recipes
+from api.renderers import FastJSONRenderer
+from api.serializers import RecipeSerializer
+from recipes.models import Recipe, Tag
+from users.models import User
+
+
+class Command(BaseCommand):
+    help = (
+        'Контракт быстрых сериализаторов: ответы API рецептов, ленты и '
+        'подписок с FAST_SERIALIZERS=True и False должны совпадать до '
+        'байта. С --benchmark измеряет процессорное время на 100 рецептов.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--benchmark',
+            action='store_true',
+            help='Сравнить процессорное время обычного и быстрого пути',
+        )
+        parser.add_argument('--recipes', type=int, default=100)
+        parser.add_argument('--repeat', type=int, default=20)
+
+    def get_urls(self, user):
+        recipe = Recipe.objects.order_by('-favorites_count').first()
+        tag = Tag.objects.first()
+        if recipe is None or tag is None:
+            raise CommandError('Для проверки нужны рецепты и теги')
+        word = recipe.name.split()[0]
+        anonymous = [
+            '/api/recipes/',
+            '/api/recipes/?page=2&limit=3',
+            f'/api/recipes/?tags={tag.slug}',
+            f'/api/recipes/?author={recipe.author_id}',
+            f'/api/recipes/?search={word}',
+            '/api/recipes/?pagination=cursor&limit=3',
+            '/api/recipes/?ordering=-favorites_count',
+            f'/api/recipes/{recipe.id}/',
+            '/api/recipes/0/',
+        ]
+        authenticated = anonymous + [
+            '/api/recipes/?is_favorited=1',
+            '/api/recipes/?is_in_shopping_cart=1',
+            '/api/users/subscriptions/',
+            '/api/users/subscriptions/?recipes_limit=2',
+            '/api/users/feed/',
+        ]
+        return [(None, url) for url in anonymous] + [
+            (user, url) for url in authenticated
+        ]
+
+    def get(self, user, url, fast):
+        client = APIClient()
+        client.force_authenticate(user)
+        with override_settings(FAST_SERIALIZERS=fast):
+            return client.get(url)
+
+    def check_contract(self, user):
+        mismatches = 0
+        for current_user, url in self.get_urls(user):
+            slow = self.get(current_user, url, False)
+            fast = self.get(current_user, url, True)
+            who = current_user.username if current_user else 'аноним'
+            if slow.status_code != fast.status_code:
+                problem = f'статус {slow.status_code} != {fast.status_code}'
+            elif slow.content != fast.content:
+                problem = 'JSON отличается'
+            elif (hasattr(slow, 'data')
+                    and JSONRenderer().render(slow.data) != slow.content):
+                problem = 'FastJSONRenderer отличается от JSONRenderer'
+            else:
+                self.stdout.write(f'{who} {url}: совпадает')
+                continue
+            mismatches += 1
+            self.stdout.write(self.style.ERROR(f'{who} {url}: {problem}'))
+        return mismatches
+
+    def measure(self, function, repeat):
+        timings = []
+        for _ in range(repeat):
+            start = time.process_time()
+            function()
+            timings.append(time.process_time() - start)
+        return statistics.median(timings)
+
+    def benchmark(self, user, options):
+        count = options['recipes']
+        request = APIRequestFactory().get('/api/recipes/')
+        force_authenticate(request, user)
+        request = Request(request)
+        recipes = Recipe.objects.with_user_flags(user)
+
+        def slow():
+            data = RecipeSerializer(
+                recipes.with_related(user)[:count],
+                many=True,
+                context={'request': request},
+            ).data
+            return JSONRenderer().render(data)
+
+        def fast():
+            return FastJSONRenderer().render(serialize_recipes(
+                recipe_values(recipes, user)[:count], request
+            ))
+
+        if slow() != fast():
+            raise CommandError('Результаты обычного и быстрого пути разные')
+        scale = 100 / min(count, Recipe.objects.count())
+        slow_time = self.measure(slow, options['repeat']) * scale
+        fast_time = self.measure(fast, options['repeat']) * scale
+        self.stdout.write(
+            f'Процессорное время на 100 рецептов: '
+            f'обычный путь {slow_time * 1000:.1f} мс, '
+            f'быстрый {fast_time * 1000:.1f} мс, '
+            f'ускорение {slow_time / fast_time:.1f}x'
+        )
+
+    def handle(self, *args, **options):
+        user = User.objects.filter(follower__isnull=False).first()
+        if user is None:
+            raise CommandError('Для проверки нужен пользователь с подписками')
+        api_cache = dict(settings.API_CACHE, ENABLED=False)
+        with override_settings(
+            API_CACHE=api_cache,
+            ALLOWED_HOSTS=settings.ALLOWED_HOSTS + ['testserver'],
+        ):
+            mismatches = self.check_contract(user)
+            if options['benchmark']:
+                self.benchmark(user, options)
+        if mismatches:
+            raise CommandError(f'Расхождений: {mismatches}')
+        self.stdout.write(self.style.SUCCESS('Ответы совпадают'))
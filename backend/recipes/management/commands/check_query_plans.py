@@ -0,0 +1,54 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from api.query_plans import QueryPlanError, query_plans, scanned_tables
+
+
+class Command(BaseCommand):
+    help = (
+        'Проверка планов запросов, которые выполняют представления API: '
+        'ошибка, если какой-либо запрос полностью сканирует таблицу. '
+        'Запускать на базе, заполненной большим объёмом данных.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--allow',
+            nargs='*',
+            default=['recipes_tag'],
+            help='Таблицы, полное сканирование которых допустимо',
+        )
+        parser.add_argument(
+            '--force-index',
+            action='store_true',
+            help='PostgreSQL: запретить полное сканирование, если есть '
+                 'индекс, для проверки на маленькой базе',
+        )
+        parser.add_argument(
+            '--verbose-plans',
+            action='store_true',
+            help='Выводить планы всех запросов',
+        )
+
+    def handle(self, *args, **options):
+        try:
+            plans = query_plans(options['force_index'])
+        except QueryPlanError as error:
+            raise CommandError(error)
+        failures = 0
+        for name, sql, plan in plans:
+            if options['verbose_plans']:
+                self.stdout.write(f'{name}:\n{sql}\n{plan}\n')
+            tables = scanned_tables(plan, options['allow'])
+            if tables:
+                failures += 1
+                self.stdout.write(self.style.ERROR(
+                    f'{name}: полное сканирование {", ".join(tables)}'
+                ))
+                self.stdout.write(f'{sql}\n{plan}')
+        if failures:
+            raise CommandError(
+                f'Полное сканирование в запросах: {failures}'
+            )
+        self.stdout.write(self.style.SUCCESS(
+            f'Полных сканирований нет, проверено запросов: {len(plans)}'
+        ))
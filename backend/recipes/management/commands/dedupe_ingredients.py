@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from recipes.importers import merge_duplicate_ingredients
+from recipes.models import ShoppingListItem
+from recipes.services import rebuild_shopping_lists
+
+
+class Command(BaseCommand):
+    help = (
+        'Объединение ингредиентов с одинаковыми названием и единицей '
+        'измерения. Выполняется перед migrate, если старый load_data '
+        'запускался несколько раз.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Объединить и откатить транзакцию',
+        )
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            removed = merge_duplicate_ingredients()
+            if removed and (
+                ShoppingListItem._meta.db_table
+                in connection.introspection.table_names()
+            ):
+                rebuild_shopping_lists()
+            if options['dry_run']:
+                transaction.set_rollback(True)
+        self.stdout.write(self.style.SUCCESS(
+            f'Удалено дубликатов ингредиентов: {removed}'
+        ))
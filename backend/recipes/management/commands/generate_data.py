@@ -0,0 +1,45 @@
+from django.core.management.base import BaseCommand
+
+from recipes.synthetic import generate_data
+
+
+class Command(BaseCommand):
+    help = 'Синтетические данные для нагрузочного тестирования API'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=100)
+        parser.add_argument('--recipes', type=int, default=1000)
+        parser.add_argument(
+            '--ingredients-per-recipe', type=int, default=6,
+        )
+        parser.add_argument('--favorites-per-user', type=int, default=20)
+        parser.add_argument('--carts-per-user', type=int, default=5)
+        parser.add_argument('--follows-per-user', type=int, default=10)
+        parser.add_argument(
+            '--skew',
+            type=float,
+            default=1.0,
+            help='Показатель Ципфа для популярности авторов и рецептов, '
+                 '0 - равномерно',
+        )
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument(
+            '--password',
+            default='benchmark',
+            help='Пароль всех созданных пользователей',
+        )
+
+    def handle(self, *args, **options):
+        generate_data(
+            users=options['users'],
+            recipes=options['recipes'],
+            ingredients_per_recipe=options['ingredients_per_recipe'],
+            favorites_per_user=options['favorites_per_user'],
+            carts_per_user=options['carts_per_user'],
+            follows_per_user=options['follows_per_user'],
+            skew=options['skew'],
+            seed=options['seed'],
+            password=options['password'],
+            progress=self.stdout.write,
+        )
+        self.stdout.write(self.style.SUCCESS('Данные сгенерированы'))
@@ -1,33 +1,71 @@
-import csv
 import os
 
-from django.db.utils import IntegrityError
 from django.conf import settings
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
 
-from recipes.models import Ingredient
+from recipes.importers import (BATCH_SIZE, IMPORTERS, ImportRowError,
+                               read_csv, read_json)
 
 FILE_DIR = os.path.join(settings.BASE_DIR, 'data')
 
 
 class Command(BaseCommand):
-    help = 'Загрузка из csv файла'
-
-    def handle(self, *args, **kwargs):
-        with open(
-            os.path.join(FILE_DIR, 'ingredients.csv'), 'r', encoding='utf-8'
-        ) as file:
-            reader = csv.reader(file)
-            next(reader)
-            for row in reader:
-                name, measurement_unit = row
-                try:
-                    Ingredient.objects.create(
-                        name=name,
-                        measurement_unit=measurement_unit
-                    )
-                except IntegrityError:
-                    self.stdout.write(
-                        f'Ингредиент {name} уже существует в базе данных'
-                    )
-        self.stdout.write(self.style.SUCCESS('Все ингридиенты загружены!'))
+    help = 'Загрузка ингредиентов, тегов, пользователей и рецептов'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path',
+            nargs='?',
+            default=os.path.join(FILE_DIR, 'ingredients.csv'),
+            help='Файл CSV или JSON (по умолчанию data/ingredients.csv)',
+        )
+        parser.add_argument(
+            '--model',
+            choices=sorted(IMPORTERS),
+            default='ingredients',
+            help='Что загружать',
+        )
+        parser.add_argument(
+            '--format',
+            choices=('csv', 'json'),
+            help='Формат файла, по умолчанию по расширению',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=BATCH_SIZE,
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Загрузить и откатить транзакцию',
+        )
+
+    def progress(self, processed):
+        self.stdout.write(f'Обработано строк: {processed}')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        file_format = options['format'] or (
+            'json' if path.endswith(('.json', '.jsonl')) else 'csv'
+        )
+        importer = IMPORTERS[options['model']](options['batch_size'])
+        if file_format == 'csv' and importer.csv_fields is None:
+            raise CommandError('Этот тип данных загружается только из JSON')
+        with open(path, 'r', encoding='utf-8') as file:
+            rows = (
+                read_json(file) if file_format == 'json'
+                else read_csv(file, importer.csv_fields)
+            )
+            try:
+                created = importer.run(
+                    rows, dry_run=options['dry_run'], progress=self.progress
+                )
+            except ImportRowError as error:
+                raise CommandError(error)
+        if options['dry_run']:
+            self.stdout.write(self.style.WARNING(
+                f'Пробный запуск, было бы добавлено: {created}'
+            ))
+        else:
+            self.stdout.write(self.style.SUCCESS(f'Добавлено: {created}'))
@@ -0,0 +1,120 @@
+import base64
+import gc
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.test import override_settings
+from rest_framework.test import APIClient
+
+from api.benchmark import large_image
+from recipes.models import Ingredient, Recipe, Tag
+from users.models import User
+
+
+def peak_rss():
+    """Пиковый RSS процесса в байтах."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+class Command(BaseCommand):
+    help = (
+        'Пиковый RSS при загрузке рецепта с большим фото в base64. '
+        'Рецепт создаётся в транзакции, которая откатывается.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--size',
+            type=float,
+            default=8,
+            help='Размер фото в МБ, не больше RECIPE_IMAGES_MAX_UPLOAD_SIZE',
+        )
+        parser.add_argument('--body', help='Файл с телом запроса')
+
+    def get_body(self, size):
+        tag = Tag.objects.first()
+        ingredient = Ingredient.objects.first()
+        if tag is None or ingredient is None:
+            raise CommandError('Для загрузки нужны теги и ингредиенты')
+        image = base64.b64encode(large_image(size))
+        return json.dumps({
+            'name': 'Рецепт с большим фото',
+            'text': 'Создан командой measure_upload_memory',
+            'cooking_time': 10,
+            'tags': [tag.id],
+            'ingredients': [{'id': ingredient.id, 'amount': 10}],
+            'image': 'data:image/png;base64,',
+        }).encode().replace(
+            b'base64,"', b'base64,' + image + b'"'
+        )
+
+    def upload(self, user, body):
+        client = APIClient()
+        client.force_authenticate(user)
+        with transaction.atomic():
+            response = client.post(
+                '/api/recipes/', body, content_type='application/json'
+            )
+            image = None
+            if response.status_code == 201:
+                image = Recipe.objects.get(pk=response.json()['id']).image
+            transaction.set_rollback(True)
+        if image:
+            default_storage.delete(image.name)
+        return response
+
+    def handle(self, *args, **options):
+        """Загрузка измеряется в новом процессе с --body.
+
+        Пиковый RSS нельзя сбросить, а при подготовке фото создаются
+        временные копии, поэтому тело запроса передаётся через файл.
+        """
+        if options['body']:
+            return self.measure(options['body'])
+        with tempfile.NamedTemporaryFile(suffix='.json') as file:
+            file.write(self.get_body(int(options['size'] * 1024 * 1024)))
+            file.flush()
+            result = subprocess.run(
+                [
+                    sys.executable,
+                    os.path.join(settings.BASE_DIR, 'manage.py'),
+                    'measure_upload_memory', '--body', file.name,
+                ],
+                stdout=subprocess.PIPE,
+                stderr=subprocess.STDOUT,
+                universal_newlines=True,
+            )
+        if result.returncode:
+            raise CommandError(result.stdout.strip())
+        self.stdout.write(result.stdout.strip())
+
+    def measure(self, path):
+        user = User.objects.first()
+        if user is None:
+            raise CommandError('Для загрузки нужен пользователь')
+        with open(path, 'rb') as file:
+            body = file.read()
+        gc.collect()
+        before = peak_rss()
+        with override_settings(
+            ALLOWED_HOSTS=settings.ALLOWED_HOSTS + ['testserver'],
+        ):
+            response = self.upload(user, body)
+        growth = peak_rss() - before
+        if response.status_code != 201:
+            raise CommandError(
+                f'Ответ {response.status_code}: {response.content[:200]}'
+            )
+        self.stdout.write(
+            f'Тело запроса {len(body) / 2 ** 20:.1f} МБ, '
+            f'пиковый RSS вырос на {growth / 2 ** 20:.1f} МБ'
+        )
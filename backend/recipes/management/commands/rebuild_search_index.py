@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from recipes.importers import BATCH_SIZE, batched
+from recipes.models import Recipe
+from recipes.search import index_recipe, update_search_vectors, uses_postgres
+
+
+class Command(BaseCommand):
+    help = 'Пересборка поискового индекса рецептов'
+
+    def handle(self, *args, **kwargs):
+        if uses_postgres():
+            ids = Recipe.objects.order_by('id').values_list('id', flat=True)
+            count = 0
+            for batch in batched(ids.iterator(), BATCH_SIZE):
+                count += update_search_vectors(
+                    Recipe.objects.filter(pk__in=batch)
+                )
+                self.stdout.write(f'Проиндексировано рецептов: {count}')
+        else:
+            recipes = Recipe.objects.only('id', 'name', 'text')
+            for count, recipe in enumerate(recipes.iterator(), start=1):
+                index_recipe(recipe)
+                if count % 1000 == 0:
+                    self.stdout.write(f'Проиндексировано рецептов: {count}')
+        self.stdout.write(self.style.SUCCESS('Поисковый индекс пересобран'))
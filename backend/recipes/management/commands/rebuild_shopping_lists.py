@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from recipes.services import (live_shopping_list_totals,
+                              rebuild_shopping_lists,
+                              stored_shopping_list_totals)
+
+
+class Command(BaseCommand):
+    help = 'Пересборка и проверка сохранённых списков покупок'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check',
+            action='store_true',
+            help='Только сравнить с корзинами, ничего не меняя',
+        )
+
+    def handle(self, *args, **options):
+        if not options['check']:
+            rebuild_shopping_lists()
+            self.stdout.write(self.style.SUCCESS('Списки покупок пересобраны'))
+        live = live_shopping_list_totals()
+        stored = stored_shopping_list_totals()
+        mismatches = [
+            (key, live.get(key), stored.get(key))
+            for key in set(live) | set(stored)
+            if live.get(key) != stored.get(key)
+        ]
+        for (user_id, ingredient_id), expected, actual in mismatches:
+            self.stdout.write(
+                f'Пользователь {user_id}, ингредиент {ingredient_id}: '
+                f'ожидается {expected}, сохранено {actual}'
+            )
+        if mismatches:
+            raise CommandError(f'Расхождений: {len(mismatches)}')
+        self.stdout.write(self.style.SUCCESS('Расхождений нет'))
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from recipes.services import counter_mismatches, reconcile_counters
+
+
+class Command(BaseCommand):
+    help = 'Пересчёт и проверка счётчиков избранного, рецептов и подписчиков'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check',
+            action='store_true',
+            help='Только сравнить со связанными таблицами, ничего не меняя',
+        )
+
+    def handle(self, *args, **options):
+        if not options['check']:
+            reconcile_counters()
+            self.stdout.write(self.style.SUCCESS('Счётчики пересчитаны'))
+        mismatches = list(counter_mismatches())
+        for model, field, pk, stored, expected in mismatches:
+            self.stdout.write(
+                f'{model._meta.verbose_name} {pk}, {field}: '
+                f'ожидается {expected}, сохранено {stored}'
+            )
+        if mismatches:
+            raise CommandError(f'Расхождений: {len(mismatches)}')
+        self.stdout.write(self.style.SUCCESS('Расхождений нет'))
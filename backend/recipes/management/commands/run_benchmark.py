@@ -0,0 +1,197 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from api.benchmark import (LOCAL_SCENARIOS, SCENARIOS, Context, LocalContext,
+                           run_local_scenario, run_scenario)
+from recipes.synthetic import EMAIL_DOMAIN
+
+
+class Command(BaseCommand):
+    help = (
+        'Нагрузочные сценарии против запущенного сервера: p50/p95/p99 '
+        'и среднее число SQL-запросов. Данные готовит generate_data. '
+        f'Сценарии {", ".join(sorted(LOCAL_SCENARIOS))} выполняются '
+        'в процессе команды, без сервера, и откатывают изменения.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--base-url', default='http://localhost:8000')
+        parser.add_argument(
+            '--compare-url',
+            help='Второй сервер (например, с '
+                 'API_CACHE_ENABLED=False): те же сценарии запускаются '
+                 'на нём, выводится отношение rps',
+        )
+        parser.add_argument('--email', default=f'user0@{EMAIL_DOMAIN}')
+        parser.add_argument('--password', default='benchmark')
+        parser.add_argument(
+            '--scenario',
+            nargs='*',
+            choices=sorted(SCENARIOS) + sorted(LOCAL_SCENARIOS),
+            default=sorted(SCENARIOS),
+        )
+        parser.add_argument('--requests', type=int, default=100)
+        parser.add_argument(
+            '--size',
+            type=int,
+            default=1000,
+            help='Число строк в сценариях без сервера',
+        )
+        parser.add_argument('--concurrency', type=int, default=4)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument(
+            '--output',
+            help='Сохранить результаты в JSON',
+        )
+        parser.add_argument(
+            '--baseline',
+            help='JSON прошлого запуска для сравнения',
+        )
+        parser.add_argument(
+            '--max-regression',
+            type=float,
+            default=0.2,
+            help='Допустимый рост p95 относительно baseline, доля',
+        )
+
+    def get_context(self, base_url, options):
+        try:
+            return Context(
+                base_url, options['email'],
+                options['password'], options['seed'],
+            )
+        except (ValueError, OSError) as error:
+            raise CommandError(error)
+
+    def handle(self, *args, **options):
+        names = [
+            name for name in options['scenario'] if name in SCENARIOS
+        ]
+        results = {}
+        if names:
+            results.update(self.run_http(names, options))
+        local_names = [
+            name for name in options['scenario'] if name in LOCAL_SCENARIOS
+        ]
+        if local_names:
+            results.update(self.run_local(local_names, options))
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as file:
+                json.dump(results, file, ensure_ascii=False, indent=2)
+        failures = [
+            f'{name}: ошибок {result["errors"]}'
+            for name, result in results.items() if result['errors']
+        ] + [
+            f'{name} на {options["compare_url"]}: '
+            f'ошибок {result["compare"]["errors"]}'
+            for name, result in results.items()
+            if result.get('compare', {}).get('errors')
+        ]
+        if options['baseline']:
+            failures += self.compare(results, options)
+        if failures:
+            raise CommandError('\n'.join(failures))
+
+    def run_http(self, names, options):
+        context = self.get_context(options['base_url'], options)
+        compare_context = None
+        if options['compare_url']:
+            compare_context = self.get_context(options['compare_url'], options)
+        results = {}
+        self.stdout.write(
+            f'{"сценарий":<28}{"ошибки":>8}{"rps":>8}'
+            f'{"p50, мс":>10}{"p95, мс":>10}{"p99, мс":>10}{"SQL":>7}'
+        )
+        for name in names:
+            result = run_scenario(
+                SCENARIOS[name], context,
+                options['requests'], options['concurrency'],
+            )
+            results[name] = result
+            queries = result['queries']
+            self.stdout.write(
+                f'{name:<28}{result["errors"]:>8}{result["rps"]:>8.1f}'
+                f'{result["p50"] * 1000:>10.1f}'
+                f'{result["p95"] * 1000:>10.1f}'
+                f'{result["p99"] * 1000:>10.1f}'
+                f'{"-" if queries is None else f"{queries:.1f}":>7}'
+            )
+            for sample in result['error_samples']:
+                self.stdout.write(f'  ошибка: {sample}')
+            if compare_context is not None:
+                result['compare'] = self.run_compared(
+                    name, result, compare_context, options
+                )
+        return results
+
+    def run_local(self, names, options):
+        results = {}
+        self.stdout.write(
+            f'{"сценарий":<28}{"строк/с":>10}{"p50, мс":>10}'
+            f'{"p95, мс":>10}{"p99, мс":>10}{"SQL":>7}{"память, МБ":>12}'
+        )
+        with transaction.atomic():
+            try:
+                context = LocalContext(
+                    options['email'], options['seed'], options['size']
+                )
+            except ValueError as error:
+                raise CommandError(error)
+            for name in names:
+                try:
+                    result = run_local_scenario(
+                        LOCAL_SCENARIOS[name], context, options['requests']
+                    )
+                except ValueError as error:
+                    self.stdout.write(f'{name:<28}{error}')
+                    continue
+                results[name] = result
+                self.stdout.write(
+                    f'{name:<28}{result["rows_per_second"]:>10.0f}'
+                    f'{result["p50"] * 1000:>10.1f}'
+                    f'{result["p95"] * 1000:>10.1f}'
+                    f'{result["p99"] * 1000:>10.1f}'
+                    f'{result["queries"]:>7.1f}'
+                    f'{result["memory"] / 2 ** 20:>12.1f}'
+                )
+            transaction.set_rollback(True)
+        return results
+
+    def run_compared(self, name, result, context, options):
+        compared = run_scenario(
+            SCENARIOS[name], context,
+            options['requests'], options['concurrency'],
+        )
+        ratio = compared['rps'] / result['rps'] if result['rps'] else 0
+        self.stdout.write(
+            f'  {options["compare_url"]}: ошибки {compared["errors"]}, '
+            f'rps {compared["rps"]:.1f} ({ratio:.2f}x), '
+            f'p95 {compared["p95"] * 1000:.1f} мс'
+        )
+        return compared
+
+    def compare(self, results, options):
+        with open(options['baseline'], encoding='utf-8') as file:
+            baseline = json.load(file)
+        failures = []
+        for name, result in results.items():
+            previous = baseline.get(name)
+            if not previous or not previous['p95']:
+                continue
+            growth = result['p95'] / previous['p95'] - 1
+            if growth > options['max_regression']:
+                failures.append(
+                    f'{name}: p95 вырос на {growth:.0%} '
+                    f'({previous["p95"] * 1000:.1f} -> '
+                    f'{result["p95"] * 1000:.1f} мс)'
+                )
+            if (previous.get('queries') is not None
+                    and result['queries'] is not None
+                    and result['queries'] > previous['queries']):
+                failures.append(
+                    f'{name}: SQL-запросов {previous["queries"]:.1f} -> '
+                    f'{result["queries"]:.1f}'
+                )
+        return failures
@@ -1,6 +1,9 @@
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
 from django.core.validators import (MaxValueValidator, MinValueValidator,
                                     RegexValidator)
 from django.db import models
+from django.db.models import Exists, Index, OuterRef, Prefetch, Q, Value
 from django.db.models.constraints import UniqueConstraint
 
 from users.models import User
@@ -20,6 +23,12 @@ class Ingredient(models.Model):
         ordering = ['name']
         verbose_name = 'Ингредиент'
         verbose_name_plural = 'Ингредиенты'
+        constraints = [
+            UniqueConstraint(
+                fields=['name', 'measurement_unit'],
+                name='unique_ingredient_unit',
+            ),
+        ]
 
     def __str__(self):
         return f'{self.name}, {self.measurement_unit}.'
@@ -58,6 +67,63 @@ class Tag(models.Model):
         return self.name
 
 
+class RecipeQuerySet(models.QuerySet):
+    """Запросы рецептов с подгрузкой связанных данных."""
+
+    def with_related(self, user=None):
+        """Автор, теги и ингредиенты за постоянное число запросов."""
+        authors = User.objects.all()
+        if user is not None and user.is_authenticated:
+            authors = authors.annotate(is_subscribed=Exists(
+                Follow.objects.filter(user=user, author=OuterRef('pk'))
+            ))
+        else:
+            authors = authors.annotate(is_subscribed=Value(False))
+        return self.prefetch_related(
+            Prefetch('author', queryset=authors),
+            'tags',
+            Prefetch(
+                'recipe',
+                queryset=IngredientAmount.objects.select_related(
+                    'ingredient'
+                ).order_by('pk'),
+            ),
+        )
+
+    def with_user_flags(self, user=None):
+        """Флаги избранного и корзины для пользователя."""
+        if user is None or not user.is_authenticated:
+            return self.annotate(
+                is_favorited=Value(False),
+                is_in_shopping_cart=Value(False),
+            )
+        return self.annotate(
+            is_favorited=Exists(Favorite.objects.filter(
+                user=user, recipe=OuterRef('pk')
+            )),
+            is_in_shopping_cart=Exists(ShoppingCart.objects.filter(
+                user=user, recipe=OuterRef('pk')
+            )),
+        )
+
+
+class SearchVectorIndex(GinIndex):
+    """GIN-индекс поискового вектора в PostgreSQL.
+
+    В других базах вектор не заполняется, там создаётся пустой
+    частичный индекс.
+    """
+
+    def create_sql(self, model, schema_editor, using='', **kwargs):
+        if schema_editor.connection.vendor == 'postgresql':
+            return super().create_sql(model, schema_editor, using, **kwargs)
+        return Index(
+            fields=self.fields,
+            name=self.name,
+            condition=Q(**{f'{self.fields[0]}__isnull': False}),
+        ).create_sql(model, schema_editor, using, **kwargs)
+
+
 class Recipe(models.Model):
     """Модель рецептов."""
 
@@ -81,6 +147,11 @@ class Recipe(models.Model):
         blank=True,
         verbose_name='Фото рецепта'
     )
+    thumbnails = models.JSONField(
+        default=dict,
+        blank=True,
+        verbose_name='Уменьшенные копии фото',
+    )
     text = models.TextField(
         max_length=2000,
         verbose_name='Текст рецепта',
@@ -97,16 +168,78 @@ class Recipe(models.Model):
         verbose_name='Дата публикации',
         auto_now_add=True,
     )
+    favorites_count = models.PositiveIntegerField(
+        default=0,
+        verbose_name='Добавлен в избранное',
+    )
+    search_vector = SearchVectorField(
+        null=True,
+        editable=False,
+        verbose_name='Поисковый вектор',
+    )
+
+    objects = RecipeQuerySet.as_manager()
 
     class Meta:
         ordering = ['-pub_date']
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
+        indexes = [
+            models.Index(
+                fields=['-pub_date', '-id'],
+                name='recipe_pub_date_id_idx',
+            ),
+            models.Index(
+                fields=['author', '-pub_date'],
+                name='recipe_author_pub_date_idx',
+            ),
+            models.Index(
+                fields=['-favorites_count', '-pub_date'],
+                name='recipe_favorites_count_idx',
+            ),
+            SearchVectorIndex(
+                fields=['search_vector'],
+                name='recipe_search_vector_idx',
+            ),
+        ]
 
     def __str__(self):
         return f'{self.author.email}, {self.name}'
 
 
+class RecipeSearchTerm(models.Model):
+    """Обратный индекс для поиска рецептов без PostgreSQL."""
+
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='search_terms',
+    )
+    term = models.CharField(
+        max_length=64,
+        verbose_name='Основа слова',
+    )
+    weight = models.PositiveIntegerField(
+        verbose_name='Вес',
+    )
+
+    class Meta:
+        verbose_name = 'Поисковый терм'
+        verbose_name_plural = 'Поисковые термы'
+        constraints = [
+            UniqueConstraint(
+                fields=['recipe', 'term'],
+                name='unique_search_term',
+            ),
+        ]
+        indexes = [
+            models.Index(
+                fields=['term', 'recipe'],
+                name='search_term_recipe_idx',
+            ),
+        ]
+
+
 class IngredientAmount(models.Model):
     """Модель для количества ингредиентов в рецепте."""
 
@@ -134,6 +267,12 @@ class IngredientAmount(models.Model):
                 name='unique_ingredient',
             ),
         ]
+        indexes = [
+            models.Index(
+                fields=['recipe', 'ingredient', 'amount'],
+                name='ingredient_amount_recipe_idx',
+            ),
+        ]
 
 
 class Favorite(models.Model):
@@ -221,3 +360,73 @@ class Follow(models.Model):
 
     def __str__(self):
         return f'{self.user.username} - {self.author.username}'
+
+
+class FeedEntry(models.Model):
+    """Рецепт автора в ленте подписчика."""
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        verbose_name='Подписчик',
+        related_name='feed',
+    )
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        verbose_name='Рецепт',
+        related_name='feed_entries',
+    )
+    pub_date = models.DateTimeField(
+        verbose_name='Дата публикации',
+    )
+
+    class Meta:
+        verbose_name = 'Запись ленты'
+        verbose_name_plural = 'Записи лент'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'recipe'],
+                name='unique_feed_entry'
+            ),
+        ]
+        indexes = [
+            models.Index(
+                fields=['user', '-pub_date'],
+                name='feed_entry_user_pub_date_idx',
+            ),
+        ]
+
+
+class ShoppingListItem(models.Model):
+    """Суммарное количество ингредиента в списке покупок пользователя."""
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        verbose_name='Пользователь',
+        related_name='shopping_list',
+    )
+    ingredient = models.ForeignKey(
+        Ingredient,
+        on_delete=models.CASCADE,
+        verbose_name='Ингредиент',
+        related_name='shopping_list',
+    )
+    amount = models.IntegerField(
+        verbose_name='Количество',
+        default=0,
+    )
+
+    class Meta:
+        verbose_name = 'Ингредиент в списке покупок'
+        verbose_name_plural = 'Ингредиенты в списках покупок'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'ingredient'],
+                name='unique_shopping_list_item'
+            ),
+        ]
+
+    def __str__(self):
+        return f'{self.user.username} - {self.ingredient.name}'
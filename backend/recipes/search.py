@@ -0,0 +1,156 @@
+import re
+
+from django.contrib.postgres.search import (SearchQuery, SearchRank,
+                                            SearchVector)
+from django.db import connections
+from django.db.models import Count, F, OuterRef, Subquery, Sum
+
+from recipes.models import RecipeSearchTerm
+
+VOWELS = 'аеиоуыэюя'
+TOKEN = re.compile(r'[а-яa-z0-9]+')
+
+PERFECTIVE_GERUND = re.compile(
+    r'(ив|ивши|ившись|ыв|ывши|ывшись|(?<=[ая])(в|вши|вшись))$'
+)
+ADJECTIVE = re.compile(
+    r'(ее|ие|ые|ое|ими|ыми|ей|ий|ый|ой|ем|им|ым|ом|его|ого|ему|ому|их|ых|'
+    r'ую|юю|ая|яя|ою|ею)$'
+)
+PARTICIPLE = re.compile(r'(ивш|ывш|ующ|(?<=[ая])(ем|нн|вш|ющ|щ))$')
+REFLEXIVE = re.compile(r'(ся|сь)$')
+VERB = re.compile(
+    r'(ила|ыла|ена|ейте|уйте|ите|или|ыли|ей|уй|ил|ыл|им|ым|ен|ило|ыло|ено|'
+    r'ят|ует|уют|ит|ыт|ены|ить|ыть|ишь|ую|ю|'
+    r'(?<=[ая])(ла|на|ете|йте|ли|й|л|ем|н|ло|но|ет|ют|ны|ть|ешь|нно))$'
+)
+NOUN = re.compile(
+    r'(а|ев|ов|ие|ье|е|иями|ями|ами|еи|ии|и|ией|ей|ой|ий|й|иям|ям|ием|ем|'
+    r'ам|ом|о|у|ах|иях|ях|ы|ь|ию|ью|ю|ия|ья|я)$'
+)
+DERIVATIONAL = re.compile(r'(ост|ость)$')
+SUPERLATIVE = re.compile(r'(ейше|ейш)$')
+
+NAME_WEIGHT = 4
+TEXT_WEIGHT = 1
+POSTGRES_CONFIG = 'russian'
+
+
+def _region(word, start=0):
+    """Позиция после первой согласной, следующей за гласной."""
+    for position in range(start + 1, len(word)):
+        if word[position] not in VOWELS and word[position - 1] in VOWELS:
+            return position + 1
+    return len(word)
+
+
+def stem(word):
+    """Стемминг русского слова по алгоритму Snowball (Porter)."""
+    word = word.lower().replace('ё', 'е')
+    rv_start = next(
+        (i + 1 for i, letter in enumerate(word) if letter in VOWELS),
+        len(word)
+    )
+    r2_start = _region(word, _region(word))
+    prefix, rv = word[:rv_start], word[rv_start:]
+
+    match = PERFECTIVE_GERUND.search(rv)
+    if match:
+        rv = rv[:match.start()]
+    else:
+        rv = REFLEXIVE.sub('', rv, 1)
+        match = ADJECTIVE.search(rv)
+        if match:
+            rv = PARTICIPLE.sub('', rv[:match.start()], 1)
+        else:
+            match = VERB.search(rv) or NOUN.search(rv)
+            if match:
+                rv = rv[:match.start()]
+
+    if rv.endswith('и'):
+        rv = rv[:-1]
+
+    match = DERIVATIONAL.search(rv)
+    if match and rv_start + match.start() >= r2_start:
+        rv = rv[:match.start()]
+
+    if rv.endswith('нн'):
+        rv = rv[:-1]
+    else:
+        match = SUPERLATIVE.search(rv)
+        if match:
+            rv = rv[:match.start()]
+            if rv.endswith('нн'):
+                rv = rv[:-1]
+        elif rv.endswith('ь'):
+            rv = rv[:-1]
+    return prefix + rv
+
+
+def tokenize(text):
+    """Основы слов текста."""
+    return [
+        stem(token) for token in TOKEN.findall(
+            text.lower().replace('ё', 'е')
+        )
+        if len(token) > 1
+    ]
+
+
+def uses_postgres(using='default'):
+    return connections[using].vendor == 'postgresql'
+
+
+def build_search_terms(recipe):
+    """Термы обратного индекса для рецепта."""
+    weights = {}
+    for text, weight in (
+        (recipe.name, NAME_WEIGHT), (recipe.text, TEXT_WEIGHT)
+    ):
+        for term in tokenize(text):
+            term = term[:64]
+            weights[term] = weights.get(term, 0) + weight
+    return [
+        RecipeSearchTerm(recipe=recipe, term=term, weight=weight)
+        for term, weight in weights.items()
+    ]
+
+
+def index_recipe(recipe):
+    """Обновляет обратный индекс рецепта (для баз кроме PostgreSQL)."""
+    RecipeSearchTerm.objects.filter(recipe=recipe).delete()
+    RecipeSearchTerm.objects.bulk_create(build_search_terms(recipe))
+
+
+def update_search_vectors(queryset):
+    """Пересчитывает search_vector рецептов одним UPDATE (PostgreSQL)."""
+    return queryset.update(search_vector=(
+        SearchVector('name', weight='A', config=POSTGRES_CONFIG)
+        + SearchVector('text', weight='B', config=POSTGRES_CONFIG)
+    ))
+
+
+def search_recipes(queryset, query):
+    """Рецепты, содержащие все слова запроса, по убыванию релевантности."""
+    if uses_postgres(queryset.db):
+        search_query = SearchQuery(
+            query, config=POSTGRES_CONFIG, search_type='websearch'
+        )
+        return queryset.filter(search_vector=search_query).annotate(
+            search_rank=SearchRank(F('search_vector'), search_query)
+        ).order_by('-search_rank', '-pub_date')
+
+    terms = set(tokenize(query))
+    if not terms:
+        return queryset.none()
+    matches = RecipeSearchTerm.objects.filter(
+        term__in=terms
+    ).values('recipe').annotate(
+        matched=Count('term'),
+    ).filter(matched=len(terms)).values('recipe')
+    rank = RecipeSearchTerm.objects.filter(
+        recipe=OuterRef('pk'), term__in=terms
+    ).values('recipe').annotate(total=Sum('weight')).values('total')
+    return queryset.filter(pk__in=matches).annotate(
+        search_rank=Subquery(rank)
+    ).order_by('-search_rank', '-pub_date')
@@ -0,0 +1,382 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.db import connections, router, transaction
+from django.db.models import (Case, Count, F, OuterRef, Subquery, Sum,
+                              Value, When)
+from django.db.models.functions import Coalesce
+
+from recipes import feed
+from recipes.models import (Favorite, Follow, IngredientAmount, Recipe,
+                            ShoppingCart, ShoppingListItem)
+from recipes.user_state import invalidate_user_state
+from users.models import User
+
+BATCH_SIZE = 1000
+
+RELATION_TARGETS = {
+    Favorite: 'recipe_id',
+    ShoppingCart: 'recipe_id',
+    Follow: 'author_id',
+}
+
+_bulk = ContextVar('bulk_relations', default=False)
+_deleted_recipes = ContextVar('deleted_recipes', default=frozenset())
+
+
+@contextmanager
+def bulk_relations():
+    """Отключает обработку сигналов связей и состава рецептов.
+
+    Вызывающий код сам вызывает relations_added, relations_removed или
+    recipe_ingredients_changed для всего пакета.
+    """
+    token = _bulk.set(True)
+    try:
+        yield
+    finally:
+        _bulk.reset(token)
+
+
+def in_bulk():
+    return _bulk.get()
+
+
+def recipe_deletion_started(recipe_id):
+    """Состав удаляемого рецепта не вычитается из списков покупок.
+
+    Его вычитает удаление рецепта из корзин, которое Django выполняет
+    в том же каскаде.
+    """
+    _deleted_recipes.set(_deleted_recipes.get() | {recipe_id})
+
+
+def recipe_deletion_finished(recipe_id):
+    _deleted_recipes.set(_deleted_recipes.get() - {recipe_id})
+
+
+def is_recipe_deleted(recipe_id):
+    return recipe_id in _deleted_recipes.get()
+
+
+def relation_target(instance):
+    return getattr(instance, RELATION_TARGETS[type(instance)])
+
+
+# Счётчики: модель, поле счётчика, модель связи и её внешний ключ.
+COUNTERS = (
+    (Recipe, 'favorites_count', Favorite, 'recipe'),
+    (User, 'recipes_count', Recipe, 'author'),
+    (User, 'followers_count', Follow, 'author'),
+)
+
+
+def change_counter(model, field, deltas):
+    """Меняет счётчик одним UPDATE, deltas: pk -> изменение."""
+    deltas = {pk: delta for pk, delta in deltas.items() if delta}
+    if not deltas:
+        return
+    model.objects.filter(pk__in=deltas).update(**{
+        field: F(field) + Case(
+            *[When(pk=pk, then=Value(delta)) for pk, delta in deltas.items()],
+            default=Value(0),
+        )
+    })
+
+
+def relations_added(model, user_id, target_ids):
+    """Побочные эффекты добавления в избранное, корзину или подписки."""
+    invalidate_user_state(user_id)
+    if model is ShoppingCart:
+        shopping_cart_added(user_id, target_ids)
+    elif model is Favorite:
+        change_counter(
+            Recipe, 'favorites_count', dict.fromkeys(target_ids, 1)
+        )
+    elif model is Follow:
+        change_counter(User, 'followers_count', dict.fromkeys(target_ids, 1))
+        feed.authors_followed(user_id, target_ids)
+
+
+def relations_removed(model, user_id, target_ids):
+    """Побочные эффекты удаления из избранного, корзины или подписок."""
+    invalidate_user_state(user_id)
+    if model is ShoppingCart:
+        shopping_cart_removed(user_id, target_ids)
+    elif model is Favorite:
+        change_counter(
+            Recipe, 'favorites_count', dict.fromkeys(target_ids, -1)
+        )
+    elif model is Follow:
+        change_counter(
+            User, 'followers_count', dict.fromkeys(target_ids, -1)
+        )
+        feed.authors_unfollowed(user_id, target_ids)
+        feed.schedule_backfill(target_ids)
+
+
+def _relation_table(model):
+    """Соединение, таблица и столбцы пользователя и цели связи."""
+    connection = connections[router.db_for_write(model)]
+    quote = connection.ops.quote_name
+    return (
+        connection,
+        quote(model._meta.db_table),
+        quote(model._meta.get_field('user').column),
+        quote(model._meta.get_field(RELATION_TARGETS[model]).column),
+    )
+
+
+def _change_relations(model, user_id, target_ids, statement):
+    """Выполняет statement для связей, возвращает затронутые id.
+
+    Если база умеет RETURNING, все связи меняются одной командой, иначе
+    командой на каждую связь. Транзакция всегда начинается с записи,
+    поэтому в SQLite не нужно повышать блокировку чтения до записи.
+    """
+    connection, table, user_column, target_column = _relation_table(model)
+    with connection.cursor() as cursor:
+        if connection.features.can_return_rows_from_bulk_insert:
+            sql, params = statement(
+                connection, table, user_column, target_column,
+                user_id, target_ids,
+            )
+            cursor.execute(f'{sql} RETURNING {target_column}', params)
+            return [row[0] for row in cursor.fetchall()]
+        changed = []
+        for target_id in target_ids:
+            cursor.execute(*statement(
+                connection, table, user_column, target_column,
+                user_id, [target_id],
+            ))
+            if cursor.rowcount > 0:
+                changed.append(target_id)
+        return changed
+
+
+def _insert_statement(connection, table, user_column, target_column,
+                      user_id, target_ids):
+    ops = connection.ops
+    values = ', '.join(['(%s, %s)'] * len(target_ids))
+    return (
+        f'{ops.insert_statement(ignore_conflicts=True)} {table} '
+        f'({user_column}, {target_column}) VALUES {values} '
+        f'{ops.ignore_conflicts_suffix_sql(ignore_conflicts=True)}',
+        [
+            param for target_id in target_ids
+            for param in (user_id, target_id)
+        ],
+    )
+
+
+def _delete_statement(connection, table, user_column, target_column,
+                      user_id, target_ids):
+    placeholders = ', '.join(['%s'] * len(target_ids))
+    return (
+        f'DELETE FROM {table} WHERE {user_column} = %s '
+        f'AND {target_column} IN ({placeholders})',
+        [user_id, *target_ids],
+    )
+
+
+def bulk_add_relations(model, user_id, target_ids):
+    """Добавляет связи, возвращает id, которых ещё не было.
+
+    Дубликаты отсекает ограничение уникальности (INSERT ... ON CONFLICT
+    DO NOTHING и аналоги), поэтому одновременные запросы не приводят к
+    IntegrityError.
+    """
+    target_ids = list(dict.fromkeys(target_ids))
+    if not target_ids:
+        return []
+    with transaction.atomic(), bulk_relations():
+        new_ids = _change_relations(
+            model, user_id, target_ids, _insert_statement
+        )
+        relations_added(model, user_id, new_ids)
+    return new_ids
+
+
+def bulk_remove_relations(model, user_id, target_ids):
+    """Удаляет связи, возвращает id, которые были связаны."""
+    target_ids = list(dict.fromkeys(target_ids))
+    if not target_ids:
+        return []
+    with transaction.atomic(), bulk_relations():
+        removed_ids = _change_relations(
+            model, user_id, target_ids, _delete_statement
+        )
+        relations_removed(model, user_id, removed_ids)
+    return removed_ids
+
+
+def add_relation(model, user_id, target_id):
+    """Добавляет связь одной командой INSERT, True - если её не было."""
+    return bool(bulk_add_relations(model, user_id, [target_id]))
+
+
+def remove_relation(model, user_id, target_id):
+    """Удаляет связь одной командой DELETE, True - если она была."""
+    return bool(bulk_remove_relations(model, user_id, [target_id]))
+
+
+def get_ingredient_amounts(recipe_ids):
+    """Суммарное количество каждого ингредиента в рецептах."""
+    return dict(
+        IngredientAmount.objects.filter(
+            recipe_id__in=recipe_ids
+        ).values('ingredient_id').annotate(
+            total=Sum('amount')
+        ).values_list('ingredient_id', 'total').order_by()
+    )
+
+
+def change_shopping_lists(user_ids, deltas):
+    """Изменяет списки покупок пользователей на заданные количества."""
+    deltas = {
+        ingredient_id: delta
+        for ingredient_id, delta in deltas.items() if delta
+    }
+    if not user_ids or not deltas:
+        return
+    with transaction.atomic():
+        ShoppingListItem.objects.bulk_create(
+            [
+                ShoppingListItem(user_id=user_id, ingredient_id=ingredient_id)
+                for user_id in user_ids
+                for ingredient_id, delta in deltas.items() if delta > 0
+            ],
+            batch_size=BATCH_SIZE,
+            ignore_conflicts=True,
+        )
+        items = ShoppingListItem.objects.filter(
+            user_id__in=user_ids,
+            ingredient_id__in=deltas,
+        )
+        items.update(amount=F('amount') + Case(
+            *[
+                When(ingredient_id=ingredient_id, then=Value(delta))
+                for ingredient_id, delta in deltas.items()
+            ],
+            default=Value(0),
+        ))
+        items.filter(amount__lte=0).delete()
+
+
+def shopping_cart_added(user_id, recipe_ids):
+    change_shopping_lists([user_id], get_ingredient_amounts(recipe_ids))
+
+
+def shopping_cart_removed(user_id, recipe_ids):
+    change_shopping_lists([user_id], {
+        ingredient_id: -amount
+        for ingredient_id, amount
+        in get_ingredient_amounts(recipe_ids).items()
+    })
+
+
+def cart_user_ids(recipe_id):
+    """Пользователи, у которых рецепт в корзине."""
+    return list(
+        ShoppingCart.objects.filter(recipe_id=recipe_id).values_list(
+            'user_id', flat=True
+        )
+    )
+
+
+def recipe_ingredients_changed(recipe, old_amounts, new_amounts):
+    """Переносит изменение состава рецепта в списки покупок."""
+    deltas = {
+        ingredient_id: (
+            new_amounts.get(ingredient_id, 0)
+            - old_amounts.get(ingredient_id, 0)
+        )
+        for ingredient_id in set(old_amounts) | set(new_amounts)
+    }
+    if any(deltas.values()):
+        change_shopping_lists(cart_user_ids(recipe.id), deltas)
+
+
+def ingredient_amount_changed(old, new):
+    """Переносит в списки покупок изменение одной строки состава.
+
+    old и new - (recipe_id, ingredient_id, amount) до и после изменения,
+    None - строки не было или её удалили. Строку могут перенести в
+    другой рецепт, поэтому списки меняются для каждого рецепта отдельно.
+    """
+    deltas = {}
+    for row, sign in ((old, -1), (new, 1)):
+        if row is None:
+            continue
+        recipe_id, ingredient_id, amount = row
+        recipe_deltas = deltas.setdefault(recipe_id, {})
+        recipe_deltas[ingredient_id] = (
+            recipe_deltas.get(ingredient_id, 0) + sign * amount
+        )
+    for recipe_id, recipe_deltas in deltas.items():
+        change_shopping_lists(cart_user_ids(recipe_id), recipe_deltas)
+
+
+def live_shopping_list_totals():
+    """Итоги по всем корзинам: (user_id, ingredient_id) -> количество."""
+    return {
+        (row['recipe__shopping_cart__user'], row['ingredient']): row['total']
+        for row in IngredientAmount.objects.filter(
+            recipe__shopping_cart__isnull=False
+        ).values(
+            'recipe__shopping_cart__user', 'ingredient'
+        ).annotate(total=Sum('amount')).order_by().iterator()
+    }
+
+
+def stored_shopping_list_totals():
+    return {
+        (user_id, ingredient_id): amount
+        for user_id, ingredient_id, amount
+        in ShoppingListItem.objects.values_list(
+            'user_id', 'ingredient_id', 'amount'
+        ).iterator()
+    }
+
+
+@transaction.atomic
+def rebuild_shopping_lists():
+    """Пересобирает списки покупок всех пользователей по корзинам."""
+    ShoppingListItem.objects.all().delete()
+    ShoppingListItem.objects.bulk_create(
+        (
+            ShoppingListItem(
+                user_id=user_id, ingredient_id=ingredient_id, amount=amount
+            )
+            for (user_id, ingredient_id), amount
+            in live_shopping_list_totals().items()
+        ),
+        batch_size=BATCH_SIZE,
+    )
+
+
+def _counted(model, source, key):
+    return Coalesce(Subquery(
+        source.objects.filter(
+            **{key: OuterRef('pk')}
+        ).order_by().values(key).annotate(total=Count('pk')).values('total')
+    ), 0)
+
+
+def counter_mismatches():
+    """Расхождения счётчиков: (модель, поле, pk, сохранено, ожидается)."""
+    for model, field, source, key in COUNTERS:
+        rows = model.objects.annotate(
+            expected=_counted(model, source, key)
+        ).exclude(**{field: F('expected')}).values_list(
+            'pk', field, 'expected'
+        )
+        for pk, stored, expected in rows.iterator():
+            yield model, field, pk, stored, expected
+
+
+@transaction.atomic
+def reconcile_counters():
+    """Пересчитывает все счётчики по связанным таблицам."""
+    for model, field, source, key in COUNTERS:
+        model.objects.update(**{field: _counted(model, source, key)})
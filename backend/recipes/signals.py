@@ -0,0 +1,90 @@
+from django.db.models.signals import (post_delete, post_save, pre_delete,
+                                      pre_save)
+from django.dispatch import receiver
+
+from recipes import services
+from recipes.feed import schedule_fan_out
+from recipes.models import IngredientAmount, Recipe
+from recipes.search import (index_recipe, update_search_vectors,
+                            uses_postgres)
+from users.models import User
+
+
+def relation_saved(sender, instance, created, **kwargs):
+    if created and not services.in_bulk():
+        services.relations_added(
+            sender, instance.user_id, [services.relation_target(instance)]
+        )
+
+
+def relation_deleted(sender, instance, **kwargs):
+    if not services.in_bulk():
+        services.relations_removed(
+            sender, instance.user_id, [services.relation_target(instance)]
+        )
+
+
+for relation in services.RELATION_TARGETS:
+    post_save.connect(relation_saved, sender=relation)
+    pre_delete.connect(relation_deleted, sender=relation)
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_created(sender, instance, created, **kwargs):
+    if created:
+        services.change_counter(
+            User, 'recipes_count', {instance.author_id: 1}
+        )
+        schedule_fan_out(instance)
+
+
+@receiver(pre_delete, sender=Recipe)
+def recipe_deleting(sender, instance, **kwargs):
+    services.recipe_deletion_started(instance.pk)
+
+
+@receiver(post_delete, sender=Recipe)
+def recipe_deleted(sender, instance, **kwargs):
+    services.recipe_deletion_finished(instance.pk)
+    services.change_counter(User, 'recipes_count', {instance.author_id: -1})
+
+
+def amount_row(instance):
+    return instance.recipe_id, instance.ingredient_id, instance.amount
+
+
+@receiver(pre_save, sender=IngredientAmount)
+def ingredient_amount_saving(sender, instance, **kwargs):
+    """Запоминает строку до изменения: её могли поменять в админке."""
+    instance._saved_row = None
+    if instance.pk is not None and not services.in_bulk():
+        instance._saved_row = IngredientAmount.objects.filter(
+            pk=instance.pk
+        ).values_list('recipe_id', 'ingredient_id', 'amount').first()
+
+
+@receiver(post_save, sender=IngredientAmount)
+def ingredient_amount_saved(sender, instance, **kwargs):
+    if not services.in_bulk():
+        services.ingredient_amount_changed(
+            getattr(instance, '_saved_row', None), amount_row(instance)
+        )
+
+
+@receiver(post_delete, sender=IngredientAmount)
+def ingredient_amount_deleted(sender, instance, **kwargs):
+    if (not services.in_bulk()
+            and not services.is_recipe_deleted(instance.recipe_id)):
+        services.ingredient_amount_changed(amount_row(instance), None)
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_saved(sender, instance, update_fields, using, **kwargs):
+    if update_fields and not {'name', 'text'} & set(update_fields):
+        return
+    if uses_postgres(using):
+        update_search_vectors(Recipe.objects.using(using).filter(
+            pk=instance.pk
+        ))
+    else:
+        index_recipe(instance)
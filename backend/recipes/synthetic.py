@@ -0,0 +1,137 @@
+import random
+from itertools import accumulate
+
+from django.db import transaction
+
+from recipes.feed import rebuild_feeds
+from recipes.importers import (BATCH_SIZE, IngredientImporter,
+                               RecipeImporter, TagImporter, UserImporter,
+                               batched)
+from recipes.models import (Favorite, Follow, Ingredient, Recipe,
+                            ShoppingCart, Tag)
+from recipes.services import rebuild_shopping_lists, reconcile_counters
+from users.models import User
+
+WORDS = (
+    'борщ', 'суп', 'пирог', 'салат', 'каша', 'рагу', 'запеканка', 'омлет',
+    'блины', 'котлеты', 'плов', 'паста', 'соус', 'хлеб', 'торт', 'компот',
+    'куриный', 'овощной', 'домашний', 'быстрый', 'летний', 'острый',
+    'сырный', 'грибной', 'рыбный', 'сладкий', 'постный', 'праздничный',
+)
+EMAIL_DOMAIN = 'benchmark.foodgram'
+TAG_COLORS = ('#E26C2D', '#49B64E', '#8775D2', '#F2C94C', '#2D9CDB')
+
+
+class Skewed:
+    """Случайный выбор с весами по закону Ципфа: 1 / rank ** skew.
+
+    При skew = 0 выбор равномерный, чем больше skew, тем сильнее
+    популярность первых элементов.
+    """
+
+    def __init__(self, items, skew, rng):
+        self.items = list(items)
+        self.rng = rng
+        self.cum_weights = list(accumulate(
+            1 / rank ** skew for rank in range(1, len(self.items) + 1)
+        ))
+
+    def sample(self, count):
+        """До count разных элементов."""
+        count = min(count, len(self.items))
+        chosen = set()
+        for _ in range(count * 4):
+            chosen.add(self.rng.choices(
+                self.items, cum_weights=self.cum_weights
+            )[0])
+            if len(chosen) == count:
+                break
+        return chosen
+
+
+def generate_data(users=100, recipes=1000, ingredients_per_recipe=6,
+                  favorites_per_user=20, carts_per_user=5,
+                  follows_per_user=10, skew=1.0, seed=0,
+                  password='benchmark', progress=None):
+    """Заполняет базу синтетическими данными для нагрузочных тестов.
+
+    Пользователи получают почту user<N>@benchmark.foodgram и общий
+    пароль. Повторный запуск с теми же параметрами ничего не дублирует.
+    Популярность авторов и рецептов распределена по закону Ципфа с
+    показателем skew.
+    """
+    rng = random.Random(seed)
+    progress = progress or (lambda message: None)
+
+    TagImporter().run(
+        {'name': f'Тег {number}', 'color': color, 'slug': f'tag{number}'}
+        for number, color in enumerate(TAG_COLORS)
+    )
+    if not Ingredient.objects.exists():
+        IngredientImporter().run(
+            {'name': f'ингредиент {number}', 'measurement_unit': 'г'}
+            for number in range(500)
+        )
+    created = UserImporter().run(
+        {
+            'email': f'user{number}@{EMAIL_DOMAIN}',
+            'username': f'user{number}',
+            'first_name': 'Тест',
+            'last_name': f'Пользователь {number}',
+            'password': password,
+        }
+        for number in range(users)
+    )
+    progress(f'Пользователей добавлено: {created}')
+
+    authors = Skewed(
+        [f'user{number}@{EMAIL_DOMAIN}' for number in range(users)], skew, rng
+    )
+    tag_slugs = list(Tag.objects.values_list('slug', flat=True))
+    ingredient_ids = list(Ingredient.objects.values_list('id', flat=True))
+    created = RecipeImporter().run(
+        {
+            'author': authors.sample(1).pop(),
+            'name': f'{" ".join(rng.sample(WORDS, 3)).capitalize()} '
+                    f'№{number}',
+            'text': ' '.join(rng.choices(WORDS, k=30)),
+            'cooking_time': rng.randint(5, 180),
+            'tags': rng.sample(tag_slugs, rng.randint(1, 2)),
+            'ingredients': [
+                {'id': ingredient_id, 'amount': rng.randint(1, 500)}
+                for ingredient_id in rng.sample(
+                    ingredient_ids, ingredients_per_recipe
+                )
+            ],
+        }
+        for number in range(recipes)
+    )
+    progress(f'Рецептов добавлено: {created}')
+
+    user_ids = list(User.objects.filter(
+        email__endswith=f'@{EMAIL_DOMAIN}'
+    ).order_by('id').values_list('id', flat=True))
+    recipe_ids = list(Recipe.objects.filter(
+        author_id__in=user_ids
+    ).order_by('id').values_list('id', flat=True))
+    popular_recipes = Skewed(recipe_ids, skew, rng)
+    popular_authors = Skewed(user_ids, skew, rng)
+    with transaction.atomic():
+        for model, sample, count, field in (
+            (Favorite, popular_recipes, favorites_per_user, 'recipe_id'),
+            (ShoppingCart, popular_recipes, carts_per_user, 'recipe_id'),
+            (Follow, popular_authors, follows_per_user, 'author_id'),
+        ):
+            rows = (
+                model(user_id=user_id, **{field: target_id})
+                for user_id in user_ids
+                for target_id in sample.sample(count)
+                if target_id != user_id or model is not Follow
+            )
+            for batch in batched(rows, BATCH_SIZE):
+                model.objects.bulk_create(batch, ignore_conflicts=True)
+            progress(f'{model._meta.verbose_name_plural}: готово')
+        rebuild_shopping_lists()
+        reconcile_counters()
+        rebuild_feeds()
+    progress('Списки покупок, счётчики и ленты пересобраны')
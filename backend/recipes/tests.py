@@ -0,0 +1,376 @@
+import base64
+import io
+import shutil
+import tempfile
+from unittest import mock
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.test import TestCase, override_settings
+from PIL import Image
+from rest_framework.test import APIClient
+
+from recipes import feed
+from recipes.images import process_recipe_image
+from recipes.importers import ImportRowError, RecipeImporter
+from recipes.models import (FeedEntry, Follow, Ingredient, IngredientAmount,
+                            Recipe, RecipeSearchTerm, Tag)
+from recipes.search import stem, tokenize, uses_postgres
+from users.models import User
+
+
+def png(color, size=(400, 300)):
+    buffer = io.BytesIO()
+    Image.new('RGB', size, color).save(buffer, 'PNG')
+    return buffer.getvalue()
+
+
+@override_settings(
+    API_CACHE=dict(settings.API_CACHE, ENABLED=False),
+    RECIPE_IMAGES=dict(
+        settings.RECIPE_IMAGES, EXECUTOR='sync', WIDTHS=[320],
+        FORMATS=['webp'],
+    ),
+)
+class RecipeImagesTest(TestCase):
+    """Файлы оригинала и копий при обработке и замене фото."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            email='author@example.com', username='author',
+            first_name='Имя', last_name='Фамилия', password='password',
+        )
+        cls.tag = Tag.objects.create(name='Тег', color='#000000', slug='tag')
+        cls.ingredient = Ingredient.objects.create(
+            name='Мука', measurement_unit='г'
+        )
+
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        media = override_settings(MEDIA_ROOT=media_root)
+        media.enable()
+        self.addCleanup(media.disable)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def files(self, recipe):
+        recipe.refresh_from_db()
+        return [recipe.image.name] + [
+            name for files in recipe.thumbnails.values()
+            for name in files.values()
+        ]
+
+    def test_original_with_same_name(self):
+        name = default_storage.save(
+            'recipes/photo.png', ContentFile(png('red'))
+        )
+        recipe = Recipe.objects.create(
+            author=self.user, name='Пирог', image=name, text='Текст',
+            cooking_time=10,
+        )
+        process_recipe_image(recipe.id, name)
+        files = self.files(recipe)
+        self.assertNotEqual(files[0], name)
+        self.assertEqual(len(files), 2)
+        self.assertFalse(default_storage.exists(name))
+        for file_name in files:
+            self.assertTrue(default_storage.exists(file_name))
+
+    def test_replace_image(self):
+        def save(method, url, color):
+            with self.captureOnCommitCallbacks(execute=True):
+                response = getattr(self.client, method)(url, {
+                    'name': 'Пирог',
+                    'text': 'Текст',
+                    'cooking_time': 10,
+                    'tags': [self.tag.id],
+                    'ingredients': [{'id': self.ingredient.id, 'amount': 1}],
+                    'image': 'data:image/png;base64,'
+                             + base64.b64encode(png(color)).decode(),
+                }, format='json')
+            self.assertIn(response.status_code, (200, 201))
+            return Recipe.objects.get(pk=response.json()['id'])
+
+        recipe = save('post', '/api/recipes/', 'red')
+        old_files = self.files(recipe)
+        self.assertEqual(len(old_files), 2)
+        save('patch', f'/api/recipes/{recipe.id}/', 'blue')
+        new_files = self.files(recipe)
+        self.assertEqual(len(new_files), 2)
+        for file_name in old_files:
+            self.assertFalse(default_storage.exists(file_name))
+        for file_name in new_files:
+            self.assertTrue(default_storage.exists(file_name))
+
+
+class ImportersTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            email='author@example.com', username='author',
+            first_name='Имя', last_name='Фамилия', password='password',
+        )
+        Tag.objects.create(name='Тег', color='#000000', slug='tag')
+        Ingredient.objects.create(name='Мука', measurement_unit='г')
+        cls.salt = [
+            Ingredient.objects.create(name='Соль', measurement_unit=unit)
+            for unit in ('г', 'щепотка')
+        ]
+
+    def row(self, name, tags=('tag',), ingredients=({'name': 'Мука'},)):
+        return {
+            'author': self.user.email,
+            'name': name,
+            'text': 'Текст',
+            'cooking_time': 10,
+            'tags': list(tags),
+            'ingredients': [dict(item, amount=1) for item in ingredients],
+        }
+
+    def test_unknown_tag_or_ingredient(self):
+        for row, message in (
+            (self.row('Второй', tags=['missing']), 'Строка 2: нет тега'),
+            (
+                self.row('Второй', ingredients=[{'name': 'Сахар'}]),
+                'Строка 2: нет ингредиента Сахар',
+            ),
+            (
+                self.row('Второй', ingredients=[
+                    {'name': 'Мука', 'measurement_unit': 'кг'}
+                ]),
+                'Строка 2: нет ингредиента Мука (кг)',
+            ),
+            (
+                self.row('Второй', ingredients=[{'name': 'Соль'}]),
+                'Строка 2: ингредиент Соль неоднозначен, укажите '
+                'measurement_unit: г, щепотка',
+            ),
+            (
+                self.row('Второй', ingredients=[{'id': 0}]),
+                'Строка 2: нет ингредиента с id 0',
+            ),
+        ):
+            with self.subTest(message=message):
+                with self.assertRaisesMessage(ImportRowError, message):
+                    RecipeImporter().run([self.row('Первый'), row])
+                self.assertFalse(Recipe.objects.exists())
+
+    def test_ingredient_by_name_and_unit(self):
+        RecipeImporter().run([self.row('Первый', ingredients=[
+            {'name': 'Мука'},
+            {'name': 'Соль', 'measurement_unit': 'щепотка'},
+        ])])
+        recipe = Recipe.objects.get(name='Первый')
+        self.assertEqual(
+            set(IngredientAmount.objects.filter(recipe=recipe).values_list(
+                'ingredient__name', 'ingredient__measurement_unit'
+            )),
+            {('Мука', 'г'), ('Соль', 'щепотка')},
+        )
+
+
+@override_settings(API_CACHE=dict(settings.API_CACHE, ENABLED=False))
+class RecipeSearchTest(TestCase):
+    """Поиск: все слова запроса, название весит больше текста."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            email='author@example.com', username='author',
+            first_name='Имя', last_name='Фамилия', password='password',
+        )
+        Tag.objects.create(name='Тег', color='#000000', slug='tag')
+        Ingredient.objects.create(name='Мука', measurement_unit='г')
+        for name, text in (
+            ('Яблочный пирог', 'Сладкий пирог с яблоками'),
+            ('Салат с яблоком', 'Летний салат'),
+            ('Борщ', 'Суп со свёклой, к нему подают пироги'),
+        ):
+            Recipe.objects.create(
+                author=cls.user, name=name, text=text, cooking_time=10
+            )
+
+    def search(self, query):
+        response = APIClient().get('/api/recipes/', {'search': query})
+        self.assertEqual(response.status_code, 200)
+        return [recipe['name'] for recipe in response.json()['results']]
+
+    def test_stem(self):
+        for words, expected in (
+            (('пирог', 'пироги', 'пирогов', 'пирогами'), 'пирог'),
+            (('салаты', 'салатами'), 'салат'),
+            (('сладкий', 'сладкая', 'сладкие'), 'сладк'),
+            (('запечённый', 'запеченная'), 'запечен'),
+            (('варить', 'варила'), 'вар'),
+        ):
+            for word in words:
+                with self.subTest(word=word):
+                    self.assertEqual(stem(word), expected)
+
+    def test_tokenize(self):
+        self.assertEqual(
+            tokenize('Пирог с Ёлкой, и яблоками!'), ['пирог', 'елк', 'яблок']
+        )
+
+    def test_ranking(self):
+        self.assertEqual(self.search('пироги'), ['Яблочный пирог', 'Борщ'])
+        self.assertEqual(
+            self.search('яблоки'), ['Салат с яблоком', 'Яблочный пирог']
+        )
+
+    def test_all_words(self):
+        self.assertEqual(self.search('яблоко салат'), ['Салат с яблоком'])
+        self.assertEqual(self.search('яблоко борщ'), [])
+        self.assertEqual(self.search('и'), [])
+
+    def test_index_follows_changes(self):
+        recipe = Recipe.objects.get(name='Борщ')
+        recipe.name = 'Щи'
+        recipe.save()
+        self.assertEqual(self.search('борщ'), [])
+        self.assertEqual(self.search('щи'), ['Щи'])
+        recipe.cooking_time = 20
+        recipe.save(update_fields=['cooking_time'])
+        self.assertEqual(self.search('щи'), ['Щи'])
+        recipe.delete()
+        self.assertEqual(self.search('пироги'), ['Яблочный пирог'])
+
+    def test_imported_recipes(self):
+        RecipeImporter().run([{
+            'author': self.user.email,
+            'name': 'Пирог с мукой',
+            'text': 'Текст',
+            'cooking_time': 10,
+            'tags': ['tag'],
+            'ingredients': [{'name': 'Мука', 'amount': 1}],
+        }])
+        self.assertEqual(
+            self.search('пироги мука'), ['Пирог с мукой']
+        )
+
+    def test_postgres_vector(self):
+        if not uses_postgres():
+            self.skipTest('Вектор заполняется только в PostgreSQL')
+        self.assertFalse(
+            Recipe.objects.filter(search_vector__isnull=True).exists()
+        )
+        self.assertFalse(RecipeSearchTerm.objects.exists())
+
+
+@override_settings(
+    API_CACHE=dict(settings.API_CACHE, ENABLED=False),
+    FEED=dict(settings.FEED, EXECUTOR='sync', FANOUT_LIMIT=3),
+)
+class FeedTest(TestCase):
+    """Лента: рассылка ниже FANOUT_LIMIT подписчиков, чтение - выше."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = [
+            User.objects.create_user(
+                email=f'user{number}@example.com', username=f'user{number}',
+                first_name='Имя', last_name='Фамилия', password='password',
+            )
+            for number in range(6)
+        ]
+        cls.reader = cls.users[0]
+        cls.author, cls.popular = cls.users[4:]
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.reader)
+
+    def follow(self, user, author):
+        with self.captureOnCommitCallbacks(execute=True):
+            Follow.objects.create(user=user, author=author)
+
+    def unfollow(self, user, author):
+        client = APIClient()
+        client.force_authenticate(user)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = client.delete(f'/api/users/{author.id}/subscribe/')
+        self.assertEqual(response.status_code, 204)
+
+    def post(self, author, name):
+        with self.captureOnCommitCallbacks(execute=True):
+            return Recipe.objects.create(
+                author=author, name=name, text='Текст', cooking_time=10,
+            )
+
+    def feed(self, user=None):
+        client = self.client
+        if user is not None:
+            client = APIClient()
+            client.force_authenticate(user)
+        response = client.get('/api/users/feed/')
+        self.assertEqual(response.status_code, 200)
+        return [recipe['name'] for recipe in response.json()['results']]
+
+    def entries(self, author):
+        return set(FeedEntry.objects.filter(
+            recipe__author=author
+        ).values_list('user_id', 'recipe__name'))
+
+    def test_order_and_threshold(self):
+        self.follow(self.reader, self.author)
+        for user in self.users[:3]:
+            self.follow(user, self.popular)
+        self.post(self.author, 'Первый')
+        self.post(self.popular, 'Второй')
+        self.post(self.author, 'Третий')
+        self.assertEqual(self.feed(), ['Третий', 'Второй', 'Первый'])
+        self.assertEqual(
+            self.entries(self.author),
+            {(self.reader.id, 'Первый'), (self.reader.id, 'Третий')},
+        )
+        self.assertFalse(self.entries(self.popular))
+
+    def test_unfollow(self):
+        self.follow(self.reader, self.author)
+        self.follow(self.reader, self.popular)
+        self.post(self.author, 'Первый')
+        self.post(self.popular, 'Второй')
+        self.unfollow(self.reader, self.author)
+        self.assertEqual(self.feed(), ['Второй'])
+        self.assertFalse(self.entries(self.author))
+
+    def test_author_drops_below_limit(self):
+        for user in self.users[:3]:
+            self.follow(user, self.popular)
+        self.post(self.popular, 'Первый')
+        self.assertFalse(self.entries(self.popular))
+        self.unfollow(self.users[2], self.popular)
+        self.assertEqual(
+            self.entries(self.popular),
+            {(self.users[0].id, 'Первый'), (self.users[1].id, 'Первый')},
+        )
+        self.assertEqual(self.feed(), ['Первый'])
+        self.assertEqual(self.feed(self.users[2]), [])
+        self.post(self.popular, 'Второй')
+        self.assertEqual(self.feed(), ['Второй', 'Первый'])
+
+    def test_author_rises_above_limit(self):
+        for user in self.users[:2]:
+            self.follow(user, self.popular)
+        self.post(self.popular, 'Первый')
+        self.follow(self.users[2], self.popular)
+        self.post(self.popular, 'Второй')
+        for user in self.users[:3]:
+            self.assertEqual(self.feed(user), ['Второй', 'Первый'])
+
+    def test_fan_out_in_background(self):
+        self.follow(self.reader, self.author)
+        executor = mock.Mock()
+        config = dict(settings.FEED, EXECUTOR='thread')
+        with override_settings(FEED=config), mock.patch.object(
+            feed, 'get_executor', return_value=executor
+        ):
+            recipe = self.post(self.author, 'Первый')
+        executor.submit.assert_called_once_with(
+            feed._in_background, feed.fan_out, recipe.id
+        )
+        self.assertFalse(self.entries(self.author))
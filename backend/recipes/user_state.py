@@ -0,0 +1,72 @@
+from collections import namedtuple
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models import Value
+
+from recipes.models import Favorite, Follow, ShoppingCart
+
+UserState = namedtuple('UserState', ('favorites', 'cart', 'followed'))
+UserState.__doc__ = (
+    'Id избранных рецептов, рецептов в корзине и авторов в подписках.'
+)
+
+EMPTY_STATE = UserState(frozenset(), frozenset(), frozenset())
+
+
+def _cache_key(user_id):
+    return f'user_state:{user_id}'
+
+
+def load_user_state(user_id):
+    """Все три множества одним запросом."""
+    ids = (set(), set(), set())
+    rows = Favorite.objects.filter(user_id=user_id).values_list(
+        Value(0), 'recipe_id'
+    ).union(
+        ShoppingCart.objects.filter(user_id=user_id).values_list(
+            Value(1), 'recipe_id'
+        ),
+        Follow.objects.filter(user_id=user_id).values_list(
+            Value(2), 'author_id'
+        ),
+        all=True,
+    )
+    for kind, pk in rows:
+        ids[kind].add(pk)
+    return UserState(*map(frozenset, ids))
+
+
+def get_user_state(request):
+    """Состояние пользователя запроса: загружается один раз за запрос.
+
+    При USER_STATE['TIMEOUT'] > 0 состояние ещё и хранится в кэше
+    USER_STATE['ALIAS'] между запросами; для нескольких воркеров кэш
+    должен быть общим.
+    """
+    user = request.user
+    if not user.is_authenticated:
+        return EMPTY_STATE
+    state = getattr(request, '_user_state', None)
+    if state is not None:
+        return state
+    config = settings.USER_STATE
+    if config['TIMEOUT']:
+        cache = caches[config['ALIAS']]
+        state = cache.get(_cache_key(user.id))
+        if state is None:
+            state = load_user_state(user.id)
+            cache.set(_cache_key(user.id), state, config['TIMEOUT'])
+    else:
+        state = load_user_state(user.id)
+    request._user_state = state
+    return state
+
+
+def invalidate_user_state(user_id):
+    config = settings.USER_STATE
+    if config['TIMEOUT']:
+        transaction.on_commit(
+            lambda: caches[config['ALIAS']].delete(_cache_key(user_id))
+        )
@@ -11,7 +11,10 @@ class UserAdmin(admin.ModelAdmin):
         'email',
         'first_name',
         'last_name',
+        'recipes_count',
+        'followers_count',
     )
     list_filter = ('email', 'username',)
     search_fields = ('email', 'username',)
+    readonly_fields = ('recipes_count', 'followers_count',)
     empty_value_display = '-пусто-'
@@ -32,6 +32,14 @@ class User(AbstractUser):
         max_length=100,
         verbose_name='Пароль'
     )
+    recipes_count = models.PositiveIntegerField(
+        default=0,
+        verbose_name='Количество рецептов',
+    )
+    followers_count = models.PositiveIntegerField(
+        default=0,
+        verbose_name='Количество подписчиков',
+    )
 
     class Meta:
         ordering = ['username']